@@ -0,0 +1,62 @@
+"""
+Throughput de ``POST /auth/acceso`` y su efecto en el resto del tráfico.
+
+Para cada nivel de concurrencia lanza una ráfaga de accesos y, al mismo tiempo, un
+cliente que lista sus órdenes; la latencia de ese cliente muestra si los hashes
+están bloqueando al resto de las rutas. El costo se controla con ``ENTREGAS_HASH_COSTO``.
+
+Uso:
+    ENTREGAS_URL_BD=postgresql://... python -m benchmarks.acceso --hilos 1 4 16
+"""
+import argparse
+import threading
+
+import httpx
+
+from benchmarks.comun import (
+    PASSWORD,
+    crear_usuario,
+    imprimir_tabla,
+    martillar,
+    preparar_bd,
+    servidor
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hilos', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--duracion', type=float, default=5.0, help='segundos por corrida')
+    parser.add_argument('--puerto', type=int, default=8765)
+    args = parser.parse_args()
+
+    preparar_bd()
+
+    from main import app
+
+    filas = []
+    with servidor(app, puerto=args.puerto) as url:
+        with httpx.Client(base_url=url) as cliente:
+            usuario = crear_usuario(cliente)
+
+        credenciales = {'username': usuario['username'], 'password': PASSWORD}
+
+        for hilos in args.hilos:
+            accesos = {}
+            rafaga = threading.Thread(
+                target=lambda: accesos.update(
+                    martillar(url, 'POST', '/auth/acceso', None, hilos, args.duracion, json=credenciales)
+                )
+            )
+            rafaga.start()
+            lecturas = martillar(url, 'GET', '/ordenes/usuario', usuario['token'], 1, args.duracion)
+            rafaga.join()
+
+            filas.append({'hilos': hilos, 'ruta': 'POST /auth/acceso', **accesos})
+            filas.append({'hilos': hilos, 'ruta': 'GET /ordenes/usuario (en paralelo)', **lecturas})
+
+    imprimir_tabla(filas)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Arranque en frío: tiempo desde que se lanza ``uvicorn main:app`` en un proceso nuevo
+hasta el primer 200 de ``GET /openapi.json`` (importar la app y arrancar uvicorn) y
+hasta el primer 200 de ``GET /ordenes/usuario`` (además crea el engine y abre la
+primera conexión a la base de datos).
+
+Cada repetición arranca un proceso nuevo; se reportan la mediana y el máximo.
+
+Uso:
+    ENTREGAS_URL_BD=postgresql://... python -m benchmarks.arranque --repeticiones 10
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.comun import crear_usuario, encabezados, imprimir_tabla, preparar_bd, proceso_servidor
+
+ETAPAS = ('openapi_200', 'bd_200')
+
+
+def esperar_200(cliente: httpx.Client, proceso, ruta: str, limite: float, **opciones) -> float:
+    while True:
+        try:
+            if cliente.get(ruta, **opciones).status_code == 200:
+                return time.perf_counter()
+        except httpx.TransportError:
+            pass
+        if proceso.poll() is not None or time.perf_counter() > limite:
+            raise RuntimeError(f'{ruta} no respondió 200 a tiempo')
+        time.sleep(0.005)
+
+
+def arrancar(puerto: int, token: str) -> dict:
+    comando = [sys.executable, '-m', 'uvicorn', 'main:app', '--port', str(puerto), '--log-level', 'warning']
+
+    inicio = time.perf_counter()
+    proceso = subprocess.Popen(comando, env=os.environ)
+    try:
+        limite = inicio + 30
+        with httpx.Client(base_url=f'http://127.0.0.1:{puerto}', timeout=5) as cliente:
+            openapi = esperar_200(cliente, proceso, '/openapi.json', limite)
+            bd = esperar_200(cliente, proceso, '/ordenes/usuario', limite, headers=encabezados(token))
+    finally:
+        proceso.terminate()
+        proceso.wait()
+
+    return {'openapi_200': openapi - inicio, 'bd_200': bd - inicio}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--puerto', type=int, default=8765)
+    args = parser.parse_args()
+
+    preparar_bd()
+
+    # El token lo firma otro proceso; sirve mientras no expire
+    with proceso_servidor(args.puerto), httpx.Client(base_url=f'http://127.0.0.1:{args.puerto}') as cliente:
+        token = crear_usuario(cliente)['token']
+
+    corridas = [arrancar(args.puerto, token) for _ in range(args.repeticiones)]
+
+    imprimir_tabla([
+        {
+            'etapa': etapa,
+            'mediana_ms': round(statistics.median(corrida[etapa] for corrida in corridas) * 1000, 1),
+            'max_ms': round(max(corrida[etapa] for corrida in corridas) * 1000, 1)
+        }
+        for etapa in ETAPAS
+    ])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Costo de autenticar una petición: ``AuthJWT`` (``jwt_required`` + ``get_raw_jwt``, dos
+decodificaciones) contra ``VerificadorTokens`` decodificando una vez y con los claims en
+cache, con HS256 y con claves asimétricas (RS256, ES256).
+
+No toca la base de datos ni la red: mide solo la validación del header
+``Authorization`` de una petición, en microsegundos por petición (mediana de
+``--repeticiones`` corridas de ``--iteraciones`` peticiones).
+
+Uso:
+    python -m benchmarks.autenticacion --algoritmos HS256 RS256 ES256
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks.comun import imprimir_tabla
+
+
+def claves(algoritmo: str) -> tuple:
+    """(clave para firmar, clave para verificar) generadas para la corrida"""
+    if algoritmo.startswith('HS'):
+        return 'benchmark' * 4, 'benchmark' * 4
+
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec, rsa
+
+    if algoritmo.startswith('ES'):
+        privada = ec.generate_private_key(ec.SECP256R1())
+    else:
+        privada = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+    pem_privada = privada.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+    pem_publica = privada.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode()
+    return pem_privada, pem_publica
+
+
+def medir(funcion, iteraciones: int, repeticiones: int) -> float:
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        for _ in range(iteraciones):
+            funcion()
+        tiempos.append((time.perf_counter() - inicio) / iteraciones)
+    return statistics.median(tiempos) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--algoritmos', nargs='+', default=['HS256', 'RS256', 'ES256'])
+    parser.add_argument('--iteraciones', type=int, default=5000)
+    parser.add_argument('--repeticiones', type=int, default=5)
+    args = parser.parse_args()
+
+    from fastapi_jwt_auth import AuthJWT
+    from starlette.requests import Request
+    from tokens import VerificadorTokens, token_bearer
+
+    filas = []
+    for algoritmo in args.algoritmos:
+        firma, verificacion = claves(algoritmo)
+        simetrico = algoritmo.startswith('HS')
+
+        AuthJWT.load_config(lambda: [
+            ('authjwt_algorithm', algoritmo),
+            ('authjwt_secret_key', firma if simetrico else None),
+            ('authjwt_private_key', None if simetrico else firma),
+            ('authjwt_public_key', None if simetrico else verificacion)
+        ])
+        token = AuthJWT().create_access_token(subject='benchmark', user_claims={'id': 1, 'es_admin': False})
+        encabezado = f'Bearer {token}'
+        peticion = Request({'type': 'http', 'headers': [(b'authorization', encabezado.encode())]})
+
+        def authjwt():
+            autorizacion = AuthJWT(peticion)
+            autorizacion.jwt_required()
+            return autorizacion.get_raw_jwt()
+
+        sin_cache = VerificadorTokens(algoritmo, verificacion, maximo=0, ttl=900)
+        con_cache = VerificadorTokens(algoritmo, verificacion, maximo=10000, ttl=900)
+
+        rutas = {
+            'AuthJWT (2 decodificaciones)': authjwt,
+            'VerificadorTokens sin cache': lambda: sin_cache.verificar(token_bearer(encabezado)),
+            'VerificadorTokens con cache': lambda: con_cache.verificar(token_bearer(encabezado))
+        }
+
+        base = None
+        for nombre, funcion in rutas.items():
+            microsegundos = medir(funcion, args.iteraciones, args.repeticiones)
+            base = base or microsegundos
+            filas.append({
+                'algoritmo': algoritmo,
+                'ruta': nombre,
+                'us_por_peticion': round(microsegundos, 2),
+                'vs_authjwt': f'{base / microsegundos:.1f}x'
+            })
+
+    imprimir_tabla(filas)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""
+Contención al vaciar la cola de cocina con muchas estaciones reclamando a la vez.
+
+Siembra ``--ordenes`` órdenes en PROCESANDO y las vacía con ``--reclamadores`` hilos
+(32 por defecto) que reclaman ``--cantidad`` órdenes por vez hasta que no queda
+ninguna. Se corre tres veces: directo en SQL con ``FOR UPDATE`` (cada reclamador
+espera a que termine el anterior), directo en SQL con ``FOR UPDATE SKIP LOCKED`` y a
+través de ``POST /ordenes/cola/reclamar``. En cada corrida reporta órdenes por
+segundo, latencia por reclamo y órdenes reclamadas más de una vez (debe ser 0).
+
+Uso:
+    ENTREGAS_URL_BD=postgresql://.../bd_pruebas python -m benchmarks.cola --reclamadores 32
+"""
+import argparse
+import threading
+import time
+from collections import Counter
+
+import httpx
+from sqlalchemy import func, insert, select, text, update
+
+from benchmarks.comun import (
+    ORDEN_EJEMPLO,
+    crear_usuario,
+    encabezados,
+    imprimir_tabla,
+    percentil,
+    preparar_bd,
+    servidor
+)
+
+
+def sembrar(engine, ordenes: int, id_usuario: int) -> None:
+    from database.models import Estado, Orden
+
+    with engine.begin() as conexion:
+        # Lo que ya estaba en la cola se aparta (un reclamo que nunca vence) para que solo
+        # cuenten las órdenes sembradas
+        conexion.execute(
+            update(Orden)
+            .where(Orden.estado == Estado.PROCESANDO)
+            .values(reclamada_en=text("'infinity'"))
+        )
+        conexion.execute(
+            insert(Orden),
+            [{**ORDEN_EJEMPLO, 'estado': Estado.PROCESANDO, 'id_usuario': id_usuario} for _ in range(ordenes)]
+        )
+
+
+def pendientes(engine) -> int:
+    from database.models import Estado, Orden
+
+    with engine.connect() as conexion:
+        return conexion.scalar(
+            select(func.count()).where(Orden.estado == Estado.PROCESANDO, Orden.reclamada_en.is_(None))
+        )
+
+
+def vaciar(reclamar, reclamadores: int, engine) -> tuple:
+    """Corre ``reclamar()`` en varios hilos hasta vaciar la cola; regresa ids, latencias y duración"""
+    ids = []
+    latencias = []
+    candado = threading.Lock()
+
+    def trabajador():
+        propios, tiempos = [], []
+        while True:
+            inicio = time.perf_counter()
+            reclamados = reclamar()
+            tiempos.append(time.perf_counter() - inicio)
+            propios.extend(reclamados)
+            # Con FOR UPDATE sin SKIP LOCKED un reclamo puede regresar vacío aunque queden órdenes
+            if not reclamados and pendientes(engine) == 0:
+                break
+        with candado:
+            ids.extend(propios)
+            latencias.extend(tiempos)
+
+    inicio = time.perf_counter()
+    hilos = [threading.Thread(target=trabajador) for _ in range(reclamadores)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    return ids, latencias, time.perf_counter() - inicio
+
+
+def fila(modo: str, ids: list, latencias: list, duracion: float) -> dict:
+    repetidas = sum(1 for veces in Counter(ids).values() if veces > 1)
+    return {
+        'modo': modo,
+        'reclamadas': len(ids),
+        'repetidas': repetidas,
+        'ordenes_s': round(len(ids) / duracion, 1),
+        'reclamos': len(latencias),
+        'p50_ms': round(percentil(latencias, 50) * 1000, 2),
+        'p99_ms': round(percentil(latencias, 99) * 1000, 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ordenes', type=int, default=5000)
+    parser.add_argument('--reclamadores', type=int, default=32)
+    parser.add_argument('--cantidad', type=int, default=5, help='órdenes por reclamo')
+    parser.add_argument('--puerto', type=int, default=8765)
+    args = parser.parse_args()
+
+    preparar_bd()
+
+    from database.db import engine
+    from main import app
+    from routers.ordenes import sentencia_reclamo
+
+    filas = []
+    with servidor(app, puerto=args.puerto) as url:
+        with httpx.Client(base_url=url) as cliente:
+            admin = crear_usuario(cliente, es_admin=True)
+
+        with engine.connect() as conexion:
+            from database.models import Usuario
+            id_admin = conexion.scalar(select(Usuario.id).where(Usuario.username == admin['username']))
+
+        for modo, saltar in (('SQL FOR UPDATE', False), ('SQL SKIP LOCKED', True)):
+            sembrar(engine, args.ordenes, id_admin)
+
+            def reclamar(saltar=saltar):
+                with engine.begin() as conexion:
+                    return conexion.execute(
+                        sentencia_reclamo(args.cantidad, id_admin, saltar_bloqueadas=saltar)
+                    ).scalars().all()
+
+            filas.append(fila(modo, *vaciar(reclamar, args.reclamadores, engine)))
+
+        sembrar(engine, args.ordenes, id_admin)
+        local = threading.local()
+
+        def reclamar_http():
+            if not hasattr(local, 'cliente'):
+                local.cliente = httpx.Client(base_url=url, headers=encabezados(admin['token']), timeout=60)
+            respuesta = local.cliente.post('/ordenes/cola/reclamar', params={'cantidad': args.cantidad})
+            respuesta.raise_for_status()
+            return [orden['id'] for orden in respuesta.json()]
+
+        filas.append(fila('POST /ordenes/cola/reclamar', *vaciar(reclamar_http, args.reclamadores, engine)))
+
+    print(f'{args.ordenes} órdenes, {args.reclamadores} reclamadores, {args.cantidad} por reclamo')
+    imprimir_tabla(filas)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+"""
+Utilidades compartidas por los benchmarks.
+
+Los benchmarks usan la base de datos configurada en ``ENTREGAS_URL_BD`` (ver ``config.py``),
+así que conviene apuntarlos a una base de datos de pruebas y no a la de producción.
+"""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+os.environ.setdefault('JWT_KEY', 'benchmark')
+os.environ.setdefault('ENTREGAS_ECHO_SQL', 'false')
+# Los benchmarks mandan todo desde una IP y pocos usuarios; benchmarks.limites los activa
+os.environ.setdefault('ENTREGAS_LIMITES', 'false')
+
+import httpx
+import uvicorn
+
+PASSWORD = 'Bench_123'
+
+ORDEN_EJEMPLO = {
+    'cantidad': 2,
+    'guisados': 'TINGA',
+    'tipo': 'QUESADILLA'
+}
+
+
+def percentil(valores: list, p: float) -> float:
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[indice]
+
+
+def resumen(latencias: list, duracion: float, errores: int = 0) -> dict:
+    return {
+        'peticiones': len(latencias),
+        'errores': errores,
+        'rps': round(len(latencias) / duracion, 1) if duracion else 0.0,
+        'p50_ms': round(percentil(latencias, 50) * 1000, 2),
+        'p95_ms': round(percentil(latencias, 95) * 1000, 2),
+        'p99_ms': round(percentil(latencias, 99) * 1000, 2)
+    }
+
+
+def imprimir_tabla(filas: list) -> None:
+    if not filas:
+        return
+    columnas = list(filas[0].keys())
+    anchos = {c: max(len(c), *(len(str(f[c])) for f in filas)) for c in columnas}
+    print('  '.join(c.ljust(anchos[c]) for c in columnas))
+    for fila in filas:
+        print('  '.join(str(fila[c]).ljust(anchos[c]) for c in columnas))
+
+
+def preparar_bd() -> None:
+    import database
+    database.activate()
+
+
+@contextmanager
+def servidor(app, host: str = '127.0.0.1', puerto: int = 8765, **opciones):
+    """Levanta uvicorn en un hilo y regresa la URL base"""
+    config = uvicorn.Config(app, host=host, port=puerto, log_level='warning', **opciones)
+    server = uvicorn.Server(config)
+    hilo = threading.Thread(target=server.run, daemon=True)
+    hilo.start()
+
+    while not server.started:
+        time.sleep(0.05)
+
+    try:
+        yield f'http://{host}:{puerto}'
+    finally:
+        server.should_exit = True
+        hilo.join()
+
+
+@contextmanager
+def proceso_servidor(puerto: int = 8765, entorno: dict = None, argumentos: tuple = (), comando: list = None):
+    """
+    Levanta ``uvicorn main:app`` (u otro ``comando`` que escuche en ``puerto``) en otro
+    proceso con variables de entorno extra y regresa el proceso
+    """
+    env = {**os.environ, **(entorno or {})}
+    if comando is None:
+        comando = [sys.executable, '-m', 'uvicorn', 'main:app', '--port', str(puerto), '--log-level', 'warning']
+    proceso = subprocess.Popen([*comando, *argumentos], env=env)
+
+    limite = time.monotonic() + 30
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', puerto), timeout=0.5).close()
+            break
+        except OSError:
+            if proceso.poll() is not None or time.monotonic() > limite:
+                proceso.kill()
+                raise RuntimeError('El servidor no arrancó')
+            time.sleep(0.1)
+
+    try:
+        yield proceso
+    finally:
+        proceso.terminate()
+        proceso.wait()
+
+
+@contextmanager
+def servidor_externo(puerto: int = 8765, entorno: dict = None, argumentos: tuple = ()):
+    """Como ``proceso_servidor`` pero regresa la URL base"""
+    with proceso_servidor(puerto, entorno, argumentos):
+        yield f'http://127.0.0.1:{puerto}'
+
+
+def rss_kb(pid: int) -> int:
+    """Memoria residente de un proceso en KB (solo Linux)"""
+    with open(f'/proc/{pid}/status') as status:
+        for linea in status:
+            if linea.startswith('VmRSS:'):
+                return int(linea.split()[1])
+    return 0
+
+
+def encabezados(token: str = None) -> dict:
+    return {'Authorization': f'Bearer {token}'} if token else {}
+
+
+def crear_usuario(cliente: httpx.Client, es_admin: bool = False) -> dict:
+    """Registra un usuario nuevo y regresa sus credenciales junto con un access token"""
+    username = f'b{uuid.uuid4().hex[:20]}'
+    datos = {
+        'username': username,
+        'email': f'{username}@bench.com',
+        'password': PASSWORD,
+        'es_admin': es_admin
+    }
+    cliente.post('/auth/registro', json=datos).raise_for_status()
+    acceso = cliente.post('/auth/acceso', json={'username': username, 'password': PASSWORD})
+    acceso.raise_for_status()
+
+    return {**datos, 'token': acceso.json()['access']}
+
+
+def martillar(url: str, metodo: str, ruta: str, token: str, hilos: int, duracion: float, json=None) -> dict:
+    """
+    Lanza ``hilos`` clientes que repiten la misma petición durante ``duracion`` segundos
+    y regresa el resumen de throughput y latencias.
+    """
+    latencias = []
+    errores = [0]
+    candado = threading.Lock()
+    fin = time.perf_counter() + duracion
+
+    def trabajador():
+        propias = []
+        fallos = 0
+        with httpx.Client(base_url=url, headers=encabezados(token)) as cliente:
+            while time.perf_counter() < fin:
+                inicio = time.perf_counter()
+                respuesta = cliente.request(metodo, ruta, json=json)
+                propias.append(time.perf_counter() - inicio)
+                if respuesta.status_code >= 400:
+                    fallos += 1
+        with candado:
+            latencias.extend(propias)
+            errores[0] += fallos
+
+    inicio = time.perf_counter()
+    trabajadores = [threading.Thread(target=trabajador) for _ in range(hilos)]
+    for t in trabajadores:
+        t.start()
+    for t in trabajadores:
+        t.join()
+
+    return resumen(latencias, time.perf_counter() - inicio, errores[0])
+
+
+async def _martillar_async(url, metodo, ruta, token, conexiones, duracion, json):
+    latencias = []
+    errores = 0
+    limites = httpx.Limits(max_connections=conexiones, max_keepalive_connections=conexiones)
+
+    async with httpx.AsyncClient(
+        base_url=url,
+        headers=encabezados(token),
+        limits=limites,
+        timeout=60
+    ) as cliente:
+        fin = time.perf_counter() + duracion
+
+        async def trabajador():
+            nonlocal errores
+            while time.perf_counter() < fin:
+                inicio = time.perf_counter()
+                try:
+                    respuesta = await cliente.request(metodo, ruta, json=json)
+                    if respuesta.status_code >= 400:
+                        errores += 1
+                except httpx.HTTPError:
+                    errores += 1
+                latencias.append(time.perf_counter() - inicio)
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(trabajador() for _ in range(conexiones)))
+
+    return resumen(latencias, time.perf_counter() - inicio, errores)
+
+
+def martillar_async(url: str, metodo: str, ruta: str, token: str, conexiones: int, duracion: float, json=None) -> dict:
+    """Como ``martillar`` pero con ``conexiones`` clientes concurrentes en un solo event loop"""
+    return asyncio.run(_martillar_async(url, metodo, ruta, token, conexiones, duracion, json))
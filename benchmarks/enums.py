@@ -0,0 +1,117 @@
+"""
+Espacio y tiempo de carga de las órdenes con ``estado``, ``guisados`` y ``tipo`` como
+``VARCHAR`` + ``ChoiceType`` (revisión 0002) contra enums nativos (revisión 0003).
+
+Siembra ``--ordenes`` órdenes (1M por defecto), baja la base de datos a 0002 y mide
+el ancho promedio de fila, el tamaño de la tabla y de los índices y cuánto tarda en
+cargar ``--cargar`` órdenes con el ORM. Después la sube a ``head`` (midiendo cuánto
+tarda la migración) y repite las mediciones con los enums.
+
+Uso:
+    ENTREGAS_URL_BD=postgresql://.../bd_pruebas python -m benchmarks.enums --ordenes 1000000
+"""
+import argparse
+import statistics
+import time
+
+from sqlalchemy import Column, ForeignKey, Integer, select, text
+from sqlalchemy.orm import Session, declarative_base
+from sqlalchemy_utils.types import ChoiceType
+
+from benchmarks.comun import imprimir_tabla, preparar_bd
+from benchmarks.indices import SEMBRAR_USUARIOS, sembrar_ordenes
+
+BaseLegado = declarative_base()
+
+
+def opciones(clase) -> list:
+    return [(miembro.value, miembro.value.lower()) for miembro in clase]
+
+
+def modelo_legado():
+    """``Orden`` como estaba mapeada antes de 0003"""
+    from database.models import Estado, Guisado, Tipo
+
+    class OrdenChoice(BaseLegado):
+        __tablename__ = 'ordenes'
+
+        id = Column(Integer, primary_key=True)
+        cantidad = Column(Integer, nullable=False)
+        estado = Column(ChoiceType(choices=opciones(Estado)))
+        guisados = Column(ChoiceType(choices=opciones(Guisado)))
+        tipo = Column(ChoiceType(choices=opciones(Tipo)))
+        id_usuario = Column(Integer, ForeignKey('usuario.id'))
+
+    return OrdenChoice
+
+
+TAMANOS = text("""
+    SELECT
+        (SELECT avg(pg_column_size(o.*)) FROM ordenes o) AS ancho_fila,
+        pg_table_size('ordenes') AS tabla,
+        pg_relation_size('ix_ordenes_estado_id') AS indice_estado,
+        pg_indexes_size('ordenes') AS indices
+""")
+
+
+def medir(engine, etiqueta: str, modelo, cargar: int, repeticiones: int) -> dict:
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conexion:
+        conexion.execute(text('VACUUM ANALYZE ordenes'))
+        tamanos = conexion.execute(TAMANOS).one()
+
+    tiempos = []
+    for _ in range(repeticiones):
+        with Session(engine) as sesion:
+            inicio = time.perf_counter()
+            sesion.scalars(select(modelo).order_by(modelo.id).limit(cargar)).all()
+            tiempos.append(time.perf_counter() - inicio)
+
+    return {
+        'columnas': etiqueta,
+        'ancho_fila_bytes': round(float(tamanos.ancho_fila), 1),
+        'tabla_mb': round(tamanos.tabla / 2**20, 1),
+        'ix_estado_mb': round(tamanos.indice_estado / 2**20, 1),
+        'indices_mb': round(tamanos.indices / 2**20, 1),
+        f'carga_{cargar}_ms': round(statistics.median(tiempos) * 1000, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ordenes', type=int, default=1_000_000)
+    parser.add_argument('--usuarios', type=int, default=10_000)
+    parser.add_argument('--cargar', type=int, default=100_000, help='órdenes que se cargan con el ORM')
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--sin-sembrar', action='store_true', help='usa los datos que ya hay en la base de datos')
+    args = parser.parse_args()
+
+    preparar_bd()
+
+    from alembic import command
+    from database import configuracion_alembic
+    from database.db import engine
+    from database.models import Orden
+
+    if not args.sin_sembrar:
+        with engine.begin() as conexion:
+            conexion.execute(SEMBRAR_USUARIOS, {'usuarios': args.usuarios})
+            sembrar_ordenes(conexion, args.usuarios, args.ordenes)
+
+    config = configuracion_alembic()
+    config.attributes['configurar_logs'] = False
+
+    command.downgrade(config, '0002')
+    filas = [medir(engine, 'varchar + ChoiceType', modelo_legado(), args.cargar, args.repeticiones)]
+
+    inicio = time.perf_counter()
+    command.upgrade(config, 'head')
+    migracion = time.perf_counter() - inicio
+
+    filas.append(medir(engine, 'enum nativo', Orden, args.cargar, args.repeticiones))
+
+    imprimir_tabla(filas)
+    print(f'\nmigración 0002 -> head: {migracion:.1f} s')
+
+
+if __name__ == '__main__':
+    main()
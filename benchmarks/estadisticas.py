@@ -0,0 +1,167 @@
+"""
+Totales de órdenes contados en Python, con ``GROUP BY`` sobre ``ordenes`` y leídos de
+los resúmenes que mantienen los triggers de la migración 0005; y cuánto cuestan esos
+triggers al escribir.
+
+Siembra ``--ordenes`` órdenes (10M por defecto) repartidas entre ``--usuarios``
+usuarios y mide, con la mediana de ``--repeticiones`` corridas, los totales globales
+por estado, tipo y guisado y una página de ``--limite`` usuarios. Contar en Python
+(leer todas las órdenes, como hacían los reportes con ``GET /ordenes/``) se corre una
+sola vez. Después inserta ``--escrituras`` órdenes, una por transacción y en lotes de
+``--lote``, con los triggers activos y desactivados.
+
+Uso:
+    ENTREGAS_URL_BD=postgresql://.../bd_pruebas python -m benchmarks.estadisticas --ordenes 10000000
+"""
+import argparse
+import statistics
+import time
+from collections import Counter
+
+from sqlalchemy import BigInteger, cast, delete, func, insert, select, text, tuple_
+
+from benchmarks.comun import ORDEN_EJEMPLO, imprimir_tabla, preparar_bd
+from benchmarks.indices import SEMBRAR_USUARIOS, sembrar_ordenes
+
+TRIGGERS = ('resumir_ordenes_insert', 'resumir_ordenes_update', 'resumir_ordenes_delete')
+
+
+def medir(funcion, repeticiones: int) -> dict:
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return {'mediana_ms': round(statistics.median(tiempos) * 1000, 3), 'max_ms': round(max(tiempos) * 1000, 3)}
+
+
+def contar_en_python(conexion) -> dict:
+    from database.models import Orden
+
+    totales = {'estado': Counter(), 'tipo': Counter(), 'guisados': Counter()}
+    resultado = conexion.execution_options(stream_results=True).execute(
+        select(Orden.estado, Orden.tipo, Orden.guisados, Orden.cantidad)
+    )
+    for bloque in resultado.partitions(10000):
+        for estado, tipo, guisados, cantidad in bloque:
+            totales['estado'][estado] += cantidad
+            totales['tipo'][tipo] += cantidad
+            totales['guisados'][guisados] += cantidad
+    return totales
+
+
+def totales(modelo, ordenes, piezas):
+    columnas = (modelo.estado, modelo.tipo, modelo.guisados)
+    return (
+        select(*columnas, ordenes, piezas)
+        .group_by(func.grouping_sets(*columnas, tuple_()))
+    )
+
+
+def por_usuario(columna_usuario, columna_estado, ordenes, limite: int):
+    return (
+        select(columna_usuario, ordenes, *(ordenes.filter(columna_estado == estado) for estado in ('PROCESANDO', 'EN RUTA', 'ENTREGADO')))
+        .group_by(columna_usuario)
+        .order_by(columna_usuario)
+        .limit(limite)
+    )
+
+
+def escribir(engine, escrituras: int, lote: int, id_usuario: int) -> dict:
+    """Inserta órdenes una por transacción y en lotes; regresa la mediana por transacción"""
+    from database.models import Orden
+
+    orden = {**ORDEN_EJEMPLO, 'estado': 'PROCESANDO', 'id_usuario': id_usuario}
+
+    def una():
+        with engine.begin() as conexion:
+            conexion.execute(insert(Orden).values(**orden))
+
+    def varias():
+        with engine.begin() as conexion:
+            conexion.execute(insert(Orden).values([orden] * lote))
+
+    individual = medir(una, escrituras)
+    lotes = medir(varias, max(1, escrituras // lote))
+    return {'insert_ms': individual['mediana_ms'], f'lote_{lote}_ms': lotes['mediana_ms']}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ordenes', type=int, default=10_000_000)
+    parser.add_argument('--usuarios', type=int, default=100_000)
+    parser.add_argument('--limite', type=int, default=100, help='usuarios por página')
+    parser.add_argument('--repeticiones', type=int, default=20)
+    parser.add_argument('--escrituras', type=int, default=2000)
+    parser.add_argument('--lote', type=int, default=500)
+    parser.add_argument('--sin-python', action='store_true', help='no cuenta las órdenes en Python')
+    parser.add_argument('--sin-sembrar', action='store_true', help='usa los datos que ya hay en la base de datos')
+    args = parser.parse_args()
+
+    preparar_bd()
+
+    from database.db import engine
+    from database.models import Orden, ResumenOrdenes, ResumenOrdenesUsuario
+
+    if not args.sin_sembrar:
+        inicio = time.perf_counter()
+        with engine.begin() as conexion:
+            conexion.execute(SEMBRAR_USUARIOS, {'usuarios': args.usuarios})
+            sembrar_ordenes(conexion, args.usuarios, args.ordenes)
+        print(f'sembrar {args.ordenes} órdenes (con triggers): {time.perf_counter() - inicio:.1f} s')
+
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conexion:
+        conexion.execute(text('VACUUM ANALYZE ordenes'))
+        conexion.execute(text('VACUUM ANALYZE resumen_ordenes'))
+        conexion.execute(text('VACUUM ANALYZE resumen_ordenes_usuario'))
+
+    consultas = {
+        'totales: GROUP BY ordenes': totales(Orden, func.count(), func.sum(Orden.cantidad)),
+        'totales: resumen_ordenes': totales(
+            ResumenOrdenes, cast(func.sum(ResumenOrdenes.ordenes), BigInteger), cast(func.sum(ResumenOrdenes.piezas), BigInteger)
+        ),
+        'por usuario: GROUP BY ordenes': por_usuario(Orden.id_usuario, Orden.estado, func.count(), args.limite),
+        'por usuario: resumen_ordenes_usuario': por_usuario(
+            ResumenOrdenesUsuario.id_usuario, ResumenOrdenesUsuario.estado, func.sum(ResumenOrdenesUsuario.ordenes), args.limite
+        )
+    }
+
+    filas = []
+    with engine.connect() as conexion:
+        total = conexion.scalar(select(func.count()).select_from(Orden))
+
+        if not args.sin_python:
+            filas.append({'consulta': 'totales: contar en Python', **medir(lambda: contar_en_python(conexion), 1)})
+
+        for nombre, consulta in consultas.items():
+            repeticiones = args.repeticiones if 'resumen' in nombre else max(1, args.repeticiones // 10)
+            filas.append({'consulta': nombre, **medir(lambda: conexion.execute(consulta).all(), repeticiones)})
+
+    with engine.connect() as conexion:
+        id_usuario = conexion.scalar(select(func.min(Orden.id_usuario)))
+
+    escrituras = [{'triggers': 'activos', **escribir(engine, args.escrituras, args.lote, id_usuario)}]
+
+    # Sin triggers las órdenes nuevas no llegan al resumen, así que se borran antes de reactivarlos
+    with engine.begin() as conexion:
+        for trigger in TRIGGERS:
+            conexion.execute(text(f'ALTER TABLE ordenes DISABLE TRIGGER {trigger}'))
+    try:
+        with engine.connect() as conexion:
+            marca = conexion.scalar(select(func.max(Orden.id)))
+        escrituras.append({'triggers': 'desactivados', **escribir(engine, args.escrituras, args.lote, id_usuario)})
+        with engine.begin() as conexion:
+            conexion.execute(delete(Orden).where(Orden.id > marca))
+    finally:
+        with engine.begin() as conexion:
+            for trigger in TRIGGERS:
+                conexion.execute(text(f'ALTER TABLE ordenes ENABLE TRIGGER {trigger}'))
+
+    print(f'\n{total} órdenes')
+    imprimir_tabla(filas)
+    print()
+    imprimir_tabla(escrituras)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Costo y efecto de ``Idempotency-Key`` en ``POST /ordenes/`` con cada backend.
+
+Por cada backend (``memoria`` y ``postgres``) levanta dos workers de uvicorn y mide:
+
+- latencia de ``--peticiones`` órdenes seguidas sin header, con una clave nueva en
+  cada petición y repitiendo siempre la misma clave (respuesta guardada);
+- ``--duplicados`` peticiones simultáneas con la misma clave, repartidas entre los dos
+  workers, y cuántas órdenes se crearon con ellas. Debe ser 1; con ``memoria`` cada
+  worker guarda sus propias claves, así que puede haber una por worker.
+
+Uso:
+    ENTREGAS_URL_BD=postgresql://.../bd_pruebas python -m benchmarks.idempotencia --duplicados 50
+"""
+import argparse
+import asyncio
+import time
+import uuid
+from collections import Counter
+
+import httpx
+
+from benchmarks.comun import (
+    ORDEN_EJEMPLO,
+    crear_usuario,
+    encabezados,
+    imprimir_tabla,
+    preparar_bd,
+    proceso_servidor,
+    resumen
+)
+
+
+async def secuencial(cliente: httpx.AsyncClient, token: str, peticiones: int, clave) -> dict:
+    """``clave(n)`` da el Idempotency-Key de la petición n, o None para no mandarlo"""
+    latencias = []
+    errores = 0
+    inicio_total = time.perf_counter()
+    for n in range(peticiones):
+        headers = encabezados(token)
+        if clave(n) is not None:
+            headers['Idempotency-Key'] = clave(n)
+        inicio = time.perf_counter()
+        respuesta = await cliente.post('/ordenes/', json=ORDEN_EJEMPLO, headers=headers)
+        latencias.append(time.perf_counter() - inicio)
+        if respuesta.status_code != 201:
+            errores += 1
+    return resumen(latencias, time.perf_counter() - inicio_total, errores)
+
+
+async def duplicados(clientes: list, token: str, cantidad: int) -> dict:
+    headers = {**encabezados(token), 'Idempotency-Key': uuid.uuid4().hex}
+    respuestas = await asyncio.gather(*(
+        clientes[n % len(clientes)].post('/ordenes/', json=ORDEN_EJEMPLO, headers=headers)
+        for n in range(cantidad)
+    ))
+    codigos = Counter(r.status_code for r in respuestas)
+    ids = {r.json()['id'] for r in respuestas if r.status_code == 201}
+    return {
+        'codigos': dict(sorted(codigos.items())),
+        'repetidas': sum(r.headers.get('idempotent-replayed') == 'true' for r in respuestas),
+        'ordenes_creadas': len(ids)
+    }
+
+
+async def medir(puertos: list, args) -> tuple:
+    clientes = [
+        httpx.AsyncClient(base_url=f'http://127.0.0.1:{puerto}', timeout=60)
+        for puerto in puertos
+    ]
+    try:
+        with httpx.Client(base_url=f'http://127.0.0.1:{puertos[0]}') as cliente:
+            token = crear_usuario(cliente)['token']
+
+        prefijo = uuid.uuid4().hex
+        repetida = f'{prefijo}-repetida'
+        modos = {
+            'sin header': lambda n: None,
+            'clave nueva': lambda n: f'{prefijo}-{n}',
+            'clave repetida': lambda n: repetida
+        }
+        latencias = {}
+        for nombre, clave in modos.items():
+            latencias[nombre] = await secuencial(clientes[0], token, args.peticiones, clave)
+
+        return latencias, await duplicados(clientes, token, args.duplicados)
+    finally:
+        for cliente in clientes:
+            await cliente.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', nargs='+', default=['memoria', 'postgres'], choices=['memoria', 'postgres'])
+    parser.add_argument('--peticiones', type=int, default=500)
+    parser.add_argument('--duplicados', type=int, default=50)
+    parser.add_argument('--puerto', type=int, default=8765)
+    args = parser.parse_args()
+
+    preparar_bd()
+
+    filas_latencia = []
+    filas_duplicados = []
+    for backend in args.backends:
+        entorno = {'ENTREGAS_IDEMPOTENCIA_BACKEND': backend}
+        puertos = [args.puerto, args.puerto + 1]
+        with proceso_servidor(puertos[0], entorno), proceso_servidor(puertos[1], entorno):
+            latencias, resultado = asyncio.run(medir(puertos, args))
+
+        for modo, valores in latencias.items():
+            filas_latencia.append({'backend': backend, 'peticion': modo, **valores})
+        filas_duplicados.append({'backend': backend, 'simultaneas': args.duplicados, **resultado})
+
+    imprimir_tabla(filas_latencia)
+    print()
+    imprimir_tabla(filas_duplicados)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Presupuesto de tiempo de importación de la app.
+
+Corre ``python -X importtime -c "import main"`` en procesos nuevos (``--repeticiones``
+veces, se toma la mediana de cada módulo) y muestra los módulos que más tardan. Termina
+con código 1 si ``import main`` pasa de ``--presupuesto`` milisegundos o si importa
+alguno de los módulos que deben cargarse hasta usarse (drivers de la base de datos,
+``werkzeug``, ``alembic``...), así que sirve como prueba en CI.
+
+El tiempo depende de la máquina: conviene fijar el presupuesto con una corrida en el
+mismo tipo de máquina donde se va a revisar.
+
+Uso:
+    python -m benchmarks.importacion --presupuesto 800
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+from benchmarks.comun import imprimir_tabla
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+# Se importan la primera vez que se usan, nunca al importar la app
+DIFERIDOS = (
+    'psycopg2',
+    'asyncpg',
+    'sqlalchemy.ext.asyncio',
+    'alembic',
+    'werkzeug',
+    'fastapi_jwt_auth',
+    'redis',
+    'gunicorn'
+)
+
+LINEA = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def medir() -> dict:
+    """Microsegundos acumulados y profundidad de cada módulo que importa ``import main``"""
+    proceso = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import main'],
+        cwd=RAIZ,
+        env=os.environ,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+
+    modulos = {}
+    for linea in proceso.stderr.splitlines():
+        coincidencia = LINEA.match(linea)
+        if coincidencia:
+            acumulado, sangria, modulo = int(coincidencia[2]), len(coincidencia[3]), coincidencia[4]
+            modulos.setdefault(modulo, (acumulado, sangria // 2))
+    return modulos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--presupuesto', type=float, default=1000.0, help='milisegundos máximos para import main')
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help='módulos a mostrar')
+    parser.add_argument('--profundidad', type=int, default=2, help='nivel máximo de anidación a mostrar')
+    args = parser.parse_args()
+
+    tiempos = defaultdict(list)
+    profundidades = {}
+    for _ in range(args.repeticiones):
+        for modulo, (acumulado, profundidad) in medir().items():
+            tiempos[modulo].append(acumulado)
+            profundidades[modulo] = profundidad
+
+    medianas = {modulo: statistics.median(valores) / 1000 for modulo, valores in tiempos.items()}
+    total = medianas['main']
+
+    filas = [
+        {'módulo': '  ' * profundidades[modulo] + modulo, 'acumulado_ms': round(ms, 1)}
+        for modulo, ms in sorted(medianas.items(), key=lambda par: -par[1])
+        if modulo != 'main' and profundidades[modulo] <= args.profundidad
+    ][:args.top]
+    imprimir_tabla(filas)
+
+    fallas = []
+    if total > args.presupuesto:
+        fallas.append(f'import main tardó {total:.1f} ms (presupuesto {args.presupuesto:.0f} ms)')
+    fallas.extend(f'{modulo} se importa al importar la app' for modulo in DIFERIDOS if modulo in medianas)
+
+    print(f'\nimport main: {total:.1f} ms, {len(medianas)} módulos')
+    for falla in fallas:
+        print(f'FALLA: {falla}')
+
+    sys.exit(1 if fallas else 0)
+
+
+if __name__ == '__main__':
+    main()
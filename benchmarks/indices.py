@@ -0,0 +1,124 @@
+"""
+Planes de ejecución y latencias de las consultas calientes de órdenes sin y con los
+índices de la migración 0002.
+
+Siembra ``--ordenes`` órdenes (1M por defecto) repartidas entre ``--usuarios`` usuarios,
+borra los índices de ``Orden`` para medir sin ellos y los vuelve a crear para medir
+con ellos.
+
+Uso:
+    ENTREGAS_URL_BD=postgresql://.../bd_pruebas python -m benchmarks.indices --ordenes 1000000
+"""
+import argparse
+import statistics
+import time
+
+from sqlalchemy import func, select, text
+
+from benchmarks.comun import imprimir_tabla, preparar_bd
+
+SEMBRAR_USUARIOS = text("""
+    INSERT INTO usuario (username, email, password, es_admin, es_activo)
+    SELECT 'indices_' || n, 'indices_' || n || '@bench.com', '', false, true
+    FROM generate_series(1, :usuarios) AS n
+    ON CONFLICT DO NOTHING
+""")
+
+# 90% entregadas, 5% en ruta y 5% procesando, como una base de datos con historia.
+# Los textos se convierten al tipo de cada columna, sea enum (0003) o varchar.
+SEMBRAR_ORDENES = """
+    INSERT INTO ordenes (cantidad, estado, guisados, tipo, id_usuario)
+    SELECT
+        1 + (random() * 9)::int,
+        (CASE WHEN r < 0.90 THEN 'ENTREGADO' WHEN r < 0.95 THEN 'EN RUTA' ELSE 'PROCESANDO' END)::{estado},
+        ((ARRAY['TINGA', 'CARNE', 'POLLO', 'CHAMPIÑONES', 'COMBINADO'])[1 + (random() * 4)::int])::{guisados},
+        ((ARRAY['QUESADILLA', 'HUARACHE', 'SOPE'])[1 + (random() * 2)::int])::{tipo},
+        (SELECT min(id) FROM usuario WHERE username LIKE 'indices_%') + (random() * (:usuarios - 1))::int
+    FROM (SELECT random() AS r FROM generate_series(1, :ordenes)) AS s
+"""
+
+
+def sembrar_ordenes(conexion, usuarios: int, ordenes: int) -> None:
+    tipos = dict(conexion.execute(text("""
+        SELECT attname, format_type(atttypid, atttypmod) FROM pg_attribute
+        WHERE attrelid = 'ordenes'::regclass AND attname IN ('estado', 'guisados', 'tipo')
+    """)).all())
+    conexion.execute(text(SEMBRAR_ORDENES.format(**tipos)), {'usuarios': usuarios, 'ordenes': ordenes})
+
+
+def consultas(engine):
+    from database.models import Orden, Usuario
+
+    with engine.connect() as conexion:
+        id_usuario = conexion.scalar(select(func.min(Usuario.id)).where(Usuario.username.like('indices_%')))
+        cursor = conexion.scalar(select(func.max(Orden.id))) // 2
+
+    return {
+        'órdenes de un usuario': select(Orden).where(Orden.id_usuario == id_usuario).order_by(Orden.id).limit(100),
+        'órdenes de un usuario (cursor)': select(Orden).where(Orden.id_usuario == id_usuario, Orden.id > cursor).order_by(Orden.id).limit(100),
+        'cola PROCESANDO': select(Orden).where(Orden.estado == 'PROCESANDO').order_by(Orden.id).limit(50),
+        'cola EN RUTA (cursor)': select(Orden).where(Orden.estado == 'EN RUTA', Orden.id > cursor).order_by(Orden.id).limit(50)
+    }
+
+
+def medir(engine, etiqueta, repeticiones):
+    filas = []
+    with engine.connect() as conexion:
+        for nombre, consulta in consultas(engine).items():
+            compilada = consulta.compile(engine, compile_kwargs={'literal_binds': True})
+            plan = conexion.execute(text(f'EXPLAIN (ANALYZE, BUFFERS) {compilada}')).scalars().all()
+
+            tiempos = []
+            for _ in range(repeticiones):
+                inicio = time.perf_counter()
+                conexion.execute(consulta).all()
+                tiempos.append(time.perf_counter() - inicio)
+
+            print(f'\n[{etiqueta}] {nombre}')
+            print('\n'.join(f'    {linea}' for linea in plan))
+            filas.append({
+                'índices': etiqueta,
+                'consulta': nombre,
+                'mediana_ms': round(statistics.median(tiempos) * 1000, 3),
+                'max_ms': round(max(tiempos) * 1000, 3)
+            })
+    return filas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ordenes', type=int, default=1_000_000)
+    parser.add_argument('--usuarios', type=int, default=10_000)
+    parser.add_argument('--repeticiones', type=int, default=50)
+    parser.add_argument('--sin-sembrar', action='store_true', help='usa los datos que ya hay en la base de datos')
+    args = parser.parse_args()
+
+    preparar_bd()
+
+    from database.db import engine
+    from database.models import Orden
+
+    if not args.sin_sembrar:
+        with engine.begin() as conexion:
+            conexion.execute(SEMBRAR_USUARIOS, {'usuarios': args.usuarios})
+            sembrar_ordenes(conexion, args.usuarios, args.ordenes)
+
+    # Solo se tocan los índices; bajar de revisión también cambiaría el tipo de las columnas
+    for indice in Orden.__table__.indexes:
+        indice.drop(engine, checkfirst=True)
+    with engine.begin() as conexion:
+        conexion.execute(text('ANALYZE ordenes'))
+    filas = medir(engine, 'sin', args.repeticiones)
+
+    for indice in Orden.__table__.indexes:
+        indice.create(engine)
+    with engine.begin() as conexion:
+        conexion.execute(text('ANALYZE ordenes'))
+    filas += medir(engine, 'con', args.repeticiones)
+
+    print()
+    imprimir_tabla(filas)
+
+
+if __name__ == '__main__':
+    main()
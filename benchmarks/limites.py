@@ -0,0 +1,130 @@
+"""
+Qué tanto afecta un cliente abusivo al resto con y sin límite de peticiones y control
+de admisión.
+
+``--abusivos`` usuarios (1 por defecto) reparten ``--conexiones`` conexiones (200 por
+defecto) que piden ``GET /ordenes/usuario`` sin parar, con ``--ordenes`` órdenes cada
+uno para que cada petición le cueste trabajo a la base de datos. Mientras tanto otro
+usuario pide sus órdenes cada ``--intervalo`` segundos. Se corre con un worker de
+uvicorn en tres configuraciones: sin límites, solo con el límite por usuario y con
+límite y control de admisión. Se reporta cuántas peticiones abusivas se atendieron o
+rechazaron y la latencia y los errores del usuario normal.
+
+Con un abusivo basta el límite por usuario; con muchos (``--abusivos 200``) cada uno
+cabe en su límite y lo que protege al resto es el control de admisión.
+
+Uso:
+    ENTREGAS_URL_BD=postgresql://.../bd_pruebas python -m benchmarks.limites --abusivos 1
+    ENTREGAS_URL_BD=postgresql://.../bd_pruebas python -m benchmarks.limites --abusivos 200
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+
+import httpx
+
+from benchmarks.comun import (
+    ORDEN_EJEMPLO,
+    crear_usuario,
+    encabezados,
+    imprimir_tabla,
+    percentil,
+    preparar_bd,
+    proceso_servidor
+)
+
+CONFIGURACIONES = {
+    'sin límites': {'ENTREGAS_LIMITES': 'false', 'ENTREGAS_ADMISION_MAXIMO': '100000'},
+    'límite por usuario': {'ENTREGAS_LIMITES': 'true', 'ENTREGAS_ADMISION_MAXIMO': '100000'},
+    'límite y admisión': {'ENTREGAS_LIMITES': 'true'}
+}
+
+
+def sembrar(usernames: list, ordenes: int) -> None:
+    from sqlalchemy import insert, select
+    from database.db import engine
+    from database.models import Orden, Usuario
+
+    with engine.begin() as conexion:
+        ids = conexion.execute(select(Usuario.id).where(Usuario.username.in_(usernames))).scalars().all()
+        conexion.execute(
+            insert(Orden),
+            [{**ORDEN_EJEMPLO, 'id_usuario': id_usuario} for id_usuario in ids for _ in range(ordenes)]
+        )
+
+
+async def medir(url: str, abusivos: list, normal: str, args) -> dict:
+    codigos_abusivo = Counter()
+    latencias_normal = []
+    codigos_normal = Counter()
+    fin = time.perf_counter() + args.duracion
+    limites = httpx.Limits(max_connections=args.conexiones, max_keepalive_connections=args.conexiones)
+
+    async with httpx.AsyncClient(base_url=url, limits=limites, timeout=60) as cliente:
+        async def abusar(token):
+            while time.perf_counter() < fin:
+                try:
+                    respuesta = await cliente.get('/ordenes/usuario', headers=encabezados(token))
+                    codigos_abusivo[respuesta.status_code] += 1
+                except httpx.HTTPError:
+                    codigos_abusivo['error'] += 1
+
+        async def consultar():
+            async with httpx.AsyncClient(base_url=url, headers=encabezados(normal), timeout=60) as propio:
+                while time.perf_counter() < fin:
+                    inicio = time.perf_counter()
+                    try:
+                        respuesta = await propio.get('/ordenes/usuario')
+                        codigos_normal[respuesta.status_code] += 1
+                    except httpx.HTTPError:
+                        codigos_normal['error'] += 1
+                    latencias_normal.append(time.perf_counter() - inicio)
+                    await asyncio.sleep(args.intervalo)
+
+        await asyncio.gather(consultar(), *(abusar(abusivos[n % len(abusivos)]) for n in range(args.conexiones)))
+
+    return {
+        'abusivo_200': codigos_abusivo[200],
+        'abusivo_429': codigos_abusivo[429],
+        'abusivo_503': codigos_abusivo[503],
+        'normal_peticiones': sum(codigos_normal.values()),
+        'normal_errores': sum(n for codigo, n in codigos_normal.items() if codigo != 200),
+        'normal_p50_ms': round(percentil(latencias_normal, 50) * 1000, 2),
+        'normal_p95_ms': round(percentil(latencias_normal, 95) * 1000, 2),
+        'normal_max_ms': round(max(latencias_normal, default=0) * 1000, 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--conexiones', type=int, default=200)
+    parser.add_argument('--abusivos', type=int, default=1, help='usuarios entre los que se reparten las conexiones')
+    parser.add_argument('--duracion', type=float, default=10.0, help='segundos por configuración')
+    parser.add_argument('--intervalo', type=float, default=0.05, help='segundos entre peticiones del usuario normal')
+    parser.add_argument('--ordenes', type=int, default=1000, help='órdenes de cada usuario abusivo')
+    parser.add_argument('--puerto', type=int, default=8765)
+    args = parser.parse_args()
+
+    preparar_bd()
+
+    url = f'http://127.0.0.1:{args.puerto}'
+
+    # Los usuarios se registran sin límites (todos vienen de la misma IP); los tokens
+    # sirven para los tres servidores
+    with proceso_servidor(args.puerto, CONFIGURACIONES['sin límites']), httpx.Client(base_url=url) as cliente:
+        abusivos = [crear_usuario(cliente) for _ in range(args.abusivos)]
+        normal = crear_usuario(cliente)
+    sembrar([abusivo['username'] for abusivo in abusivos], args.ordenes)
+
+    filas = []
+    for nombre, entorno in CONFIGURACIONES.items():
+        with proceso_servidor(args.puerto, entorno):
+            tokens = [abusivo['token'] for abusivo in abusivos]
+            filas.append({'configuracion': nombre, **asyncio.run(medir(url, tokens, normal['token'], args))})
+
+    imprimir_tabla(filas)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Compara operar sobre N órdenes con N llamadas individuales contra una sola llamada
+al endpoint de lote: crear (``POST /ordenes/`` contra ``POST /ordenes/lote``),
+cambiar el estado (``PATCH /ordenes/{id_orden}`` contra ``PATCH /ordenes/lote``) y
+borrar (``DELETE /ordenes/{id_orden}`` contra ``DELETE /ordenes/lote``).
+
+Uso:
+    ENTREGAS_URL_BD=postgresql://... python -m benchmarks.lote --tamanos 10 100 500
+"""
+import argparse
+import time
+
+import httpx
+
+from benchmarks.comun import (
+    ORDEN_EJEMPLO,
+    crear_usuario,
+    encabezados,
+    imprimir_tabla,
+    preparar_bd,
+    servidor
+)
+
+
+def cronometrar(funcion) -> float:
+    inicio = time.perf_counter()
+    funcion()
+    return time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tamanos', type=int, nargs='+', default=[10, 100, 500])
+    parser.add_argument('--puerto', type=int, default=8765)
+    args = parser.parse_args()
+
+    preparar_bd()
+
+    from main import app
+
+    filas = []
+    with servidor(app, puerto=args.puerto) as url:
+        with httpx.Client(base_url=url) as cliente:
+            usuario = encabezados(crear_usuario(cliente)['token'])
+            admin = encabezados(crear_usuario(cliente, es_admin=True)['token'])
+
+            def sembrar(n):
+                respuesta = cliente.post('/ordenes/lote', json={'ordenes': [ORDEN_EJEMPLO] * n}, headers=usuario)
+                respuesta.raise_for_status()
+                return respuesta.json()['ids']
+
+            def llamar(metodo, ruta, headers, json=None):
+                cliente.request(metodo, ruta, json=json, headers=headers).raise_for_status()
+
+            for n in args.tamanos:
+                operaciones = {
+                    'crear': (
+                        lambda ids: [llamar('POST', '/ordenes/', usuario, ORDEN_EJEMPLO) for _ in ids],
+                        lambda ids: llamar('POST', '/ordenes/lote', usuario, {'ordenes': [ORDEN_EJEMPLO] * len(ids)})
+                    ),
+                    'cambiar estado': (
+                        lambda ids: [llamar('PATCH', f'/ordenes/{i}', admin, {'estado': 'ENTREGADO'}) for i in ids],
+                        lambda ids: llamar('PATCH', '/ordenes/lote', admin, {'ids': ids, 'cambios': {'estado': 'ENTREGADO'}})
+                    ),
+                    'borrar': (
+                        lambda ids: [llamar('DELETE', f'/ordenes/{i}', usuario) for i in ids],
+                        lambda ids: llamar('DELETE', '/ordenes/lote', usuario, {'ids': ids})
+                    )
+                }
+
+                for operacion, (individual, lote) in operaciones.items():
+                    ids = sembrar(n)
+                    segundos_individual = cronometrar(lambda: individual(ids))
+                    ids = sembrar(n)
+                    segundos_lote = cronometrar(lambda: lote(ids))
+
+                    filas.append({
+                        'operación': operacion,
+                        'órdenes': n,
+                        'individual_ms': round(segundos_individual * 1000, 1),
+                        'lote_ms': round(segundos_lote * 1000, 1),
+                        'aceleración': f'{segundos_individual / segundos_lote:.1f}x'
+                    })
+
+    imprimir_tabla(filas)
+
+
+if __name__ == '__main__':
+    main()
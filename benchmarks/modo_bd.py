@@ -0,0 +1,50 @@
+"""
+Compara requests/seg y latencias entre ``ENTREGAS_MODO_BD=sync`` y ``ENTREGAS_MODO_BD=async``.
+
+Cada modo se levanta en su propio proceso de uvicorn y se golpea con muchas conexiones
+concurrentes, por defecto 1000.
+
+Uso:
+    ENTREGAS_URL_BD=postgresql://... python -m benchmarks.modo_bd --conexiones 1000
+"""
+import argparse
+
+import httpx
+
+from benchmarks.comun import (
+    ORDEN_EJEMPLO,
+    crear_usuario,
+    imprimir_tabla,
+    martillar_async,
+    preparar_bd,
+    servidor_externo
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--conexiones', type=int, default=1000)
+    parser.add_argument('--duracion', type=float, default=10.0, help='segundos por corrida')
+    parser.add_argument('--puerto', type=int, default=8765)
+    args = parser.parse_args()
+
+    preparar_bd()
+
+    filas = []
+    for modo in ('sync', 'async'):
+        with servidor_externo(args.puerto, {'ENTREGAS_MODO_BD': modo}) as url:
+            with httpx.Client(base_url=url) as cliente:
+                token = crear_usuario(cliente)['token']
+
+            for metodo, ruta, cuerpo in (
+                ('POST', '/ordenes/', ORDEN_EJEMPLO),
+                ('GET', '/ordenes/usuario', None)
+            ):
+                resultado = martillar_async(url, metodo, ruta, token, args.conexiones, args.duracion, json=cuerpo)
+                filas.append({'modo': modo, 'ruta': f'{metodo} {ruta}', 'conexiones': args.conexiones, **resultado})
+
+    imprimir_tabla(filas)
+
+
+if __name__ == '__main__':
+    main()
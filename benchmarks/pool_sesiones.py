@@ -0,0 +1,52 @@
+"""
+Throughput de ``POST /ordenes/`` y ``GET /ordenes/usuario`` según el número de hilos cliente.
+
+Con una sola sesión global todas las peticiones compartían la misma conexión; con sesiones
+por petición el throughput debe crecer con los hilos hasta llegar a ``pool_tamano + pool_desborde``.
+
+Uso:
+    ENTREGAS_URL_BD=postgresql://... python -m benchmarks.pool_sesiones --hilos 1 2 4 8 16 32
+"""
+import argparse
+
+import httpx
+
+from benchmarks.comun import (
+    ORDEN_EJEMPLO,
+    crear_usuario,
+    imprimir_tabla,
+    martillar,
+    preparar_bd,
+    servidor
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hilos', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument('--duracion', type=float, default=5.0, help='segundos por corrida')
+    parser.add_argument('--puerto', type=int, default=8765)
+    args = parser.parse_args()
+
+    preparar_bd()
+
+    from main import app
+
+    with servidor(app, puerto=args.puerto) as url:
+        with httpx.Client(base_url=url) as cliente:
+            token = crear_usuario(cliente)['token']
+
+        filas = []
+        for metodo, ruta, cuerpo in (
+            ('POST', '/ordenes/', ORDEN_EJEMPLO),
+            ('GET', '/ordenes/usuario', None)
+        ):
+            for hilos in args.hilos:
+                resultado = martillar(url, metodo, ruta, token, hilos, args.duracion, json=cuerpo)
+                filas.append({'ruta': f'{metodo} {ruta}', 'hilos': hilos, **resultado})
+
+    imprimir_tabla(filas)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""
+Memoria al listar muchas órdenes: ``session.query(Orden).all()`` contra las lecturas
+por proyección de ``database.db`` (solo las columnas de ``OrdenBase``, ejecutadas como
+Core y sin identity map).
+
+Siembra ``--ordenes`` órdenes (100k por defecto) para un usuario nuevo y las lee de
+cada forma en un proceso nuevo, para que no se mezclen la memoria ni el cache de
+sentencias de una forma con otra. Cada forma se corre dos veces:
+
+- sin ``tracemalloc``: tiempo, bloques que quedan asignados (``sys.getallocatedblocks``)
+  y cuánto sube el pico de RSS del proceso (``VmHWM`` de ``/proc/self/status``, que a
+  diferencia de ``ru_maxrss`` no hereda el pico del proceso que lo lanzó);
+- con ``tracemalloc``: pico de memoria de Python durante la lectura y lo que queda
+  retenido mientras se conserva el resultado.
+
+Las formas ``dicts`` y ``ndjson`` incluyen convertir las filas y serializarlas con
+orjson, como lo hacen ``GET /ordenes/usuario`` y ``?formato=ndjson``.
+
+Uso:
+    ENTREGAS_URL_BD=postgresql://.../bd_pruebas python -m benchmarks.proyeccion --ordenes 100000
+"""
+import argparse
+import multiprocessing
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.comun import ORDEN_EJEMPLO, imprimir_tabla, preparar_bd
+
+FORMAS = (
+    'query(Orden).all()',
+    'select columnas (ORM)',
+    'leer_columnas',
+    'leer_columnas + dicts',
+    'transmitir_columnas ndjson'
+)
+
+
+def pico_rss() -> int:
+    """Pico de RSS del proceso en KiB (solo Linux)"""
+    with open('/proc/self/status') as estado:
+        for linea in estado:
+            if linea.startswith('VmHWM:'):
+                return int(linea.split()[1])
+    return 0
+
+
+def leer(forma: str, id_usuario: int, bloque: int):
+    """Lee las órdenes del usuario de la forma indicada y regresa lo que la ruta conservaría"""
+    import asyncio
+    import orjson
+    from sqlalchemy import select
+    from database.db import Session, SesionEnHilos, leer_columnas, transmitir_columnas
+    from database.models import Orden
+    from database.schemas import PROYECCION_ORDEN
+
+    consulta = select(*PROYECCION_ORDEN.columnas).where(Orden.id_usuario == id_usuario).order_by(Orden.id)
+
+    with Session() as sesion:
+        if forma == 'query(Orden).all()':
+            return sesion.query(Orden).filter(Orden.id_usuario == id_usuario).order_by(Orden.id).all()
+
+        if forma == 'select columnas (ORM)':
+            return sesion.execute(consulta).all()
+
+        async def proyeccion():
+            sesion_hilos = SesionEnHilos(sesion)
+
+            if forma == 'leer_columnas':
+                return await leer_columnas(sesion_hilos, consulta)
+
+            if forma == 'leer_columnas + dicts':
+                return orjson.dumps(PROYECCION_ORDEN.dicts(await leer_columnas(sesion_hilos, consulta)))
+
+            resultado = await transmitir_columnas(sesion_hilos, consulta)
+            total = 0
+            async for filas in resultado.partitions(bloque):
+                total += len(b''.join(orjson.dumps(orden) + b'\n' for orden in PROYECCION_ORDEN.dicts(filas)))
+            return total
+
+        return asyncio.run(proyeccion())
+
+
+def medir(forma: str, id_usuario: int, bloque: int, rastrear: bool) -> dict:
+    """Corre en un proceso nuevo; la base de datos se calienta con una lectura de una fila"""
+    import gc
+    import sys
+    import time
+    import tracemalloc
+    from sqlalchemy import select
+    from database.db import Session
+    from database.models import Orden
+
+    with Session() as sesion:
+        sesion.query(Orden).filter(Orden.id_usuario == id_usuario).limit(1).all()
+        sesion.execute(select(Orden.id).limit(1)).all()
+
+    gc.collect()
+    rss = pico_rss()
+    bloques = sys.getallocatedblocks()
+
+    if rastrear:
+        tracemalloc.start()
+
+    inicio = time.perf_counter()
+    resultado = leer(forma, id_usuario, bloque)
+    duracion = time.perf_counter() - inicio
+    gc.collect()
+
+    if rastrear:
+        retenido, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {'pico_mb': round(pico / 2**20, 1), 'retenido_mb': round(retenido / 2**20, 1)}
+
+    return {
+        'tiempo_ms': round(duracion * 1000, 1),
+        'bloques': sys.getallocatedblocks() - bloques,
+        'rss_pico_mib': round((pico_rss() - rss) / 1024, 1),
+        'filas': resultado if isinstance(resultado, int) else len(resultado)
+    }
+
+
+def en_proceso_nuevo(*argumentos) -> dict:
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as proceso:
+        return proceso.submit(medir, *argumentos).result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ordenes', type=int, default=100000)
+    parser.add_argument('--bloque', type=int, default=1000, help='filas por bloque en la forma ndjson')
+    args = parser.parse_args()
+
+    preparar_bd()
+
+    from sqlalchemy import delete, insert
+    from database.db import Session
+    from database.models import Orden, ResumenOrdenesUsuario, Usuario
+
+    with Session() as sesion:
+        username = f'b{uuid.uuid4().hex[:20]}'
+        id_usuario = sesion.execute(
+            insert(Usuario).values(username=username, email=f'{username}@bench.com').returning(Usuario.id)
+        ).scalar_one()
+        sesion.execute(
+            insert(Orden),
+            [{**ORDEN_EJEMPLO, 'estado': 'PROCESANDO', 'id_usuario': id_usuario} for _ in range(args.ordenes)]
+        )
+        sesion.commit()
+
+    try:
+        filas = [
+            {
+                'forma': forma,
+                **en_proceso_nuevo(forma, id_usuario, args.bloque, False),
+                **en_proceso_nuevo(forma, id_usuario, args.bloque, True)
+            }
+            for forma in FORMAS
+        ]
+    finally:
+        with Session() as sesion:
+            sesion.execute(delete(Orden).where(Orden.id_usuario == id_usuario))
+            sesion.execute(delete(ResumenOrdenesUsuario).where(ResumenOrdenesUsuario.id_usuario == id_usuario))
+            sesion.execute(delete(Usuario).where(Usuario.id == id_usuario))
+            sesion.commit()
+
+    print(f'{args.ordenes} órdenes; en ndjson "filas" son los bytes escritos')
+    imprimir_tabla(filas)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Prueba de estrés de ``POST /auth/registro``.
+
+1. Latencia de registros secuenciales con usuarios nuevos.
+2. Carreras: ``--hilos`` clientes registran al mismo tiempo el mismo username (y luego
+   el mismo email); exactamente uno debe recibir 201, el resto 400, y en la base de
+   datos debe quedar un solo usuario.
+
+Usa ``ENTREGAS_HASH_COSTO`` bajo (p. ej. 4) para que el costo del hash no domine.
+
+Uso:
+    ENTREGAS_URL_BD=postgresql://... ENTREGAS_HASH_COSTO=4 python -m benchmarks.registro
+"""
+import argparse
+import sys
+import threading
+import time
+import uuid
+
+import httpx
+from sqlalchemy import func, or_, select
+
+from benchmarks.comun import PASSWORD, imprimir_tabla, preparar_bd, resumen, servidor
+
+
+def carrera(url: str, hilos: int, campo: str) -> dict:
+    base = f'c{uuid.uuid4().hex[:16]}'
+    barrera = threading.Barrier(hilos)
+    codigos = []
+    candado = threading.Lock()
+
+    def trabajador(i):
+        # Comparten username o email según el campo de la carrera, el otro es único
+        username = base if campo == 'username' else f'{base}{i}'
+        email = f'{base}@bench.com' if campo == 'email' else f'{base}{i}@bench.com'
+        with httpx.Client(base_url=url, timeout=60) as cliente:
+            barrera.wait()
+            respuesta = cliente.post('/auth/registro', json={'username': username, 'email': email, 'password': PASSWORD})
+        with candado:
+            codigos.append(respuesta.status_code)
+
+    trabajadores = [threading.Thread(target=trabajador, args=(i,)) for i in range(hilos)]
+    for t in trabajadores:
+        t.start()
+    for t in trabajadores:
+        t.join()
+
+    from database.db import engine
+    from database.models import Usuario
+
+    with engine.connect() as conexion:
+        filas = conexion.scalar(
+            select(func.count()).select_from(Usuario).where(
+                or_(Usuario.username == base, Usuario.email == f'{base}@bench.com')
+            )
+        )
+
+    return {
+        'campo': campo,
+        'hilos': hilos,
+        '201': codigos.count(201),
+        '400': codigos.count(400),
+        'otros': len(codigos) - codigos.count(201) - codigos.count(400),
+        'filas_en_bd': filas
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--registros', type=int, default=200)
+    parser.add_argument('--hilos', type=int, default=32)
+    parser.add_argument('--puerto', type=int, default=8765)
+    args = parser.parse_args()
+
+    preparar_bd()
+
+    from main import app
+
+    with servidor(app, puerto=args.puerto) as url:
+        latencias = []
+        with httpx.Client(base_url=url) as cliente:
+            inicio_total = time.perf_counter()
+            for _ in range(args.registros):
+                username = f'r{uuid.uuid4().hex[:20]}'
+                inicio = time.perf_counter()
+                cliente.post(
+                    '/auth/registro',
+                    json={'username': username, 'email': f'{username}@bench.com', 'password': PASSWORD}
+                ).raise_for_status()
+                latencias.append(time.perf_counter() - inicio)
+
+        imprimir_tabla([{'prueba': 'registro secuencial', **resumen(latencias, time.perf_counter() - inicio_total)}])
+        print()
+
+        carreras = [carrera(url, args.hilos, 'username'), carrera(url, args.hilos, 'email')]
+
+    imprimir_tabla(carreras)
+
+    if any(c['201'] != 1 or c['filas_en_bd'] != 1 or c['otros'] for c in carreras):
+        print('\nFALLA: se registraron duplicados o hubo respuestas inesperadas')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Lecturas en réplicas: throughput y latencia de ``GET /ordenes/usuario`` y de
+``POST /ordenes/`` corriendo al mismo tiempo, sin réplicas y con las de ``--replicas``.
+
+Además cuenta las transacciones que atendió cada servidor durante la corrida
+(``pg_stat_database.xact_commit``) para mostrar cómo se repartieron las lecturas. Los
+usuarios que escriben leen de la primaria durante ``ENTREGAS_REPLICAS_VENTANA``
+segundos, así que las lecturas las hace otro usuario.
+
+Uso:
+    ENTREGAS_URL_BD=postgresql://.../bd_pruebas python -m benchmarks.replicas \\
+        --replicas postgresql://...réplica1/bd_pruebas postgresql://...réplica2/bd_pruebas
+"""
+import argparse
+import json
+import threading
+
+import httpx
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+
+from benchmarks.comun import ORDEN_EJEMPLO, crear_usuario, imprimir_tabla, martillar, preparar_bd, servidor_externo
+from config import obtener_configuracion
+
+
+def transacciones(urls: list) -> list:
+    conteos = []
+    for url in urls:
+        engine = create_engine(url, poolclass=NullPool)
+        with engine.connect() as conexion:
+            conteos.append(conexion.scalar(text(
+                'SELECT xact_commit FROM pg_stat_database WHERE datname = current_database()'
+            )))
+        engine.dispose()
+    return conteos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--replicas', nargs='+', required=True, help='URLs de las réplicas')
+    parser.add_argument('--lectores', type=int, default=16, help='hilos que leen')
+    parser.add_argument('--escritores', type=int, default=4, help='hilos que escriben')
+    parser.add_argument('--duracion', type=float, default=10.0, help='segundos por configuración')
+    parser.add_argument('--puerto', type=int, default=8765)
+    args = parser.parse_args()
+
+    preparar_bd()
+
+    urls = [obtener_configuracion().url_bd, *args.replicas]
+    filas = []
+    for nombre, replicas in (('sin réplicas', []), ('con réplicas', args.replicas)):
+        with servidor_externo(args.puerto, {'ENTREGAS_REPLICAS': json.dumps(replicas)}) as url:
+            with httpx.Client(base_url=url) as cliente:
+                lector = crear_usuario(cliente)['token']
+                escritor = crear_usuario(cliente)['token']
+
+            resultados = {}
+
+            def correr(clave, *argumentos, **opciones):
+                resultados[clave] = martillar(url, *argumentos, **opciones)
+
+            antes = transacciones(urls)
+            hilos = [
+                threading.Thread(target=correr, args=('GET /ordenes/usuario', 'GET', '/ordenes/usuario', lector, args.lectores, args.duracion)),
+                threading.Thread(target=correr, args=('POST /ordenes/', 'POST', '/ordenes/', escritor, args.escritores, args.duracion), kwargs={'json': ORDEN_EJEMPLO})
+            ]
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+            despues = transacciones(urls)
+
+            reparto = ' / '.join(str(fin - inicio) for inicio, fin in zip(antes, despues))
+            for ruta, resultado in resultados.items():
+                filas.append({'configuración': nombre, 'ruta': ruta, **resultado, 'xact primaria / réplicas': reparto})
+
+    imprimir_tabla(filas)
+
+
+if __name__ == '__main__':
+    main()
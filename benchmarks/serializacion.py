@@ -0,0 +1,94 @@
+"""
+Serialización de un listado de órdenes: ``jsonable_encoder`` sobre objetos ``Orden``
+contra columnas de ``OrdenBase`` convertidas en dicts y serializadas con orjson.
+
+Siembra ``--ordenes`` órdenes para un usuario nuevo y mide, con la mediana de
+``--repeticiones`` corridas, solo la serialización y también consulta + serialización.
+
+Uso:
+    ENTREGAS_URL_BD=postgresql://... python -m benchmarks.serializacion --ordenes 10000
+"""
+import argparse
+import statistics
+import time
+import uuid
+
+from benchmarks.comun import ORDEN_EJEMPLO, imprimir_tabla, preparar_bd
+
+
+def medir(funcion, repeticiones: int) -> float:
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return round(statistics.median(tiempos) * 1000, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ordenes', type=int, default=10000)
+    parser.add_argument('--repeticiones', type=int, default=10)
+    args = parser.parse_args()
+
+    preparar_bd()
+
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from sqlalchemy import delete, insert, select
+    from database.db import Session
+    from database.models import Orden, ResumenOrdenesUsuario, Usuario
+    from database.schemas import PROYECCION_ORDEN
+    from respuestas import RespuestaJSON
+
+    with Session() as sesion:
+        username = f'b{uuid.uuid4().hex[:20]}'
+        id_usuario = sesion.execute(
+            insert(Usuario).values(username=username, email=f'{username}@bench.com').returning(Usuario.id)
+        ).scalar_one()
+        sesion.execute(
+            insert(Orden),
+            [{**ORDEN_EJEMPLO, 'estado': 'PROCESANDO', 'id_usuario': id_usuario} for _ in range(args.ordenes)]
+        )
+        sesion.commit()
+
+        consulta_orm = select(Orden).where(Orden.id_usuario == id_usuario).order_by(Orden.id)
+        consulta_columnas = select(*PROYECCION_ORDEN.columnas).where(Orden.id_usuario == id_usuario).order_by(Orden.id)
+
+        def anterior(ordenes=None):
+            ordenes = ordenes if ordenes is not None else sesion.scalars(consulta_orm).all()
+            return JSONResponse(jsonable_encoder(ordenes)).body
+
+        def nueva(filas=None):
+            filas = filas if filas is not None else sesion.execute(consulta_columnas).all()
+            return RespuestaJSON(PROYECCION_ORDEN.dicts(filas)).body
+
+        ordenes = sesion.scalars(consulta_orm).all()
+        filas = sesion.execute(consulta_columnas).all()
+
+        filas_tabla = [
+            {
+                'ruta': 'jsonable_encoder(Orden)',
+                'serializar_ms': medir(lambda: anterior(ordenes), args.repeticiones),
+                'consulta_y_serializar_ms': medir(lambda: (sesion.expunge_all(), anterior()), args.repeticiones),
+                'bytes': len(anterior(ordenes))
+            },
+            {
+                'ruta': 'columnas + orjson',
+                'serializar_ms': medir(lambda: nueva(filas), args.repeticiones),
+                'consulta_y_serializar_ms': medir(nueva, args.repeticiones),
+                'bytes': len(nueva(filas))
+            }
+        ]
+
+        sesion.execute(delete(Orden).where(Orden.id_usuario == id_usuario))
+        sesion.execute(delete(ResumenOrdenesUsuario).where(ResumenOrdenesUsuario.id_usuario == id_usuario))
+        sesion.execute(delete(Usuario).where(Usuario.id == id_usuario))
+        sesion.commit()
+
+    print(f'{args.ordenes} órdenes, mediana de {args.repeticiones} corridas')
+    imprimir_tabla(filas_tabla)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+"""
+Suite de carga de los flujos principales de la API con comparación contra una línea base.
+
+Corre cada escenario (registro, acceso, crear orden, listados y cambio de estado)
+durante ``--duracion`` segundos con ``--conexiones`` clientes concurrentes contra la
+app en el mismo proceso (``asgi``, sin red) y contra un worker de uvicorn en otro
+proceso (``uvicorn``), y reporta requests/seg y p50/p95/p99.
+
+Antes de medir registra ``--usuarios`` usuarios y siembra ``--ordenes`` órdenes
+repartidas entre ellos. Los hashes se calculan con ``--hash-costo`` (4 por defecto)
+para que registro y acceso midan el código de la API y no bcrypt.
+
+Con ``--guardar-linea-base`` los resultados se escriben en ``--linea-base``; si no, se
+comparan contra ese archivo y el comando sale con código 1 si algún escenario tiene
+errores, pierde más de ``--tolerancia`` de requests/seg o sube su p95 en más de
+``--tolerancia``. La línea base solo vale para la máquina y los parámetros con los que
+se generó; ``benchmarks/linea_base.json`` se generó con los valores por defecto.
+
+La app usa enums, triggers y ``SKIP LOCKED`` de PostgreSQL, así que la suite necesita
+una base de datos PostgreSQL de pruebas.
+
+Uso:
+    ENTREGAS_URL_BD=postgresql://.../bd_pruebas python -m benchmarks.suite --guardar-linea-base
+    ENTREGAS_URL_BD=postgresql://.../bd_pruebas python -m benchmarks.suite
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, NamedTuple
+
+import httpx
+
+from benchmarks.comun import (
+    ORDEN_EJEMPLO,
+    PASSWORD,
+    encabezados,
+    imprimir_tabla,
+    preparar_bd,
+    proceso_servidor,
+    resumen
+)
+
+LINEA_BASE = Path(__file__).resolve().parent / 'linea_base.json'
+
+
+class Escenario(NamedTuple):
+    nombre: str
+    # (contexto, número de petición) -> (método, ruta, argumentos de httpx)
+    peticion: Callable
+    esperado: int
+
+
+def registro(contexto, n):
+    username = f"{contexto['prefijo']}r{n}"
+    return 'POST', '/auth/registro', {
+        'json': {'username': username, 'email': f'{username}@bench.com', 'password': PASSWORD}
+    }
+
+
+def acceso(contexto, n):
+    usuario = contexto['usuarios'][n % len(contexto['usuarios'])]
+    return 'POST', '/auth/acceso', {'json': {'username': usuario['username'], 'password': PASSWORD}}
+
+
+def ordenar(contexto, n):
+    usuario = contexto['usuarios'][n % len(contexto['usuarios'])]
+    return 'POST', '/ordenes/', {'json': ORDEN_EJEMPLO, 'headers': encabezados(usuario['token'])}
+
+
+def listar_propias(contexto, n):
+    usuario = contexto['usuarios'][n % len(contexto['usuarios'])]
+    return 'GET', '/ordenes/usuario', {'headers': encabezados(usuario['token'])}
+
+
+def listar_todas(contexto, n):
+    return 'GET', '/ordenes/', {'params': {'estado': 'PROCESANDO'}, 'headers': encabezados(contexto['admin'])}
+
+
+def cambiar_estado(contexto, n):
+    ids = contexto['ordenes']
+    estado = ('EN RUTA', 'ENTREGADO', 'PROCESANDO')[(n // len(ids)) % 3]
+    return 'PATCH', f'/ordenes/{ids[n % len(ids)]}', {
+        'json': {'estado': estado},
+        'headers': encabezados(contexto['admin'])
+    }
+
+
+ESCENARIOS = (
+    Escenario('POST /auth/registro', registro, 201),
+    Escenario('POST /auth/acceso', acceso, 200),
+    Escenario('POST /ordenes/', ordenar, 201),
+    Escenario('GET /ordenes/usuario', listar_propias, 200),
+    Escenario('GET /ordenes/', listar_todas, 200),
+    Escenario('PATCH /ordenes/{id_orden}', cambiar_estado, 200)
+)
+
+
+async def sembrar(cliente: httpx.AsyncClient, usuarios: int, ordenes: int) -> dict:
+    """Registra usuarios (y un administrador) por la API y les inserta órdenes directo en la base de datos"""
+    from sqlalchemy import insert, select
+    from database.db import engine
+    from database.models import Orden, Usuario
+
+    prefijo = f's{uuid.uuid4().hex[:8]}'
+
+    async def registrar(username, es_admin=False):
+        datos = {'username': username, 'email': f'{username}@bench.com', 'password': PASSWORD, 'es_admin': es_admin}
+        (await cliente.post('/auth/registro', json=datos)).raise_for_status()
+        respuesta = await cliente.post('/auth/acceso', json={'username': username, 'password': PASSWORD})
+        respuesta.raise_for_status()
+        return {'username': username, 'token': respuesta.json()['access']}
+
+    cuentas = await asyncio.gather(*(registrar(f'{prefijo}u{i}') for i in range(usuarios)))
+    admin = await registrar(f'{prefijo}admin', es_admin=True)
+
+    with engine.begin() as conexion:
+        ids_usuario = conexion.execute(
+            select(Usuario.id).where(Usuario.username.in_([c['username'] for c in cuentas]))
+        ).scalars().all()
+        ids_orden = conexion.execute(
+            insert(Orden).returning(Orden.id),
+            [{**ORDEN_EJEMPLO, 'id_usuario': ids_usuario[i % len(ids_usuario)]} for i in range(ordenes)]
+        ).scalars().all() if ordenes else []
+
+    return {'prefijo': prefijo, 'usuarios': list(cuentas), 'admin': admin['token'], 'ordenes': ids_orden}
+
+
+async def martillar(cliente: httpx.AsyncClient, escenario: Escenario, contexto: dict, conexiones: int, duracion: float) -> dict:
+    latencias = []
+    errores = 0
+    contador = itertools.count()
+    fin = time.perf_counter() + duracion
+
+    async def trabajador():
+        nonlocal errores
+        while time.perf_counter() < fin:
+            metodo, ruta, argumentos = escenario.peticion(contexto, next(contador))
+            inicio = time.perf_counter()
+            try:
+                respuesta = await cliente.request(metodo, ruta, **argumentos)
+                if respuesta.status_code != escenario.esperado:
+                    errores += 1
+            except httpx.HTTPError:
+                errores += 1
+            latencias.append(time.perf_counter() - inicio)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(trabajador() for _ in range(conexiones)))
+
+    return resumen(latencias, time.perf_counter() - inicio, errores)
+
+
+async def correr(cliente: httpx.AsyncClient, objetivo: str, escenarios: list, args) -> dict:
+    contexto = await sembrar(cliente, args.usuarios, args.ordenes)
+    resultados = {}
+    for escenario in escenarios:
+        resultados[f'{objetivo} {escenario.nombre}'] = await martillar(
+            cliente, escenario, contexto, args.conexiones, args.duracion
+        )
+    return resultados
+
+
+async def correr_asgi(escenarios: list, args) -> dict:
+    from main import app
+
+    await app.router.startup()
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://asgi', timeout=60) as cliente:
+            return await correr(cliente, 'asgi', escenarios, args)
+    finally:
+        await app.router.shutdown()
+
+
+async def correr_uvicorn(escenarios: list, args) -> dict:
+    limites = httpx.Limits(max_connections=args.conexiones, max_keepalive_connections=args.conexiones)
+    with proceso_servidor(args.puerto):
+        async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{args.puerto}', limits=limites, timeout=60) as cliente:
+            return await correr(cliente, 'uvicorn', escenarios, args)
+
+
+def comparar(resultados: dict, linea_base: dict, tolerancia: float) -> list:
+    """Regresa las regresiones de ``resultados`` respecto a ``linea_base`` como texto"""
+    regresiones = []
+    for clave, actual in resultados.items():
+        if actual['errores']:
+            regresiones.append(f"{clave}: {actual['errores']} respuestas con un código inesperado")
+
+        base = linea_base.get(clave)
+        if base is None:
+            continue
+        if actual['rps'] < base['rps'] * (1 - tolerancia):
+            regresiones.append(f"{clave}: {actual['rps']} req/s contra {base['rps']} en la línea base")
+        if actual['p95_ms'] > base['p95_ms'] * (1 + tolerancia):
+            regresiones.append(f"{clave}: p95 de {actual['p95_ms']} ms contra {base['p95_ms']} ms en la línea base")
+
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--objetivos', nargs='+', default=['asgi', 'uvicorn'], choices=['asgi', 'uvicorn'])
+    parser.add_argument('--escenarios', nargs='+', help='nombres de escenarios a correr, p. ej. "POST /ordenes/"')
+    parser.add_argument('--conexiones', type=int, default=16)
+    parser.add_argument('--duracion', type=float, default=5.0, help='segundos por escenario')
+    parser.add_argument('--usuarios', type=int, default=20)
+    parser.add_argument('--ordenes', type=int, default=10000, help='órdenes sembradas entre los usuarios')
+    parser.add_argument('--hash-costo', type=int, default=4)
+    parser.add_argument('--puerto', type=int, default=8765)
+    parser.add_argument('--linea-base', type=Path, default=LINEA_BASE)
+    parser.add_argument('--guardar-linea-base', action='store_true', help='escribe los resultados como nueva línea base')
+    parser.add_argument('--tolerancia', type=float, default=0.25, help='fracción de caída de req/s o subida de p95 permitida')
+    args = parser.parse_args()
+
+    # Antes de importar la app, para que la lea este proceso y la herede el de uvicorn
+    os.environ['ENTREGAS_HASH_COSTO'] = str(args.hash_costo)
+
+    preparar_bd()
+
+    escenarios = [e for e in ESCENARIOS if not args.escenarios or e.nombre in args.escenarios]
+    if not escenarios:
+        parser.error(f'ningún escenario se llama así; opciones: {[e.nombre for e in ESCENARIOS]}')
+
+    resultados = {}
+    for objetivo in args.objetivos:
+        correr_objetivo = correr_asgi if objetivo == 'asgi' else correr_uvicorn
+        resultados.update(asyncio.run(correr_objetivo(escenarios, args)))
+
+    imprimir_tabla([{'escenario': clave, **valores} for clave, valores in resultados.items()])
+
+    parametros = {
+        'conexiones': args.conexiones,
+        'duracion': args.duracion,
+        'usuarios': args.usuarios,
+        'ordenes': args.ordenes,
+        'hash_costo': args.hash_costo,
+        'modo_bd': os.environ.get('ENTREGAS_MODO_BD', 'sync')
+    }
+
+    if args.guardar_linea_base:
+        args.linea_base.write_text(json.dumps({
+            'parametros': parametros,
+            'maquina': {'python': platform.python_version(), 'procesador': platform.machine(), 'cpus': os.cpu_count()},
+            'resultados': resultados
+        }, indent=2, ensure_ascii=False) + '\n')
+        print(f'\nLínea base guardada en {args.linea_base}')
+        return
+
+    if not args.linea_base.exists():
+        print(f'\nNo existe {args.linea_base}; genérala con --guardar-linea-base')
+        return
+
+    linea_base = json.loads(args.linea_base.read_text())
+    if linea_base['parametros'] != parametros:
+        print(f"\nAviso: la línea base se generó con {linea_base['parametros']}, esta corrida usa {parametros}")
+
+    regresiones = comparar(resultados, linea_base['resultados'], args.tolerancia)
+    if regresiones:
+        print('\nREGRESIONES:')
+        for regresion in regresiones:
+            print(f'  - {regresion}')
+        sys.exit(1)
+
+    print(f'\nSin regresiones respecto a {args.linea_base} (tolerancia {args.tolerancia:.0%})')
+
+
+if __name__ == '__main__':
+    main()
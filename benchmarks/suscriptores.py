@@ -0,0 +1,171 @@
+"""
+Costo de mantener suscriptores inactivos en ``/ordenes/eventos`` y latencia de entrega.
+
+Primero mide en proceso cuánta memoria ocupa cada suscripción del bus (con su tarea
+esperando eventos) y cuánto tarda en despertar a todas. Después levanta un worker de
+uvicorn, abre ``--suscriptores`` conexiones SSE repartidas entre ``--usuarios``
+usuarios, reporta la memoria residente del worker por suscriptor y, con un
+administrador, cambia el estado de una orden de cada usuario para medir en cuánto
+tiempo llega el evento a cada conexión.
+
+Uso:
+    ENTREGAS_URL_BD=postgresql://... python -m benchmarks.suscriptores --suscriptores 10000 --backend memoria postgres
+"""
+import argparse
+import asyncio
+import resource
+import time
+import tracemalloc
+
+import httpx
+
+from benchmarks.comun import (
+    ORDEN_EJEMPLO,
+    crear_usuario,
+    encabezados,
+    imprimir_tabla,
+    percentil,
+    preparar_bd,
+    proceso_servidor,
+    rss_kb
+)
+
+
+async def medir_bus(suscriptores: int) -> dict:
+    from eventos import BusMemoria
+
+    bus = BusMemoria(cola_maxima=20)
+    llegadas = []
+
+    async def esperar(suscripcion):
+        await suscripcion.siguiente()
+        llegadas.append(time.perf_counter())
+
+    tracemalloc.start()
+    antes = tracemalloc.get_traced_memory()[0]
+
+    contextos = [bus.suscribir(i % 100) for i in range(suscriptores)]
+    tareas = [asyncio.ensure_future(esperar(contexto.__enter__())) for contexto in contextos]
+    await asyncio.sleep(0)
+
+    por_suscriptor = (tracemalloc.get_traced_memory()[0] - antes) / suscriptores
+    tracemalloc.stop()
+
+    inicio = time.perf_counter()
+    for id_usuario in range(100):
+        await bus.publicar(id_usuario, {'id': id_usuario, 'estado': 'EN RUTA'})
+    await asyncio.gather(*tareas)
+
+    for contexto in contextos:
+        contexto.__exit__(None, None, None)
+
+    return {
+        'prueba': 'bus en proceso',
+        'suscriptores': suscriptores,
+        'kb_por_suscriptor': round(por_suscriptor / 1024, 2),
+        'entregados': len(llegadas),
+        'p50_ms': round((percentil(llegadas, 50) - inicio) * 1000, 2),
+        'p99_ms': round((percentil(llegadas, 99) - inicio) * 1000, 2)
+    }
+
+
+async def suscribir(puerto: int, token: str, conectado: asyncio.Event, llegadas: list):
+    """Cliente SSE mínimo: un socket por suscriptor, sin el costo de un cliente HTTP completo"""
+    reader, writer = await asyncio.open_connection('127.0.0.1', puerto)
+    writer.write(
+        f'GET /ordenes/eventos HTTP/1.1\r\nHost: 127.0.0.1\r\n'
+        f'Authorization: Bearer {token}\r\nAccept: text/event-stream\r\n\r\n'.encode()
+    )
+    try:
+        await reader.readuntil(b': conectado')
+        conectado.set()
+        await reader.readuntil(b'event: estado')
+        llegadas.append(time.perf_counter())
+    finally:
+        writer.close()
+
+
+async def medir_servidor(backend: str, suscriptores: int, usuarios: int, puerto: int) -> dict:
+    entorno = {
+        'ENTREGAS_EVENTOS_BACKEND': backend,
+        'ENTREGAS_HASH_COSTO': '4',
+        'ENTREGAS_METRICAS_PETICIONES': 'false'
+    }
+
+    with proceso_servidor(puerto, entorno, ('--backlog', '4096')) as proceso:
+        url = f'http://127.0.0.1:{puerto}'
+
+        with httpx.Client(base_url=url) as cliente:
+            admin = crear_usuario(cliente, es_admin=True)
+            cuentas = [crear_usuario(cliente) for _ in range(usuarios)]
+            ordenes = [
+                cliente.post('/ordenes/', json=ORDEN_EJEMPLO, headers=encabezados(c['token'])).json()['id']
+                for c in cuentas
+            ]
+
+        rss_inicial = rss_kb(proceso.pid)
+
+        llegadas = [[] for _ in cuentas]
+        tareas = []
+        for inicio in range(0, suscriptores, 500):
+            conectados = []
+            for i in range(inicio, min(inicio + 500, suscriptores)):
+                conectado = asyncio.Event()
+                conectados.append(conectado)
+                tareas.append(asyncio.ensure_future(
+                    suscribir(puerto, cuentas[i % usuarios]['token'], conectado, llegadas[i % usuarios])
+                ))
+            await asyncio.gather(*(c.wait() for c in conectados))
+
+        await asyncio.sleep(1)
+        rss_final = rss_kb(proceso.pid)
+
+        envios = []
+        async with httpx.AsyncClient(base_url=url, headers=encabezados(admin['token'])) as cliente:
+            for id_orden in ordenes:
+                envios.append(time.perf_counter())
+                await cliente.patch(f'/ordenes/{id_orden}', json={'estado': 'EN RUTA'})
+
+        await asyncio.wait(tareas, timeout=30)
+        for tarea in tareas:
+            tarea.cancel()
+
+    latencias = [
+        llegada - envio
+        for envio, propias in zip(envios, llegadas)
+        for llegada in propias
+    ]
+
+    return {
+        'prueba': f'SSE ({backend})',
+        'suscriptores': suscriptores,
+        'kb_por_suscriptor': round((rss_final - rss_inicial) / suscriptores, 2),
+        'entregados': len(latencias),
+        'p50_ms': round(percentil(latencias, 50) * 1000, 2),
+        'p99_ms': round(percentil(latencias, 99) * 1000, 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--suscriptores', type=int, default=10000)
+    parser.add_argument('--usuarios', type=int, default=100, help='los suscriptores se reparten entre estos usuarios')
+    parser.add_argument('--backend', nargs='+', default=['memoria'], choices=['memoria', 'postgres'])
+    parser.add_argument('--puerto', type=int, default=8765)
+    args = parser.parse_args()
+
+    # Cada suscriptor es un socket en el cliente y otro en el servidor
+    _, maximo = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (maximo, maximo))
+
+    preparar_bd()
+
+    filas = [asyncio.run(medir_bus(args.suscriptores))]
+    for backend in args.backend:
+        filas.append(asyncio.run(medir_servidor(backend, args.suscriptores, args.usuarios, args.puerto)))
+
+    imprimir_tabla(filas)
+
+
+if __name__ == '__main__':
+    main()
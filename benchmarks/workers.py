@@ -0,0 +1,119 @@
+"""
+Requests/seg según el número de workers de ``python -m servidor``.
+
+Para cada valor de ``--workers`` levanta el servidor con ese número de procesos y lo
+golpea desde ``--clientes`` procesos (cada uno con ``--conexiones`` conexiones
+concurrentes, para que el generador de carga no sea el cuello de botella) con dos
+rutas: ``GET /openapi.json``, que solo usa CPU, y ``GET /ordenes/usuario``, que
+consulta la base de datos. Reporta requests/seg, p50/p99 y la aceleración respecto
+a un worker.
+
+El throughput solo puede crecer hasta el número de CPUs de la máquina (menos las que
+ocupen los clientes y PostgreSQL, si corren en la misma), y cada worker abre su
+propio pool de conexiones: ``workers * (ENTREGAS_POOL_TAMANO + ENTREGAS_POOL_DESBORDE)``
+no debe pasar de ``max_connections``.
+
+Uso:
+    ENTREGAS_URL_BD=postgresql://... python -m benchmarks.workers --workers 1 2 4 8
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import httpx
+
+from benchmarks.comun import (
+    crear_usuario,
+    encabezados,
+    imprimir_tabla,
+    preparar_bd,
+    proceso_servidor,
+    resumen
+)
+
+RUTAS = ('/openapi.json', '/ordenes/usuario')
+
+
+async def _golpear(url: str, ruta: str, token: str, conexiones: int, duracion: float) -> tuple:
+    latencias = []
+    errores = 0
+    limites = httpx.Limits(max_connections=conexiones, max_keepalive_connections=conexiones)
+
+    async with httpx.AsyncClient(base_url=url, headers=encabezados(token), limits=limites, timeout=60) as cliente:
+        fin = time.perf_counter() + duracion
+
+        async def trabajador():
+            nonlocal errores
+            while time.perf_counter() < fin:
+                inicio = time.perf_counter()
+                try:
+                    if (await cliente.get(ruta)).status_code != 200:
+                        errores += 1
+                except httpx.HTTPError:
+                    errores += 1
+                latencias.append(time.perf_counter() - inicio)
+
+        await asyncio.gather(*(trabajador() for _ in range(conexiones)))
+
+    return latencias, errores
+
+
+def golpear(*argumentos) -> tuple:
+    """Corre en un proceso cliente; regresa latencias y errores"""
+    return asyncio.run(_golpear(*argumentos))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument('--clientes', type=int, default=2, help='procesos que generan carga')
+    parser.add_argument('--conexiones', type=int, default=32, help='conexiones por proceso cliente')
+    parser.add_argument('--duracion', type=float, default=10.0, help='segundos por corrida')
+    parser.add_argument('--puerto', type=int, default=8765)
+    args = parser.parse_args()
+
+    preparar_bd()
+
+    url = f'http://127.0.0.1:{args.puerto}'
+    comando = [sys.executable, '-m', 'servidor']
+    entorno = {'ENTREGAS_SERVIDOR_PUERTO': str(args.puerto)}
+
+    filas = []
+    base = {}
+    with ProcessPoolExecutor(args.clientes) as clientes:
+        for workers in args.workers:
+            with proceso_servidor(args.puerto, {**entorno, 'ENTREGAS_SERVIDOR_WORKERS': str(workers)}, comando=comando):
+                # El socket ya escucha, pero los workers pueden seguir importando la app
+                time.sleep(2)
+                with httpx.Client(base_url=url) as cliente:
+                    token = crear_usuario(cliente)['token']
+
+                for ruta in RUTAS:
+                    inicio = time.perf_counter()
+                    resultados = list(clientes.map(
+                        golpear,
+                        *zip(*[(url, ruta, token, args.conexiones, args.duracion)] * args.clientes)
+                    ))
+                    latencias = [latencia for propias, _ in resultados for latencia in propias]
+                    errores = sum(fallos for _, fallos in resultados)
+                    fila = resumen(latencias, time.perf_counter() - inicio, errores)
+
+                    base.setdefault(ruta, fila['rps'])
+                    filas.append({
+                        'workers': workers,
+                        'ruta': ruta,
+                        'rps': fila['rps'],
+                        'errores': fila['errores'],
+                        'p50_ms': fila['p50_ms'],
+                        'p99_ms': fila['p99_ms'],
+                        'aceleración': f"{fila['rps'] / base[ruta]:.2f}x" if base[ruta] else '-'
+                    })
+
+    imprimir_tabla(filas)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheTTL:
+    """
+    Cache LRU acotado con expiración por entrada, seguro entre hilos.
+    Al llegar a ``maximo`` entradas se descarta la usada hace más tiempo.
+    """
+
+    def __init__(self, maximo: int, ttl: float):
+        self.maximo = maximo
+        self.ttl = ttl
+        self._datos = OrderedDict()
+        self._candado = threading.Lock()
+
+    def obtener(self, clave, default=None):
+        with self._candado:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return default
+
+            valor, expira = entrada
+            if expira <= time.monotonic():
+                del self._datos[clave]
+                return default
+
+            self._datos.move_to_end(clave)
+            return valor
+
+    def guardar(self, clave, valor, ttl: float = None) -> None:
+        expira = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._candado:
+            self._datos[clave] = (valor, expira)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.maximo:
+                self._datos.popitem(last=False)
+
+    def invalidar(self, clave) -> None:
+        with self._candado:
+            self._datos.pop(clave, None)
+
+    def limpiar(self) -> None:
+        with self._candado:
+            self._datos.clear()
+
+    def __len__(self):
+        return len(self._datos)
+
+
+class CacheMemoria:
+    """
+    Interfaz asíncrona sobre ``CacheTTL`` para los caches que también pueden vivir
+    fuera del proceso. Cada worker tiene el suyo, así que una invalidación solo
+    se ve en el worker que la hizo; las demás copias caducan con el TTL.
+
+    Para llenar el cache desde la base de datos sin carreras se pide ``version(clave)``
+    antes de leer y se pasa a ``guardar``: si la clave se invalidó mientras tanto, lo
+    leído puede ser anterior al cambio y no se guarda.
+    """
+
+    def __init__(self, maximo: int, ttl: float):
+        self._cache = CacheTTL(maximo, ttl)
+        # Contador de invalidaciones y el valor que tenía en la última de cada clave
+        self._contador = 0
+        self._invalidadas = CacheTTL(maximo, ttl)
+
+    async def obtener(self, clave: str):
+        return self._cache.obtener(clave)
+
+    async def version(self, clave: str) -> int:
+        return self._contador
+
+    async def guardar(self, clave: str, valor: bytes, version: int = None) -> None:
+        if version is not None and self._invalidadas.obtener(clave, -1) > version:
+            return
+        self._cache.guardar(clave, valor)
+
+    async def invalidar(self, clave: str) -> None:
+        self._contador += 1
+        self._invalidadas.guardar(clave, self._contador)
+        self._cache.invalidar(clave)
+
+    async def invalidar_varias(self, claves: list) -> None:
+        for clave in claves:
+            await self.invalidar(clave)
+
+
+class CacheRedis:
+    """
+    Misma interfaz que ``CacheMemoria`` pero compartida entre workers a través de
+    Redis, que se encarga de la expiración y del desalojo (``maxmemory-policy``).
+    Requiere el paquete ``redis``.
+
+    Cada invalidación incrementa un contador por clave (``<prefijo>v:<clave>``), y
+    ``guardar`` compara el contador y escribe en un solo script, así una invalidación de
+    cualquier worker durante la lectura impide guardar lo leído.
+    """
+
+    GUARDAR_SI_VERSION = """
+        if (redis.call('GET', KEYS[2]) or '0') == ARGV[2] then
+            redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[3])
+        end
+    """
+
+    def __init__(self, url: str, ttl: float, prefijo: str):
+        try:
+            from redis import asyncio as redis
+        except ImportError as e:
+            raise RuntimeError('El cache en Redis necesita el paquete redis (pip install redis)') from e
+
+        self._cliente = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefijo = prefijo
+
+    async def obtener(self, clave: str):
+        return await self._cliente.get(self.prefijo + clave)
+
+    async def version(self, clave: str) -> bytes:
+        return await self._cliente.get(self.prefijo + 'v:' + clave) or b'0'
+
+    async def guardar(self, clave: str, valor: bytes, version: bytes = None) -> None:
+        ttl = int(self.ttl * 1000)
+        if version is None:
+            await self._cliente.set(self.prefijo + clave, valor, px=ttl)
+        else:
+            await self._cliente.eval(
+                self.GUARDAR_SI_VERSION, 2, self.prefijo + clave, self.prefijo + 'v:' + clave, valor, version, ttl
+            )
+
+    async def invalidar(self, clave: str) -> None:
+        await self.invalidar_varias([clave])
+
+    async def invalidar_varias(self, claves: list) -> None:
+        if not claves:
+            return
+
+        # El contador vive lo mismo que una entrada: basta para cubrir las lecturas en curso
+        ttl = int(self.ttl * 1000)
+        async with self._cliente.pipeline(transaction=True) as pipeline:
+            pipeline.delete(*(self.prefijo + clave for clave in claves))
+            for clave in claves:
+                pipeline.incr(self.prefijo + 'v:' + clave)
+                pipeline.pexpire(self.prefijo + 'v:' + clave, ttl)
+            await pipeline.execute()
@@ -1,5 +1,29 @@
-from .db import engine, Base
+from pathlib import Path
+from sqlalchemy import inspect
+from .db import Base, obtener_engine
 from .models import Usuario, Orden
 
+RAIZ = Path(__file__).resolve().parent.parent
+
+def configuracion_alembic():
+    from alembic.config import Config
+
+    config = Config(str(RAIZ / 'alembic.ini'))
+    config.set_main_option('script_location', str(RAIZ / 'migraciones'))
+    return config
+
 def activate():
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    """
+    Lleva la base de datos a la última migración. Si las tablas ya existían
+    (creadas con ``create_all`` antes de usar migraciones) se marcan primero
+    en la revisión inicial.
+    """
+    from alembic import command
+
+    config = configuracion_alembic()
+    tablas = inspect(obtener_engine()).get_table_names()
+
+    if 'alembic_version' not in tablas and {'usuario', 'ordenes'} <= set(tablas):
+        command.stamp(config, '0001')
+
+    command.upgrade(config, 'head')
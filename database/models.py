@@ -1,7 +1,40 @@
+import enum
 from .db import Base
-from sqlalchemy import Column, Integer, Boolean, String, Text, ForeignKey
+from sqlalchemy import BigInteger, Column, DateTime, Enum, Integer, Boolean, LargeBinary, SmallInteger, String, Text, ForeignKey, Index, text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
-from sqlalchemy_utils.types import ChoiceType
+
+
+class Estado(str, enum.Enum):
+    PROCESANDO = 'PROCESANDO'
+    EN_RUTA = 'EN RUTA'
+    ENTREGADO = 'ENTREGADO'
+
+class Guisado(str, enum.Enum):
+    TINGA = 'TINGA'
+    CARNE = 'CARNE'
+    POLLO = 'POLLO'
+    CHAMPINONES = 'CHAMPIÑONES'
+    COMBINADO = 'COMBINADO'
+
+class Tipo(str, enum.Enum):
+    QUESADILLA = 'QUESADILLA'
+    HUARACHE = 'HUARACHE'
+    SOPE = 'SOPE'
+
+
+def enum_nativo(clase, nombre: str) -> Enum:
+    """
+    Enum nativo de PostgreSQL (4 bytes por valor) cuyas etiquetas son los valores de
+    ``clase``. Al leer, cada etiqueta se traduce con un diccionario al miembro ya existente.
+    """
+    return Enum(
+        clase,
+        name=nombre,
+        values_callable=lambda miembros: [m.value for m in miembros],
+        validate_strings=True
+    )
+
 
 class Usuario(Base):
     __tablename__ = 'usuario'
@@ -12,7 +45,7 @@ class Usuario(Base):
     password = Column(Text, nullable=True)
     es_admin = Column(Boolean, default=False)
     es_activo = Column(Boolean, default=True)
-    ordenes = relationship('Orden', back_populates='usuario')
+    ordenes = relationship('Orden', back_populates='usuario', foreign_keys='Orden.id_usuario')
     
     def __repr__(self):
         return f'<Usuario {self.username}>'
@@ -20,33 +53,60 @@ class Usuario(Base):
 class Orden(Base):
     __tablename__ = 'ordenes'
     
-    ESTADOS = (
-        ('PROCESANDO', 'procesando'),
-        ('EN RUTA', 'en ruta de entrega'),
-        ('ENTREGADO', 'entregado')    
-    )
-    
-    GUISADOS = (
-        ('TINGA', 'tinga de pollo'),
-        ('CARNE', 'carne'),
-        ('POLLO', 'pollo'),
-        ('CHAMPIÑONES', 'champiñones'),
-        ('COMBINADO', 'combinado')
-    )
-    
-    TIPOS = (
-        ('QUESADILLA', 'quesadilla'),
-        ('HUARACHE', 'huarache'),
-        ('SOPE', 'sope')
-    )
-    
     id = Column(Integer, primary_key = True)
     cantidad = Column(Integer, nullable = False)
-    estado = Column(ChoiceType(choices=ESTADOS), default='PROCESANDO')
-    guisados = Column(ChoiceType(choices=GUISADOS))
-    tipo = Column(ChoiceType(choices=TIPOS))
+    estado = Column(enum_nativo(Estado, 'estado_orden'), nullable=False, default=Estado.PROCESANDO)
+    guisados = Column(enum_nativo(Guisado, 'guisado_orden'), nullable=False)
+    tipo = Column(enum_nativo(Tipo, 'tipo_orden'), nullable=False)
     id_usuario = Column(Integer, ForeignKey('usuario.id'))
-    usuario = relationship('Usuario', back_populates='ordenes')
+    reclamada_por = Column(Integer, ForeignKey('usuario.id'), nullable=True)
+    reclamada_en = Column(DateTime(timezone=True), nullable=True)
+    usuario = relationship('Usuario', back_populates='ordenes', foreign_keys=[id_usuario])
+    
+    __table_args__ = (
+        Index('ix_ordenes_id_usuario_id', 'id_usuario', 'id'),
+        Index('ix_ordenes_estado_id', 'estado', 'id'),
+        Index('ix_ordenes_cola', 'id', postgresql_where=text("estado = 'PROCESANDO' AND reclamada_en IS NULL")),
+        Index(
+            'ix_ordenes_cola_reclamadas', 'reclamada_en',
+            postgresql_where=text("estado = 'PROCESANDO' AND reclamada_en IS NOT NULL")
+        ),
+    )
     
     def __repr__(self):
-        return f'<Orden {self.id}>'
\ No newline at end of file
+        return f'<Orden {self.id}>'
+
+
+# Las dos tablas de resumen las mantienen los triggers de la migración 0005 sobre
+# ``ordenes``; la aplicación solo las lee
+
+class ResumenOrdenes(Base):
+    __tablename__ = 'resumen_ordenes'
+    
+    estado = Column(enum_nativo(Estado, 'estado_orden'), primary_key=True)
+    tipo = Column(enum_nativo(Tipo, 'tipo_orden'), primary_key=True)
+    guisados = Column(enum_nativo(Guisado, 'guisado_orden'), primary_key=True)
+    particion = Column(SmallInteger, primary_key=True)
+    ordenes = Column(BigInteger, nullable=False)
+    piezas = Column(BigInteger, nullable=False)
+
+class ResumenOrdenesUsuario(Base):
+    __tablename__ = 'resumen_ordenes_usuario'
+    
+    id_usuario = Column(Integer, ForeignKey('usuario.id'), primary_key=True)
+    estado = Column(enum_nativo(Estado, 'estado_orden'), primary_key=True)
+    ordenes = Column(BigInteger, nullable=False)
+    piezas = Column(BigInteger, nullable=False)
+
+# Respuestas guardadas por ``idempotencia.AlmacenPostgres``; ``codigo`` es nulo mientras
+# la petición original sigue en curso
+
+class ClaveIdempotencia(Base):
+    __tablename__ = 'idempotencia'
+    
+    clave = Column(Text, primary_key=True)
+    huella = Column(LargeBinary, nullable=False)
+    codigo = Column(SmallInteger)
+    encabezados = Column(JSONB)
+    cuerpo = Column(LargeBinary)
+    expira = Column(DateTime(timezone=True), nullable=False, index=True)
@@ -0,0 +1,172 @@
+"""
+Lecturas en réplicas de PostgreSQL.
+
+``SesionRuteada`` decide en ``get_bind`` a qué engine va cada sentencia: en las sesiones
+de lectura (``database.db.obtener_sesion_lectura``) los SELECT van a una réplica y todo
+lo demás (INSERT, UPDATE, DELETE, flush y cualquier sentencia de las sesiones normales)
+a la primaria. La réplica se elige una sola vez por sesión, por turnos entre las sanas,
+para que una petición no mezcle lo que ven dos réplicas.
+
+El ``Enrutador`` revisa cada ``replicas_intervalo`` segundos que cada réplica responda y
+que su retraso de replicación no pase de ``replicas_retraso_maximo``; si ninguna está
+sana las lecturas van a la primaria. Cuando un usuario confirma una escritura, sus
+lecturas van a la primaria durante ``replicas_ventana`` segundos para que vea lo que
+acaba de escribir aunque la réplica vaya atrasada. La ventana se recuerda en cada
+proceso, así que con varios workers debe cubrir el retraso máximo más el intervalo de
+revisión: es lo más que una réplica que se ve sana puede ir atrasada.
+"""
+import asyncio
+import itertools
+import logging
+from contextvars import ContextVar
+from typing import Callable, List, Optional
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from cache import CacheTTL
+
+log = logging.getLogger(__name__)
+
+# Usuario que hace la petición; lo fija routers.dependencias al resolver el token
+usuario_peticion: ContextVar[Optional[int]] = ContextVar('usuario_peticion', default=None)
+
+# Segundos desde la última transacción aplicada, o 0 si la réplica ya aplicó todo lo que recibió
+RETRASO = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+
+class Replica:
+    __slots__ = ('engine', 'enlace', 'sana', 'retraso')
+
+    def __init__(self, engine):
+        self.engine = engine
+        # Session.get_bind siempre regresa un engine síncrono, también con AsyncSession
+        self.enlace = getattr(engine, 'sync_engine', engine)
+        self.sana = False
+        self.retraso = None
+
+    def __repr__(self):
+        return repr(self.enlace.url)
+
+
+class Enrutador:
+    """
+    Réplicas disponibles y escrituras recientes de cada usuario. Los engines se crean
+    con ``crear_engines`` al ``iniciar``; antes de eso todas las lecturas van a la primaria.
+    """
+
+    def __init__(self, crear_engines: Callable[[], list], intervalo: float, retraso_maximo: float, ventana: float, maximo: int):
+        self.crear_engines = crear_engines
+        self.intervalo = intervalo
+        self.retraso_maximo = retraso_maximo
+        self.replicas: List[Replica] = []
+        self._turno = itertools.count()
+        self._escrituras = CacheTTL(maximo=maximo, ttl=ventana)
+        self._tarea = None
+
+    def registrar_escritura(self, usuario: Optional[int]) -> None:
+        if usuario is not None and self._escrituras.ttl > 0:
+            self._escrituras.guardar(usuario, True)
+
+    def elegir(self, usuario: Optional[int]):
+        """Engine de la réplica que toca, o None para leer de la primaria"""
+        if usuario is not None and self._escrituras.obtener(usuario):
+            return None
+
+        sanas = [replica for replica in self.replicas if replica.sana]
+        if not sanas:
+            return None
+
+        return sanas[next(self._turno) % len(sanas)].enlace
+
+    async def _medir(self, replica: Replica) -> float:
+        if replica.engine is not replica.enlace:
+            async with replica.engine.connect() as conexion:
+                return float(await conexion.scalar(RETRASO))
+
+        def medir():
+            with replica.engine.connect() as conexion:
+                return float(conexion.scalar(RETRASO))
+
+        return await run_in_threadpool(medir)
+
+    async def _revisar(self, replica: Replica) -> None:
+        try:
+            replica.retraso = await asyncio.wait_for(self._medir(replica), self.intervalo)
+            sana = replica.retraso <= self.retraso_maximo
+        except Exception as e:
+            log.debug('La réplica %r no respondió: %s', replica, e)
+            replica.retraso = None
+            sana = False
+
+        if sana != replica.sana:
+            if sana:
+                log.info('La réplica %r vuelve a recibir lecturas', replica)
+            else:
+                log.warning('La réplica %r deja de recibir lecturas (retraso: %s s)', replica, replica.retraso)
+        replica.sana = sana
+
+    async def revisar(self) -> None:
+        await asyncio.gather(*(self._revisar(replica) for replica in self.replicas))
+
+    async def _revisar_siempre(self) -> None:
+        while True:
+            await asyncio.sleep(self.intervalo)
+            await self.revisar()
+
+    async def iniciar(self) -> None:
+        if not self.replicas:
+            self.replicas = [Replica(engine) for engine in self.crear_engines()]
+        await self.revisar()
+        self._tarea = asyncio.create_task(self._revisar_siempre())
+
+    async def detener(self) -> None:
+        if self._tarea is not None:
+            self._tarea.cancel()
+            self._tarea = None
+        for replica in self.replicas:
+            replica.sana = False
+
+
+class SesionRuteada(Session):
+    """
+    Sesión que lee de una réplica si trae ``info['lectura']`` y escribe en la primaria.
+    ``info['enrutador']`` elige la réplica y recibe las escrituras confirmadas.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.info.get('lectura') and not self._flushing and getattr(clause, 'is_select', False):
+            if 'replica' not in self.info:
+                self.info['replica'] = self.info['enrutador'].elegir(usuario_peticion.get())
+            if self.info['replica'] is not None:
+                return self.info['replica']
+
+        return super().get_bind(mapper=mapper, clause=clause, **kwargs)
+
+
+def en_replica(sesion) -> bool:
+    """Si la sesión (``AsyncSession`` o ``SesionEnHilos``) ya leyó de una réplica"""
+    return sesion.sync_session.info.get('replica') is not None
+
+
+@event.listens_for(SesionRuteada, 'do_orm_execute')
+def _sentencia(estado):
+    if not estado.is_select:
+        estado.session.info['escribio'] = True
+
+@event.listens_for(SesionRuteada, 'after_flush')
+def _flush(sesion, contexto):
+    sesion.info['escribio'] = True
+
+@event.listens_for(SesionRuteada, 'after_commit')
+def _confirmada(sesion):
+    if sesion.info.pop('escribio', False):
+        sesion.info['enrutador'].registrar_escritura(usuario_peticion.get())
+
+@event.listens_for(SesionRuteada, 'after_rollback')
+def _revertida(sesion):
+    sesion.info.pop('escribio', None)
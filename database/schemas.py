@@ -1,7 +1,8 @@
-from typing import Optional
-from pydantic import BaseModel, Field, validator, EmailStr
+from typing import Dict, List, Optional
+from pydantic import BaseModel, Field, root_validator, validator, EmailStr
 import re
-import os
+from config import obtener_configuracion
+from .models import Estado, Guisado, Orden, Tipo, Usuario
 
 
 class UsuarioBase(BaseModel):
@@ -77,6 +78,23 @@ class UsuarioRegistro(UsuarioBase):
             }
         }
  
+class UsuarioOut(BaseModel):
+    id: int = Field(
+        title='ID de usuario'
+    )
+    username: str = Field(
+        title='Nombre de usuario'
+    )
+    email: Optional[str] = Field(
+        title='Email del usuario'
+    )
+    es_activo: Optional[bool] = Field(
+        title='Es un usuario activo?'
+    )
+    es_admin: Optional[bool] = Field(
+        title='Es administrador?'
+    )
+
 class UsuarioLoginOut(BaseModel):
     username: str = Field(
         title='Nombre de usuario'
@@ -94,25 +112,22 @@ class UsuarioLogin(BaseModel):
         title='Contraseña del usuario'
     )
 
-class Settings(BaseModel):
-    authjwt_secret_key: str = os.environ['JWT_KEY']
-    
 class OrdenBase(BaseModel):
     id: Optional[int]
     cantidad: int = Field(
         title='Cantidad',
         description='Cantidad de productos'
     )
-    estado: Optional[str] = Field(
+    estado: Optional[Estado] = Field(
         title='Estado de la orden',
         description='Estado de la orden (PROCESANDO, EN RUTA, ENTREGADO)',
-        default='PROCESANDO'
+        default=Estado.PROCESANDO
     )
-    guisados: str = Field(
+    guisados: Guisado = Field(
         title='Guisado',
         description='Guisado de tu tipo de comida (TINGA, CARNE, POLLO, CHAMPIÑONES, COMBINADO)',
     )
-    tipo: str = Field(
+    tipo: Tipo = Field(
         title='Tipo de comida',
         description='Tipo de comida (QUESADILLA, HUARACHE, SOPE)'
     )
@@ -130,13 +145,224 @@ class OrdenBase(BaseModel):
             }
         }
     
+class OrdenLote(BaseModel):
+    ordenes: List[OrdenBase] = Field(
+        title='Órdenes',
+        description='Órdenes a crear en una sola transacción',
+        min_items=1,
+        max_items=obtener_configuracion().lote_maximo
+    )
+    
+    class Config:
+        schema_extra = {
+            'example': {
+                'ordenes': [
+                    {'cantidad': 2, 'guisados': 'TINGA', 'tipo': 'QUESADILLA'},
+                    {'cantidad': 4, 'guisados': 'POLLO', 'tipo': 'SOPE'}
+                ]
+            }
+        }
+
+class OrdenLoteOut(BaseModel):
+    total: int = Field(
+        title='Órdenes creadas'
+    )
+    ids: List[int] = Field(
+        title='IDs de las órdenes creadas, en el mismo orden en que se enviaron'
+    )
+    
+class TransicionOrdenes(BaseModel):
+    ids: List[int] = Field(
+        title='IDs de las órdenes',
+        min_items=1,
+        max_items=obtener_configuracion().lote_maximo
+    )
+    estado: Estado = Field(
+        title='Nuevo estado',
+        description='Estado al que pasan todas las órdenes (PROCESANDO, EN RUTA, ENTREGADO)'
+    )
+    
+    class Config:
+        schema_extra = {
+            'example': {
+                'ids': [10, 11, 12],
+                'estado': 'EN RUTA'
+            }
+        }
+
+class TransicionOrdenesOut(BaseModel):
+    actualizadas: List[int] = Field(
+        title='IDs de las órdenes que cambiaron de estado'
+    )
+    no_encontradas: List[int] = Field(
+        title='IDs que no corresponden a ninguna orden'
+    )
+    
+class FiltroOrdenes(BaseModel):
+    estado: Optional[Estado] = Field(
+        title='Estado',
+        description='Solo las órdenes en este estado (PROCESANDO, EN RUTA, ENTREGADO)'
+    )
+    id_usuario: Optional[int] = Field(
+        title='ID del usuario',
+        description='Solo las órdenes de este usuario'
+    )
+    
+    @root_validator
+    def no_vacio(cls, valores):
+        if valores.get('estado') is None and valores.get('id_usuario') is None:
+            raise ValueError('El filtro necesita estado y/o id_usuario')
+        return valores
+
+class SeleccionOrdenes(BaseModel):
+    ids: Optional[List[int]] = Field(
+        title='IDs de las órdenes',
+        min_items=1,
+        max_items=obtener_configuracion().lote_maximo
+    )
+    filtro: Optional[FiltroOrdenes] = Field(
+        title='Filtro',
+        description='En lugar de ids, todas las órdenes que cumplan el filtro'
+    )
+    
+    @root_validator
+    def ids_o_filtro(cls, valores):
+        if (valores.get('ids') is None) == (valores.get('filtro') is None):
+            raise ValueError('Envía ids o filtro, no ambos')
+        return valores
+    
+    class Config:
+        schema_extra = {
+            'example': {
+                'ids': [10, 11, 12]
+            }
+        }
+
+class CambiosOrden(BaseModel):
+    cantidad: Optional[int] = Field(
+        title='Cantidad',
+        description='Cantidad de productos'
+    )
+    guisados: Optional[Guisado] = Field(
+        title='Guisado',
+        description='Guisado de tu tipo de comida (TINGA, CARNE, POLLO, CHAMPIÑONES, COMBINADO)'
+    )
+    tipo: Optional[Tipo] = Field(
+        title='Tipo de comida',
+        description='Tipo de comida (QUESADILLA, HUARACHE, SOPE)'
+    )
+    estado: Optional[Estado] = Field(
+        title='Estado de la orden',
+        description='Nuevo estado (PROCESANDO, EN RUTA, ENTREGADO); solo administradores'
+    )
+    
+    @root_validator
+    def no_vacio(cls, valores):
+        if all(valor is None for valor in valores.values()):
+            raise ValueError('Indica al menos un cambio')
+        return valores
+
+class ActualizacionLote(SeleccionOrdenes):
+    cambios: CambiosOrden = Field(
+        title='Cambios',
+        description='Campos que se asignan a todas las órdenes seleccionadas'
+    )
+    
+    class Config:
+        schema_extra = {
+            'example': {
+                'filtro': {'estado': 'EN RUTA'},
+                'cambios': {'estado': 'ENTREGADO'}
+            }
+        }
+
+class ResultadoLote(BaseModel):
+    no_encontradas: List[int] = Field(
+        default=[],
+        title='IDs que no corresponden a ninguna orden'
+    )
+    prohibidas: List[int] = Field(
+        default=[],
+        title='IDs de órdenes que no puedes modificar o borrar'
+    )
+
+class ActualizacionLoteOut(ResultadoLote):
+    actualizadas: List[int] = Field(
+        title='IDs de las órdenes actualizadas'
+    )
+
+class BorradoLoteOut(ResultadoLote):
+    borradas: List[int] = Field(
+        title='IDs de las órdenes borradas'
+    )
+    
+class TotalOrdenes(BaseModel):
+    ordenes: int = Field(
+        title='Número de órdenes'
+    )
+    piezas: int = Field(
+        title='Suma de la cantidad de las órdenes'
+    )
+
+class EstadisticasOrdenes(BaseModel):
+    total: TotalOrdenes = Field(
+        title='Todas las órdenes'
+    )
+    por_estado: Dict[Estado, TotalOrdenes] = Field(
+        title='Totales por estado'
+    )
+    por_tipo: Dict[Tipo, TotalOrdenes] = Field(
+        title='Totales por tipo de comida'
+    )
+    por_guisado: Dict[Guisado, TotalOrdenes] = Field(
+        title='Totales por guisado'
+    )
+
+class EstadisticasUsuario(TotalOrdenes):
+    id_usuario: int = Field(
+        title='ID del usuario'
+    )
+    por_estado: Dict[Estado, int] = Field(
+        title='Órdenes por estado'
+    )
+    
 class EstadoOrden(BaseModel):
-    estado: Optional[str] = 'PENDIENTE'
+    estado: Estado = Field(
+        title='Estado de la orden',
+        description='Nuevo estado de la orden (PROCESANDO, EN RUTA, ENTREGADO)'
+    )
 
     class Config:
         orm_mode = True
         schema_extra = {
             "example": {
-                "estado": 'PENDIENTE'
+                "estado": 'EN RUTA'
             }
-        }
\ No newline at end of file
+        }
+
+
+class Proyeccion:
+    """
+    Columnas de un modelo nombradas como los campos de un esquema de salida. Las filas
+    se convierten en dicts listos para serializar sin crear objetos del ORM ni validar
+    con pydantic, porque los datos ya vienen de la base de datos.
+
+    Las filas (``Row`` de ``database.db.leer_columnas``) ya son tuplas inmutables y
+    compactas; los dicts se arman hasta el momento de serializar porque orjson los
+    serializa más rápido que dataclasses con ``__slots__`` o namedtuples.
+    """
+
+    def __init__(self, esquema, modelo):
+        self.campos = tuple(esquema.__fields__)
+        self.columnas = tuple(getattr(modelo, campo) for campo in self.campos)
+
+    def dict(self, fila) -> dict:
+        return dict(zip(self.campos, fila))
+
+    def dicts(self, filas) -> list:
+        campos = self.campos
+        return [dict(zip(campos, fila)) for fila in filas]
+
+
+PROYECCION_ORDEN = Proyeccion(OrdenBase, Orden)
+PROYECCION_USUARIO = Proyeccion(UsuarioOut, Usuario)
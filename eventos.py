@@ -0,0 +1,225 @@
+"""
+Publicación de los cambios de estado de las órdenes a los clientes suscritos.
+
+Cada proceso guarda a sus suscriptores en memoria, agrupados por usuario, y reparte
+cada evento solo a los del dueño de la orden. Con ``ENTREGAS_EVENTOS_BACKEND=postgres``
+los eventos viajan por LISTEN/NOTIFY, así llegan a los suscriptores de todos los
+workers y no solo a los del proceso que hizo el cambio. Ese backend también escucha
+``CANAL_USUARIOS``, donde los triggers de la migración 0007 avisan qué usuarios
+cambiaron, y se lo pasa a las funciones registradas con ``al_cambiar_usuario``.
+"""
+import asyncio
+import json
+import logging
+from collections import deque
+from contextlib import contextmanager
+from typing import Optional
+from sqlalchemy.engine import make_url
+from config import obtener_configuracion
+
+log = logging.getLogger(__name__)
+
+CANAL = 'ordenes_estado'
+CANAL_USUARIOS = 'usuarios_cambios'
+
+
+class Suscripcion:
+    """
+    Eventos pendientes de un cliente. La cola es acotada: si el cliente no lee a
+    tiempo se descartan los eventos más viejos en lugar de acumular memoria.
+    """
+    __slots__ = ('eventos', 'cerrada', '_espera')
+
+    def __init__(self, maximo: int):
+        self.eventos = deque(maxlen=maximo)
+        self.cerrada = False
+        self._espera = None
+
+    def _despertar(self):
+        if self._espera is not None and not self._espera.done():
+            self._espera.set_result(None)
+
+    def entregar(self, evento: dict) -> None:
+        self.eventos.append(evento)
+        self._despertar()
+
+    def cerrar(self) -> None:
+        self.cerrada = True
+        self._despertar()
+
+    async def siguiente(self, timeout: Optional[float] = None) -> Optional[dict]:
+        """Espera el siguiente evento; regresa None si pasa ``timeout`` o se cierra la suscripción"""
+        if not self.eventos and not self.cerrada:
+            self._espera = asyncio.get_running_loop().create_future()
+            try:
+                await asyncio.wait((self._espera,), timeout=timeout)
+            finally:
+                self._espera = None
+
+        return self.eventos.popleft() if self.eventos else None
+
+
+class BusMemoria:
+    """Reparte los eventos entre los suscriptores de este proceso"""
+
+    def __init__(self, cola_maxima: int):
+        self.cola_maxima = cola_maxima
+        self.suscriptores = {}
+        self.oyentes_usuarios = []
+
+    def al_cambiar_usuario(self, funcion) -> None:
+        """
+        Registra ``funcion(username)``, que se llama cuando cambia o se borra un usuario.
+        Recibe None si pudieron perderse avisos (p. ej. al reconectar): cualquier usuario
+        pudo cambiar.
+        """
+        self.oyentes_usuarios.append(funcion)
+
+    def avisar_usuario(self, username: Optional[str]) -> None:
+        for funcion in self.oyentes_usuarios:
+            funcion(username)
+
+    async def iniciar(self) -> None:
+        pass
+
+    async def detener(self) -> None:
+        pass
+
+    @contextmanager
+    def suscribir(self, id_usuario: int):
+        suscripcion = Suscripcion(self.cola_maxima)
+        self.suscriptores.setdefault(id_usuario, set()).add(suscripcion)
+        try:
+            yield suscripcion
+        finally:
+            propias = self.suscriptores.get(id_usuario)
+            if propias is not None:
+                propias.discard(suscripcion)
+                if not propias:
+                    del self.suscriptores[id_usuario]
+
+    def repartir(self, id_usuario: int, evento: dict) -> None:
+        for suscripcion in self.suscriptores.get(id_usuario, ()):
+            suscripcion.entregar(evento)
+
+    async def publicar(self, id_usuario: int, evento: dict) -> None:
+        self.repartir(id_usuario, evento)
+
+    async def publicar_varios(self, eventos: list) -> None:
+        """Publica pares ``(id_usuario, evento)``, p. ej. los de un cambio de estado en lote"""
+        for id_usuario, evento in eventos:
+            self.repartir(id_usuario, evento)
+
+    def __len__(self):
+        return sum(len(propias) for propias in self.suscriptores.values())
+
+
+class BusPostgres(BusMemoria):
+    """
+    Publica con ``pg_notify`` y escucha el canal en una conexión dedicada de asyncpg.
+    Los eventos propios también regresan por el canal, así que ``publicar`` no los
+    reparte directamente para no entregarlos dos veces.
+    """
+
+    def __init__(self, dsn: str, cola_maxima: int):
+        super().__init__(cola_maxima)
+        self.dsn = dsn
+        self._conexion = None
+        self._candado = None
+        self._detenido = False
+
+    async def _conectar(self):
+        import asyncpg
+
+        conexion = await asyncpg.connect(self.dsn)
+        await conexion.add_listener(CANAL, self._recibir)
+        await conexion.add_listener(CANAL_USUARIOS, self._recibir_usuario)
+        conexion.add_termination_listener(self._conexion_perdida)
+        self._conexion = conexion
+
+    def _conexion_perdida(self, conexion):
+        if not self._detenido:
+            log.warning('Se perdió la conexión de LISTEN en %s, reconectando', CANAL)
+            asyncio.ensure_future(self._reconectar())
+
+    async def _reconectar(self):
+        while not self._detenido:
+            try:
+                async with self._candado:
+                    if self._conexion is None or self._conexion.is_closed():
+                        await self._conectar()
+                # Los cambios de usuarios mientras no se escuchaba no llegaron
+                self.avisar_usuario(None)
+                return
+            except Exception:
+                log.exception('No se pudo reconectar a %s', CANAL)
+                await asyncio.sleep(1)
+
+    def _recibir(self, conexion, pid, canal, payload):
+        try:
+            mensaje = json.loads(payload)
+            self.repartir(mensaje['id_usuario'], mensaje['evento'])
+        except (ValueError, KeyError):
+            log.warning('Evento con formato inválido en %s: %r', canal, payload)
+
+    def _recibir_usuario(self, conexion, pid, canal, payload):
+        self.avisar_usuario(payload)
+
+    async def iniciar(self) -> None:
+        # El candado se crea aquí para quedar ligado al event loop del servidor
+        self._candado = asyncio.Lock()
+        self._detenido = False
+        await self._conectar()
+
+    async def detener(self) -> None:
+        self._detenido = True
+        if self._conexion is not None:
+            await self._conexion.close()
+            self._conexion = None
+
+    async def publicar(self, id_usuario: int, evento: dict) -> None:
+        payload = json.dumps({'id_usuario': id_usuario, 'evento': evento}, ensure_ascii=False)
+
+        # Una conexión de asyncpg no admite operaciones simultáneas
+        async with self._candado:
+            try:
+                if self._conexion is None or self._conexion.is_closed():
+                    await self._conectar()
+                await self._conexion.execute('SELECT pg_notify($1, $2)', CANAL, payload)
+            except Exception:
+                # El cambio ya está guardado; perder el aviso no debe tumbar la petición
+                log.exception('No se pudo publicar el evento de la orden %s', evento.get('id'))
+
+    async def publicar_varios(self, eventos: list) -> None:
+        payloads = [
+            json.dumps({'id_usuario': id_usuario, 'evento': evento}, ensure_ascii=False)
+            for id_usuario, evento in eventos
+        ]
+        if not payloads:
+            return
+
+        # Un solo viaje a la base de datos para todos los avisos
+        async with self._candado:
+            try:
+                if self._conexion is None or self._conexion.is_closed():
+                    await self._conectar()
+                await self._conexion.execute(
+                    'SELECT pg_notify($1, payload) FROM unnest($2::text[]) AS payload',
+                    CANAL, payloads
+                )
+            except Exception:
+                log.exception('No se pudieron publicar %d eventos de órdenes', len(payloads))
+
+
+def crear_bus(configuracion) -> BusMemoria:
+    if configuracion.eventos_backend == 'postgres':
+        dsn = make_url(configuracion.url_bd_async).set(drivername='postgresql')
+        return BusPostgres(
+            dsn.render_as_string(hide_password=False),
+            configuracion.eventos_cola_maxima
+        )
+
+    return BusMemoria(configuracion.eventos_cola_maxima)
+
+
+bus = crear_bus(obtener_configuracion())
@@ -0,0 +1,323 @@
+"""
+Soporte del header ``Idempotency-Key`` para las rutas que crean o modifican órdenes.
+
+La primera petición con una clave se ejecuta normalmente y su respuesta se guarda; los
+reintentos con la misma clave (del mismo usuario, a la misma ruta) reciben la respuesta
+guardada sin llegar al endpoint. Si el reintento llega mientras la original sigue en
+curso, espera a que termine y recibe la misma respuesta, así que duplicados
+simultáneos se ejecutan una sola vez. Reusar una clave con otro cuerpo es un error 422.
+
+Las respuestas 5xx no se guardan: la clave se libera para que el cliente reintente.
+Con ``ENTREGAS_IDEMPOTENCIA_BACKEND=postgres`` las claves viven en la tabla
+``idempotencia`` y se respetan entre workers.
+"""
+import asyncio
+import hashlib
+import logging
+import re
+from typing import List, NamedTuple, Optional, Tuple
+import orjson
+from sqlalchemy.engine import make_url
+from cache import CacheTTL
+from config import obtener_configuracion
+from tokens import TokenInvalido, token_bearer
+
+log = logging.getLogger(__name__)
+
+ENCABEZADO = b'idempotency-key'
+LARGO_MAXIMO = 255
+
+# No se repiten en la respuesta guardada
+ENCABEZADOS_EXCLUIDOS = {b'date', b'server', b'set-cookie'}
+
+
+class EnCurso(Exception):
+    """Otro worker sigue ejecutando la petición original"""
+
+
+class RespuestaGuardada(NamedTuple):
+    huella: bytes
+    codigo: int
+    encabezados: List[Tuple[bytes, bytes]]
+    cuerpo: bytes
+
+    def encabezados_json(self) -> str:
+        return orjson.dumps([[k.decode('latin-1'), v.decode('latin-1')] for k, v in self.encabezados]).decode()
+
+    @staticmethod
+    def de_json(encabezados: str) -> list:
+        return [(k.encode('latin-1'), v.encode('latin-1')) for k, v in orjson.loads(encabezados)]
+
+
+class AlmacenMemoria:
+    """
+    Respuestas guardadas en el proceso, acotadas y con TTL. Los duplicados simultáneos
+    los coordina el middleware, así que reservar una clave es solo buscarla.
+    """
+
+    def __init__(self, maximo: int, ttl: float):
+        self._respuestas = CacheTTL(maximo=maximo, ttl=ttl)
+
+    async def iniciar(self) -> None:
+        pass
+
+    async def detener(self) -> None:
+        pass
+
+    async def reservar(self, clave: str, huella: bytes) -> Optional[RespuestaGuardada]:
+        return self._respuestas.obtener(clave)
+
+    async def guardar(self, clave: str, respuesta: RespuestaGuardada) -> None:
+        self._respuestas.guardar(clave, respuesta)
+
+    async def liberar(self, clave: str) -> None:
+        pass
+
+    def __len__(self):
+        return len(self._respuestas)
+
+
+class AlmacenPostgres:
+    """
+    Respuestas en la tabla ``idempotencia`` (migración 0006), compartidas entre workers.
+
+    Reservar inserta la clave sin respuesta; solo una inserción gana y las demás
+    esperan a que aparezca la respuesta. Una reserva sin respuesta caduca a los
+    ``plazo`` segundos, por si el worker que la tenía murió. Las filas vencidas se
+    borran periódicamente.
+    """
+
+    RESERVAR = """
+        INSERT INTO idempotencia (clave, huella, expira)
+        VALUES ($1, $2, now() + make_interval(secs => $3))
+        ON CONFLICT (clave) DO UPDATE
+        SET huella = excluded.huella, codigo = NULL, encabezados = NULL, cuerpo = NULL, expira = excluded.expira
+        WHERE idempotencia.expira < now()
+        RETURNING clave
+    """
+
+    def __init__(self, dsn: str, ttl: float, espera: float, plazo: float):
+        self.dsn = dsn
+        self.ttl = ttl
+        self.espera = espera
+        self.plazo = plazo
+        self._pool = None
+        self._purga = None
+
+    async def iniciar(self) -> None:
+        import asyncpg
+
+        self._pool = await asyncpg.create_pool(self.dsn, min_size=1, max_size=4)
+        self._purga = asyncio.ensure_future(self._purgar())
+
+    async def detener(self) -> None:
+        if self._purga is not None:
+            self._purga.cancel()
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    async def _purgar(self) -> None:
+        while True:
+            try:
+                await self._pool.execute('DELETE FROM idempotencia WHERE expira < now()')
+            except Exception:
+                log.exception('No se pudieron borrar las claves de idempotencia vencidas')
+            await asyncio.sleep(60)
+
+    async def reservar(self, clave: str, huella: bytes) -> Optional[RespuestaGuardada]:
+        limite = asyncio.get_running_loop().time() + self.espera
+
+        while True:
+            if await self._pool.fetchval(self.RESERVAR, clave, huella, float(self.plazo)):
+                return None
+
+            fila = await self._pool.fetchrow(
+                'SELECT huella, codigo, encabezados, cuerpo FROM idempotencia WHERE clave = $1',
+                clave
+            )
+            if fila is not None and fila['codigo'] is not None:
+                return RespuestaGuardada(
+                    fila['huella'],
+                    fila['codigo'],
+                    RespuestaGuardada.de_json(fila['encabezados']),
+                    fila['cuerpo']
+                )
+            # Con otro cuerpo no hace falta esperar a la original
+            if fila is not None and fila['huella'] != huella:
+                return RespuestaGuardada(fila['huella'], 0, [], b'')
+
+            if asyncio.get_running_loop().time() > limite:
+                raise EnCurso(clave)
+            await asyncio.sleep(0.05)
+
+    async def guardar(self, clave: str, respuesta: RespuestaGuardada) -> None:
+        await self._pool.execute(
+            """
+            UPDATE idempotencia
+            SET codigo = $2, encabezados = $3, cuerpo = $4, expira = now() + make_interval(secs => $5)
+            WHERE clave = $1
+            """,
+            clave, respuesta.codigo, respuesta.encabezados_json(), respuesta.cuerpo, float(self.ttl)
+        )
+
+    async def liberar(self, clave: str) -> None:
+        await self._pool.execute('DELETE FROM idempotencia WHERE clave = $1 AND codigo IS NULL', clave)
+
+
+def crear_almacen(configuracion):
+    if configuracion.idempotencia_backend == 'postgres':
+        dsn = make_url(configuracion.url_bd_async).set(drivername='postgresql')
+        return AlmacenPostgres(
+            dsn.render_as_string(hide_password=False),
+            ttl=configuracion.idempotencia_ttl,
+            espera=configuracion.idempotencia_espera,
+            plazo=configuracion.idempotencia_plazo
+        )
+
+    return AlmacenMemoria(configuracion.idempotencia_maximo, configuracion.idempotencia_ttl)
+
+
+almacen = crear_almacen(obtener_configuracion())
+
+
+def patron_ruta(ruta: str) -> re.Pattern:
+    """``/ordenes/{id_orden}`` -> expresión que acepta la ruta con o sin ``/`` final"""
+    partes = re.split(r'\{[^/]+\}', ruta.rstrip('/'))
+    return re.compile('^' + '[^/]+'.join(map(re.escape, partes)) + '/?$')
+
+
+async def responder(send, codigo: int, cuerpo: bytes, encabezados: list = None) -> None:
+    if encabezados is None:
+        encabezados = [(b'content-type', b'application/json'), (b'content-length', str(len(cuerpo)).encode())]
+    await send({'type': 'http.response.start', 'status': codigo, 'headers': encabezados})
+    await send({'type': 'http.response.body', 'body': cuerpo})
+
+
+def error(detalle: str) -> bytes:
+    return orjson.dumps({'detail': detalle})
+
+
+class MiddlewareIdempotencia:
+    """
+    Middleware ASGI que aplica ``Idempotency-Key`` a las ``rutas`` indicadas como
+    pares ``(método, ruta)``. Las claves se separan por usuario (``sub`` del token),
+    así que una petición sin token válido pasa directo y el endpoint la rechaza.
+    ``obtener_verificador`` regresa el ``VerificadorTokens`` y se llama hasta que hace falta.
+    """
+
+    def __init__(self, app, rutas: list, obtener_verificador, almacen=almacen, espera: float = None):
+        self.app = app
+        self.rutas = [(metodo, patron_ruta(ruta)) for metodo, ruta in rutas]
+        self.obtener_verificador = obtener_verificador
+        self.almacen = almacen
+        self.espera = obtener_configuracion().idempotencia_espera if espera is None else espera
+        self._en_curso = {}
+
+    def _aplica(self, scope) -> bool:
+        return any(scope['method'] == metodo and patron.match(scope['path']) for metodo, patron in self.rutas)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not self._aplica(scope):
+            await self.app(scope, receive, send)
+            return
+
+        encabezados = dict(scope['headers'])
+        clave_cliente = encabezados.get(ENCABEZADO)
+        if clave_cliente is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not clave_cliente or len(clave_cliente) > LARGO_MAXIMO:
+            await responder(send, 400, error(f'Idempotency-Key debe tener entre 1 y {LARGO_MAXIMO} caracteres'))
+            return
+
+        try:
+            autorizacion = encabezados.get(b'authorization', b'').decode('latin-1')
+            sujeto = self.obtener_verificador().verificar(token_bearer(autorizacion))['sub']
+        except TokenInvalido:
+            await self.app(scope, receive, send)
+            return
+
+        cuerpo = b''
+        while True:
+            mensaje = await receive()
+            cuerpo += mensaje.get('body', b'')
+            if not mensaje.get('more_body'):
+                break
+
+        clave = hashlib.sha256(
+            b'\0'.join((sujeto.encode(), scope['method'].encode(), scope['path'].encode(), clave_cliente))
+        ).hexdigest()
+        huella = hashlib.sha256(cuerpo).digest()
+
+        # Duplicados en este proceso: esperan a la original en lugar de consultar el almacén
+        while clave in self._en_curso:
+            try:
+                await asyncio.wait_for(asyncio.shield(self._en_curso[clave]), self.espera)
+            except asyncio.TimeoutError:
+                await responder(send, 409, error('Una petición con esta Idempotency-Key sigue en curso'))
+                return
+
+        terminada = asyncio.get_running_loop().create_future()
+        self._en_curso[clave] = terminada
+        try:
+            try:
+                guardada = await self.almacen.reservar(clave, huella)
+            except EnCurso:
+                await responder(send, 409, error('Una petición con esta Idempotency-Key sigue en curso'))
+                return
+
+            if guardada is not None:
+                if guardada.huella != huella:
+                    await responder(send, 422, error('La Idempotency-Key ya se usó con otro cuerpo'))
+                else:
+                    await responder(
+                        send, guardada.codigo, guardada.cuerpo,
+                        [*guardada.encabezados, (b'idempotent-replayed', b'true')]
+                    )
+                return
+
+            await self._ejecutar(scope, cuerpo, send, clave, huella)
+        finally:
+            del self._en_curso[clave]
+            terminada.set_result(None)
+
+    async def _ejecutar(self, scope, cuerpo: bytes, send, clave: str, huella: bytes) -> None:
+        enviado = False
+
+        async def recibir():
+            nonlocal enviado
+            if not enviado:
+                enviado = True
+                return {'type': 'http.request', 'body': cuerpo, 'more_body': False}
+            # Después del cuerpo solo queda esperar a que el cliente se desconecte
+            return await asyncio.get_running_loop().create_future()
+
+        inicio = {}
+        partes = []
+
+        async def enviar(mensaje):
+            if mensaje['type'] == 'http.response.start':
+                inicio.update(mensaje)
+            elif mensaje['type'] == 'http.response.body':
+                partes.append(mensaje.get('body', b''))
+            await send(mensaje)
+
+        try:
+            await self.app(scope, recibir, enviar)
+        except BaseException:
+            await self.almacen.liberar(clave)
+            raise
+
+        codigo = inicio.get('status', 500)
+        if codigo >= 500:
+            await self.almacen.liberar(clave)
+            return
+
+        await self.almacen.guardar(clave, RespuestaGuardada(
+            huella,
+            codigo,
+            [(k, v) for k, v in inicio.get('headers', []) if k.lower() not in ENCABEZADOS_EXCLUIDOS],
+            b''.join(partes)
+        ))
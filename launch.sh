@@ -12,5 +12,5 @@ python3 -m pip install -r requirements.txt
 # Init PostgreSQL DB
 python3 -c "import database; database.activate()"
 
-# Launch app
-uvicorn main:app
\ No newline at end of file
+# Launch app (ENTREGAS_SERVIDOR_WORKERS workers, see servidor.py)
+python3 -m servidor
\ No newline at end of file
@@ -0,0 +1,256 @@
+"""
+Límite de peticiones por usuario y control de admisión.
+
+Cada usuario (``sub`` del token, o la IP si la petición no trae uno válido) tiene un
+token bucket por presupuesto: ``lectura`` para los GET, ``escritura`` para lo que crea
+o modifica órdenes y ``auth`` para registro y acceso, que siempre se cuenta por IP
+porque calcular el hash de la contraseña es lo más caro de la API. Al vaciarse el
+bucket se responde 429 con ``Retry-After``.
+
+Además cada worker atiende a lo más ``admision_maximo`` peticiones a la vez. Las
+demás esperan turno en una cola acotada y, si no lo consiguen en
+``admision_espera`` segundos o la cola está llena, reciben 503 en lugar de
+amontonarse en el threadpool y en la espera del pool de conexiones.
+"""
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import NamedTuple
+import orjson
+import metricas
+from config import obtener_configuracion
+from idempotencia import patron_ruta
+from tokens import TokenInvalido, token_bearer
+
+
+class Presupuesto(NamedTuple):
+    rafaga: int
+    por_segundo: float
+
+
+class LimitadorMemoria:
+    """
+    Buckets en el proceso, acotados a ``maximo``; al llenarse se olvida el usado hace
+    más tiempo (que, de todas formas, ya se habría rellenado).
+    """
+
+    def __init__(self, maximo: int):
+        self.maximo = maximo
+        self._buckets = OrderedDict()
+        self._candado = threading.Lock()
+
+    async def tomar(self, clave: str, presupuesto: Presupuesto) -> float:
+        """Gasta una ficha; regresa 0 si había, si no los segundos hasta la siguiente"""
+        ahora = time.monotonic()
+        with self._candado:
+            fichas, ultimo = self._buckets.get(clave, (presupuesto.rafaga, ahora))
+            fichas = min(presupuesto.rafaga, fichas + (ahora - ultimo) * presupuesto.por_segundo)
+
+            espera = 0.0
+            if fichas >= 1:
+                fichas -= 1
+            else:
+                espera = (1 - fichas) / presupuesto.por_segundo
+
+            self._buckets[clave] = (fichas, ahora)
+            self._buckets.move_to_end(clave)
+            while len(self._buckets) > self.maximo:
+                self._buckets.popitem(last=False)
+
+        return espera
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class LimitadorRedis:
+    """
+    Mismos buckets compartidos entre workers. El cálculo corre en un script de Lua
+    con la hora de Redis, así que es atómico y no depende del reloj de cada worker.
+    Requiere el paquete ``redis``.
+    """
+
+    SCRIPT = """
+        local rafaga = tonumber(ARGV[1])
+        local por_segundo = tonumber(ARGV[2])
+        local tiempo = redis.call('TIME')
+        local ahora = tonumber(tiempo[1]) + tonumber(tiempo[2]) / 1000000
+
+        local datos = redis.call('HMGET', KEYS[1], 'fichas', 'ultimo')
+        local fichas = tonumber(datos[1]) or rafaga
+        local ultimo = tonumber(datos[2]) or ahora
+        fichas = math.min(rafaga, fichas + math.max(0, ahora - ultimo) * por_segundo)
+
+        local espera = 0
+        if fichas >= 1 then
+            fichas = fichas - 1
+        else
+            espera = (1 - fichas) / por_segundo
+        end
+
+        redis.call('HSET', KEYS[1], 'fichas', tostring(fichas), 'ultimo', tostring(ahora))
+        redis.call('PEXPIRE', KEYS[1], math.ceil(rafaga / por_segundo * 1000))
+        return tostring(espera)
+    """
+
+    def __init__(self, url: str, prefijo: str):
+        try:
+            from redis import asyncio as redis
+        except ImportError as e:
+            raise RuntimeError('El límite de peticiones en Redis necesita el paquete redis (pip install redis)') from e
+
+        self._cliente = redis.Redis.from_url(url)
+        self._script = self._cliente.register_script(self.SCRIPT)
+        self.prefijo = prefijo
+
+    async def tomar(self, clave: str, presupuesto: Presupuesto) -> float:
+        espera = await self._script(keys=[self.prefijo + clave], args=[presupuesto.rafaga, presupuesto.por_segundo])
+        return float(espera)
+
+
+class Admision:
+    """
+    Semáforo con cola acotada y espera máxima. Se implementa con futures propios en
+    lugar de ``asyncio.Semaphore`` para poder rechazar cuando la cola está llena y
+    para crearlo antes de que exista el event loop.
+    """
+
+    def __init__(self, maximo: int, cola: int, espera: float):
+        self.maximo = maximo
+        self.cola = cola
+        self.espera = espera
+        self.activas = 0
+        self._esperando = deque()
+
+    async def entrar(self) -> bool:
+        if self.activas < self.maximo and not self._esperando:
+            self.activas += 1
+            return True
+
+        if len(self._esperando) >= self.cola:
+            return False
+
+        turno = asyncio.get_running_loop().create_future()
+        self._esperando.append(turno)
+        try:
+            await asyncio.wait_for(asyncio.shield(turno), self.espera)
+            return True
+        except asyncio.TimeoutError:
+            if turno.done():
+                # El turno llegó justo al vencer la espera
+                return True
+            self._esperando.remove(turno)
+            return False
+        except BaseException:
+            # El cliente se fue; si ya le habían pasado el turno, se lo pasa al siguiente
+            if turno.done():
+                self.salir()
+            else:
+                self._esperando.remove(turno)
+            raise
+
+    def salir(self) -> None:
+        # El lugar pasa directo al siguiente en la cola sin liberarse
+        if self._esperando:
+            self._esperando.popleft().set_result(None)
+        else:
+            self.activas -= 1
+
+
+def crear_limitador(configuracion):
+    if configuracion.limites_backend == 'redis':
+        return LimitadorRedis(configuracion.limites_url, prefijo='entregas:limite:')
+
+    return LimitadorMemoria(configuracion.limites_maximo)
+
+
+def crear_presupuestos(configuracion) -> dict:
+    return {
+        nombre: Presupuesto(
+            getattr(configuracion, f'limite_{nombre}_rafaga'),
+            getattr(configuracion, f'limite_{nombre}_por_segundo')
+        )
+        for nombre in ('lectura', 'escritura', 'auth')
+    }
+
+
+async def rechazar(send, codigo: int, detalle: str, reintentar: float) -> None:
+    cuerpo = orjson.dumps({'detail': detalle})
+    await send({
+        'type': 'http.response.start',
+        'status': codigo,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(cuerpo)).encode()),
+            (b'retry-after', str(max(1, math.ceil(reintentar))).encode())
+        ]
+    })
+    await send({'type': 'http.response.body', 'body': cuerpo})
+
+
+class MiddlewareLimites:
+    """
+    Middleware ASGI que aplica el límite de peticiones y luego el control de
+    admisión. ``rutas`` asigna un presupuesto a pares ``(método, ruta)``; el resto
+    usa ``lectura`` si es GET y ``escritura`` si no. Las rutas en ``sin_admision``
+    (conexiones largas como SSE) cuentan para el límite pero no ocupan un lugar.
+    ``obtener_verificador`` regresa el ``VerificadorTokens`` y se llama hasta que hace falta.
+    """
+
+    def __init__(self, app, rutas: dict, obtener_verificador, sin_admision: tuple = (), configuracion=None):
+        configuracion = configuracion or obtener_configuracion()
+        self.app = app
+        self.rutas = [(metodo, patron_ruta(ruta), nombre) for (metodo, ruta), nombre in rutas.items()]
+        self.sin_admision = [patron_ruta(ruta) for ruta in sin_admision]
+        self.obtener_verificador = obtener_verificador
+        self.activo = configuracion.limites
+        self.presupuestos = crear_presupuestos(configuracion)
+        self.limitador = crear_limitador(configuracion)
+        self.admision = Admision(configuracion.admision_maximo, configuracion.admision_cola, configuracion.admision_espera)
+
+    def _presupuesto(self, scope) -> str:
+        for metodo, patron, nombre in self.rutas:
+            if scope['method'] == metodo and patron.match(scope['path']):
+                return nombre
+        return 'lectura' if scope['method'] in ('GET', 'HEAD') else 'escritura'
+
+    def _identidad(self, scope, nombre: str) -> str:
+        if nombre != 'auth':
+            for encabezado, valor in scope['headers']:
+                if encabezado == b'authorization':
+                    try:
+                        return 'u:' + str(self.obtener_verificador().verificar(token_bearer(valor.decode('latin-1')))['sub'])
+                    except TokenInvalido:
+                        break
+
+        cliente = scope.get('client')
+        return 'ip:' + (cliente[0] if cliente else '-')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        if self.activo:
+            nombre = self._presupuesto(scope)
+            espera = await self.limitador.tomar(f'{nombre}:{self._identidad(scope, nombre)}', self.presupuestos[nombre])
+            if espera > 0:
+                metricas.peticiones_rechazadas.incrementar(f'limite_{nombre}')
+                await rechazar(send, 429, 'Demasiadas peticiones, intenta más tarde', espera)
+                return
+
+        if any(patron.match(scope['path']) for patron in self.sin_admision):
+            await self.app(scope, receive, send)
+            return
+
+        if not await self.admision.entrar():
+            metricas.peticiones_rechazadas.incrementar('admision')
+            await rechazar(send, 503, 'El servicio está saturado, intenta más tarde', self.admision.espera)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.admision.salir()
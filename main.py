@@ -1,68 +1,156 @@
-from fastapi import FastAPI
+import hashlib
+import json
+from pathlib import Path
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import PlainTextResponse
+from fastapi.openapi.docs import get_redoc_html, get_swagger_ui_html
+from fastapi.openapi.utils import get_openapi
 from routers.auth import ruteador_auth
 from routers.ordenes import ruteador_ordenes
-from fastapi_jwt_auth import AuthJWT
-from database.schemas import Settings
-from fastapi.openapi.utils import get_openapi
-from fastapi.routing import APIRoute
-import re, inspect
+from config import obtener_configuracion
+from respuestas import RespuestaJSON
+from database.db import enrutador
+from eventos import bus
+from idempotencia import MiddlewareIdempotencia, almacen
+from limites import MiddlewareLimites
+from routers.dependencias import obtener_verificador
+import metricas
+
+TITULO = "API de Entrega de Comida"
+
+# Las rutas de documentación se sirven desde bytes precalculados (ver abajo)
+app = FastAPI(openapi_url=None, docs_url=None, redoc_url=None, default_response_class=RespuestaJSON)
+
+
+class DocumentoEstatico:
+    """Contenido que no cambia mientras corre el proceso, servido con ETag"""
+
+    def __init__(self, contenido: bytes, media_type: str):
+        self.contenido = contenido
+        self.media_type = media_type
+        self.etag = '"' + hashlib.sha256(contenido).hexdigest()[:32] + '"'
+
+    def responder(self, request: Request) -> Response:
+        headers = {'ETag': self.etag, 'Cache-Control': 'public, max-age=0, must-revalidate'}
+
+        if self.etag in request.headers.get('if-none-match', ''):
+            return Response(status_code=304, headers=headers)
 
-app = FastAPI()
+        return Response(self.contenido, media_type=self.media_type, headers=headers)
 
 
 def custom_openapi():
+    """
+    Genera el esquema una sola vez. Las rutas que piden token lo declaran con la
+    dependencia ``esquema_bearer`` (ver ``routers/dependencias.py``), así que el
+    esquema de seguridad sale de ``get_openapi`` sin revisar el código fuente.
+    """
     if app.openapi_schema:
         return app.openapi_schema
 
-    openapi_schema = get_openapi(
-        title = "API de Entrega de Comida",
+    app.openapi_schema = get_openapi(
+        title = TITULO,
         version = "0.1",
         description = "Una API para un servicio de entrega de comida",
         routes = app.routes,
     )
-
-    openapi_schema["components"]["securitySchemes"] = {
-        "Bearer Auth": {
-            "type": "apiKey",
-            "in": "header",
-            "name": "Authorization",
-            "description": "Enter: **'Bearer &lt;JWT&gt;'**, where JWT is the access token"
-        }
-    }
-
-    # Get all routes where jwt_optional() or jwt_required
-    api_router = [route for route in app.routes if isinstance(route, APIRoute)]
-
-    for route in api_router:
-        path = getattr(route, "path")
-        endpoint = getattr(route,"endpoint")
-        methods = [method.lower() for method in getattr(route, "methods")]
-
-        for method in methods:
-            # access_token
-            if (
-                re.search("jwt_required", inspect.getsource(endpoint)) or
-                re.search("fresh_jwt_required", inspect.getsource(endpoint)) or
-                re.search("jwt_optional", inspect.getsource(endpoint))
-            ):
-                openapi_schema["paths"][path][method]["security"] = [
-                    {
-                        "Bearer Auth": []
-                    }
-                ]
-
-    app.openapi_schema = openapi_schema
     return app.openapi_schema
 
 
 app.openapi = custom_openapi
 
+documentos = {}
+
+
+def exportar_openapi(ruta: str) -> None:
+    """Escribe el esquema para servirlo después con ``ENTREGAS_OPENAPI_ARCHIVO``"""
+    Path(ruta).write_text(json.dumps(app.openapi(), ensure_ascii=False), encoding='utf-8')
+
+
+@app.on_event('startup')
+def preparar_documentacion():
+    archivo = obtener_configuracion().openapi_archivo
+
+    if archivo and Path(archivo).is_file():
+        esquema = Path(archivo).read_bytes()
+    else:
+        esquema = json.dumps(app.openapi(), ensure_ascii=False).encode('utf-8')
+
+    documentos['/openapi.json'] = DocumentoEstatico(esquema, 'application/json')
+    documentos['/docs'] = DocumentoEstatico(
+        get_swagger_ui_html(openapi_url='/openapi.json', title=f'{TITULO} - Swagger UI').body,
+        'text/html'
+    )
+    documentos['/redoc'] = DocumentoEstatico(
+        get_redoc_html(openapi_url='/openapi.json', title=f'{TITULO} - ReDoc').body,
+        'text/html'
+    )
+
+
+@app.on_event('startup')
+async def iniciar_eventos():
+    await bus.iniciar()
+
+@app.on_event('shutdown')
+async def detener_eventos():
+    await bus.detener()
+
+
+@app.on_event('startup')
+async def iniciar_idempotencia():
+    await almacen.iniciar()
+
+@app.on_event('shutdown')
+async def detener_idempotencia():
+    await almacen.detener()
+
+
+@app.on_event('startup')
+async def comprobar_claves():
+    # Sin JWT_KEY (o sin la clave pública) la app falla al arrancar con un mensaje claro,
+    # no al importarla ni en la primera petición con token
+    obtener_verificador()
+
+
+@app.on_event('startup')
+async def iniciar_replicas():
+    if enrutador is not None:
+        await enrutador.iniciar()
+
+@app.on_event('shutdown')
+async def detener_replicas():
+    if enrutador is not None:
+        await enrutador.detener()
+
+
+@app.get('/openapi.json', include_in_schema=False)
+@app.get('/docs', include_in_schema=False)
+@app.get('/redoc', include_in_schema=False)
+async def documentacion(request: Request):
+    return documentos[request.url.path].responder(request)
+
+
+if obtener_configuracion().metricas:
+    @app.get('/metrics', include_in_schema=False)
+    async def exportar_metricas():
+        return PlainTextResponse(metricas.exportar(), media_type='text/plain; version=0.0.4')
+
 
+# Dentro del medidor, para que las respuestas repetidas también cuenten en las métricas
+app.add_middleware(
+    MiddlewareIdempotencia,
+    rutas=[('POST', '/ordenes/'), ('PUT', '/ordenes/{id_orden}')],
+    obtener_verificador=obtener_verificador
+)
+# Antes que la idempotencia: un reintento repetido también gasta del límite
+app.add_middleware(
+    MiddlewareLimites,
+    rutas={('POST', '/auth/registro'): 'auth', ('POST', '/auth/acceso'): 'auth'},
+    obtener_verificador=obtener_verificador,
+    sin_admision=('/ordenes/eventos', '/metrics')
+)
+app.add_middleware(metricas.MedidorPeticiones)
 
-@AuthJWT.load_config
-def get_config():
-    return Settings()
-    
 
 app.include_router(ruteador_ordenes)
-app.include_router(ruteador_auth)
\ No newline at end of file
+app.include_router(ruteador_auth)
@@ -0,0 +1,181 @@
+import bisect
+import logging
+import random
+import threading
+import time
+from contextvars import ContextVar
+from sqlalchemy import event
+from config import obtener_configuracion
+
+configuracion = obtener_configuracion()
+logger = logging.getLogger('entregas.sql')
+
+BUCKETS_SEGUNDOS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+BUCKETS_CONSULTAS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+
+class Contador:
+    def __init__(self, nombre: str, ayuda: str, etiqueta: str):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiqueta = etiqueta
+        self._valores = {}
+        self._candado = threading.Lock()
+
+    def incrementar(self, valor_etiqueta: str, cantidad: float = 1) -> None:
+        with self._candado:
+            self._valores[valor_etiqueta] = self._valores.get(valor_etiqueta, 0) + cantidad
+
+    def exportar(self) -> list:
+        lineas = [f'# HELP {self.nombre} {self.ayuda}', f'# TYPE {self.nombre} counter']
+        with self._candado:
+            for valor, total in sorted(self._valores.items()):
+                lineas.append(f'{self.nombre}{{{self.etiqueta}="{valor}"}} {total}')
+        return lineas
+
+
+class Histograma:
+    def __init__(self, nombre: str, ayuda: str, etiqueta: str, buckets: tuple):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiqueta = etiqueta
+        self.buckets = buckets
+        self._series = {}
+        self._candado = threading.Lock()
+
+    def observar(self, valor_etiqueta: str, valor: float) -> None:
+        indice = bisect.bisect_left(self.buckets, valor)
+        with self._candado:
+            serie = self._series.get(valor_etiqueta)
+            if serie is None:
+                # conteos por bucket (+Inf al final), suma y total
+                serie = self._series[valor_etiqueta] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            serie[0][indice] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def exportar(self) -> list:
+        lineas = [f'# HELP {self.nombre} {self.ayuda}', f'# TYPE {self.nombre} histogram']
+        with self._candado:
+            for valor, (conteos, suma, total) in sorted(self._series.items()):
+                acumulado = 0
+                for limite, conteo in zip((*self.buckets, '+Inf'), conteos):
+                    acumulado += conteo
+                    lineas.append(f'{self.nombre}_bucket{{{self.etiqueta}="{valor}",le="{limite}"}} {acumulado}')
+                lineas.append(f'{self.nombre}_sum{{{self.etiqueta}="{valor}"}} {suma}')
+                lineas.append(f'{self.nombre}_count{{{self.etiqueta}="{valor}"}} {total}')
+        return lineas
+
+
+sql_duracion = Histograma(
+    'entregas_sql_duracion_segundos',
+    'Duración de las consultas SQL muestreadas',
+    'operacion',
+    BUCKETS_SEGUNDOS
+)
+sql_lentas = Contador(
+    'entregas_sql_lentas_total',
+    'Consultas SQL muestreadas que superaron consultas_lentas_ms',
+    'operacion'
+)
+peticion_consultas = Histograma(
+    'entregas_peticion_consultas_sql',
+    'Consultas SQL ejecutadas por petición',
+    'ruta',
+    BUCKETS_CONSULTAS
+)
+peticion_duracion = Histograma(
+    'entregas_peticion_duracion_segundos',
+    'Duración de las peticiones HTTP',
+    'ruta',
+    BUCKETS_SEGUNDOS
+)
+
+peticiones_rechazadas = Contador(
+    'entregas_peticiones_rechazadas_total',
+    'Peticiones rechazadas por límite de peticiones (429) o por saturación (503)',
+    'motivo'
+)
+
+METRICAS = [sql_duracion, sql_lentas, peticion_consultas, peticion_duracion, peticiones_rechazadas]
+
+
+def exportar() -> str:
+    lineas = []
+    for metrica in METRICAS:
+        lineas.extend(metrica.exportar())
+    return '\n'.join(lineas) + '\n'
+
+
+# Consultas de la petición en curso; es una lista para que los hilos del
+# threadpool, que reciben una copia del contexto, incrementen el mismo contador
+_consultas_peticion: ContextVar = ContextVar('consultas_peticion', default=None)
+
+
+def _antes(conn, cursor, statement, parameters, context, executemany):
+    contador = _consultas_peticion.get()
+    if contador is not None:
+        contador[0] += 1
+
+    if configuracion.metricas_sql and random.random() < configuracion.metricas_muestreo:
+        conn.info.setdefault('entregas_inicio', []).append(time.perf_counter())
+    else:
+        conn.info.setdefault('entregas_inicio', []).append(None)
+
+def _despues(conn, cursor, statement, parameters, context, executemany):
+    inicio = conn.info['entregas_inicio'].pop()
+    if inicio is None:
+        return
+
+    duracion = time.perf_counter() - inicio
+    operacion = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTRA'
+    sql_duracion.observar(operacion, duracion)
+
+    if configuracion.consultas_lentas_ms is not None and duracion * 1000 >= configuracion.consultas_lentas_ms:
+        sql_lentas.incrementar(operacion)
+        logger.warning('Consulta lenta (%.1f ms): %s', duracion * 1000, ' '.join(statement.split())[:500])
+
+def _error(contexto):
+    # Si la consulta falla no pasa por after_cursor_execute
+    inicios = contexto.connection.info.get('entregas_inicio') if contexto.connection is not None else None
+    if inicios:
+        inicios.pop()
+
+
+def instrumentar(engine) -> None:
+    """Registra los hooks de medición en un engine síncrono (o en ``async_engine.sync_engine``)"""
+    if not (configuracion.metricas_sql or configuracion.metricas_peticiones):
+        return
+
+    event.listen(engine, 'before_cursor_execute', _antes)
+    event.listen(engine, 'after_cursor_execute', _despues)
+    event.listen(engine, 'handle_error', _error)
+
+
+class MedidorPeticiones:
+    """Middleware ASGI que mide la duración y las consultas SQL de cada petición"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not configuracion.metricas_peticiones:
+            await self.app(scope, receive, send)
+            return
+
+        contador = [0]
+        token = _consultas_peticion.set(contador)
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _consultas_peticion.reset(token)
+
+            endpoint = scope.get('endpoint')
+            if endpoint is not None:
+                ruta = f"{scope['method']} {endpoint.__name__}"
+                peticion_duracion.observar(ruta, time.perf_counter() - inicio)
+                peticion_consultas.observar(ruta, contador[0])
+
+                if contador[0] >= configuracion.consultas_por_peticion_alerta:
+                    logger.warning('%s ejecutó %d consultas SQL en una sola petición', ruta, contador[0])
@@ -0,0 +1,43 @@
+"""esquema inicial
+
+Tablas tal como las creaba ``Base.metadata.create_all``. Las bases de datos creadas
+antes de usar migraciones se marcan en esta revisión sin tocarlas (ver ``database.activate``).
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'usuario',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('username', sa.String(25), unique=True),
+        sa.Column('email', sa.String(80), unique=True),
+        sa.Column('password', sa.Text(), nullable=True),
+        sa.Column('es_admin', sa.Boolean()),
+        sa.Column('es_activo', sa.Boolean())
+    )
+    op.create_table(
+        'ordenes',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('cantidad', sa.Integer(), nullable=False),
+        sa.Column('estado', sa.Unicode(255)),
+        sa.Column('guisados', sa.Unicode(255)),
+        sa.Column('tipo', sa.Unicode(255)),
+        sa.Column('id_usuario', sa.Integer(), sa.ForeignKey('usuario.id'))
+    )
+
+
+def downgrade():
+    op.drop_table('ordenes')
+    op.drop_table('usuario')
@@ -0,0 +1,34 @@
+"""índices de órdenes
+
+``(id_usuario, id)`` cubre los listados por usuario paginados por ID y
+``(estado, id)`` las colas de despacho por estado. En PostgreSQL se crean
+con ``CONCURRENTLY`` para no bloquear escrituras en tablas grandes.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+INDICES = (
+    ('ix_ordenes_id_usuario_id', ['id_usuario', 'id']),
+    ('ix_ordenes_estado_id', ['estado', 'id'])
+)
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for nombre, columnas in INDICES:
+            op.create_index(nombre, 'ordenes', columnas, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for nombre, _ in INDICES:
+            op.drop_index(nombre, table_name='ordenes', postgresql_concurrently=True)
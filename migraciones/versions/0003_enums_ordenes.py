@@ -0,0 +1,61 @@
+"""enums nativos para estado, guisados y tipo
+
+Las columnas pasan de ``VARCHAR(255)`` (``ChoiceType``) a enums de PostgreSQL, que
+ocupan 4 bytes por valor sin importar el largo de la etiqueta. Las etiquetas son los
+mismos códigos que ya estaban guardados, así que los datos se convierten con un cast.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+ENUMS = (
+    ('estado', 'estado_orden', ('PROCESANDO', 'EN RUTA', 'ENTREGADO')),
+    ('guisados', 'guisado_orden', ('TINGA', 'CARNE', 'POLLO', 'CHAMPIÑONES', 'COMBINADO')),
+    ('tipo', 'tipo_orden', ('QUESADILLA', 'HUARACHE', 'SOPE'))
+)
+
+
+def upgrade():
+    conexion = op.get_bind()
+
+    # EstadoOrden usaba 'PENDIENTE' por defecto y ChoiceType no validaba al guardar
+    op.execute("UPDATE ordenes SET estado = 'PROCESANDO' WHERE estado = 'PENDIENTE'")
+
+    for columna, nombre, valores in ENUMS:
+        invalidos = conexion.execute(
+            sa.text(f'SELECT DISTINCT {columna} FROM ordenes WHERE {columna} <> ALL(:valores)'),
+            {'valores': list(valores)}
+        ).scalars().all()
+        if invalidos:
+            raise RuntimeError(f'ordenes.{columna} tiene valores fuera de {valores}: {invalidos}')
+
+        postgresql.ENUM(*valores, name=nombre).create(conexion)
+        op.alter_column(
+            'ordenes',
+            columna,
+            type_=postgresql.ENUM(*valores, name=nombre, create_type=False),
+            postgresql_using=f'{columna}::{nombre}'
+        )
+
+
+def downgrade():
+    conexion = op.get_bind()
+
+    for columna, nombre, valores in ENUMS:
+        op.alter_column(
+            'ordenes',
+            columna,
+            type_=sa.Unicode(255),
+            postgresql_using=f'{columna}::text'
+        )
+        postgresql.ENUM(*valores, name=nombre).drop(conexion)
@@ -0,0 +1,51 @@
+"""reclamo de órdenes por las estaciones de cocina
+
+``reclamada_por`` y ``reclamada_en`` registran qué estación tomó una orden de la cola
+de ``PROCESANDO`` y cuándo (ver ``POST /ordenes/cola/reclamar``). Son columnas nulas
+sin valor por defecto, así que agregarlas no reescribe la tabla.
+
+Los índices parciales solo contienen las órdenes en ``PROCESANDO``: uno las que nadie ha
+reclamado, en orden de llegada, y otro las reclamadas, por fecha, para encontrar los
+reclamos vencidos. Así reclamar no recorre las órdenes ya entregadas ni las que otra
+estación está preparando.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+INDICES = (
+    ('ix_ordenes_cola', ['id'], "estado = 'PROCESANDO' AND reclamada_en IS NULL"),
+    ('ix_ordenes_cola_reclamadas', ['reclamada_en'], "estado = 'PROCESANDO' AND reclamada_en IS NOT NULL")
+)
+
+
+def upgrade():
+    op.add_column('ordenes', sa.Column('reclamada_por', sa.Integer(), sa.ForeignKey('usuario.id'), nullable=True))
+    op.add_column('ordenes', sa.Column('reclamada_en', sa.DateTime(timezone=True), nullable=True))
+
+    with op.get_context().autocommit_block():
+        for nombre, columnas, condicion in INDICES:
+            op.create_index(
+                nombre, 'ordenes', columnas,
+                postgresql_where=sa.text(condicion),
+                postgresql_concurrently=True
+            )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for nombre, _, _ in INDICES:
+            op.drop_index(nombre, table_name='ordenes', postgresql_concurrently=True)
+
+    op.drop_column('ordenes', 'reclamada_en')
+    op.drop_column('ordenes', 'reclamada_por')
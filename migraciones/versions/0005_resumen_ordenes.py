@@ -0,0 +1,173 @@
+"""resúmenes de órdenes mantenidos por triggers
+
+``resumen_ordenes`` acumula órdenes y piezas por ``estado``, ``tipo`` y ``guisados``
+(a lo más 45 combinaciones) y ``resumen_ordenes_usuario`` por usuario y ``estado``.
+``GET /ordenes/estadisticas`` agrupa estas tablas en lugar de ``ordenes``, así que su
+costo no crece con el número de órdenes.
+
+Los triggers son por sentencia, con tablas de transición: un ``INSERT`` de un lote
+acumula una sola vez por combinación y un ``UPDATE`` que no cambia ninguna columna
+agrupada (reclamar órdenes de la cola) no escribe en los resúmenes. Cada conexión
+acumula en una de ``PARTICIONES`` filas por combinación, según su PID, para que las
+órdenes nuevas de distintas conexiones no esperen por el candado de la misma fila.
+
+Las columnas agrupadas pasan a ``NOT NULL`` porque forman la llave de los resúmenes;
+la API siempre las llena y ``estado`` nulo se toma como ``PROCESANDO``, su valor por
+defecto. Los resúmenes se llenan con ``ordenes`` bloqueada contra escrituras
+(``SHARE``), así que ninguna orden queda fuera ni se cuenta dos veces.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+PARTICIONES = 16
+
+COLUMNAS = (
+    ('estado', 'estado_orden'),
+    ('tipo', 'tipo_orden'),
+    ('guisados', 'guisado_orden')
+)
+
+# Filas de ordenes que entran (+1) y salen (-1) de los resúmenes en cada operación
+CAMBIOS = {
+    'INSERT': 'SELECT estado, tipo, guisados, id_usuario, cantidad, 1 AS signo FROM nuevas',
+    'DELETE': 'SELECT estado, tipo, guisados, id_usuario, cantidad, -1 AS signo FROM viejas',
+    'UPDATE': """
+        SELECT estado, tipo, guisados, id_usuario, cantidad, 1 AS signo FROM nuevas
+        UNION ALL
+        SELECT estado, tipo, guisados, id_usuario, cantidad, -1 AS signo FROM viejas
+    """
+}
+
+TRANSICIONES = {
+    'INSERT': 'NEW TABLE AS nuevas',
+    'DELETE': 'OLD TABLE AS viejas',
+    'UPDATE': 'NEW TABLE AS nuevas OLD TABLE AS viejas'
+}
+
+# ORDER BY en los INSERT: las transacciones bloquean las filas de los resúmenes
+# siempre en el mismo orden y no se bloquean mutuamente en ciclo
+FUNCION = """
+CREATE FUNCTION resumir_ordenes_{operacion}() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    WITH cambios AS ({cambios}),
+    resumen AS (
+        INSERT INTO resumen_ordenes AS r (estado, tipo, guisados, particion, ordenes, piezas)
+        SELECT estado, tipo, guisados, pg_backend_pid() % {particiones}, sum(signo), sum(signo * cantidad)
+        FROM cambios
+        GROUP BY estado, tipo, guisados
+        HAVING sum(signo) <> 0 OR sum(signo * cantidad) <> 0
+        ORDER BY estado, tipo, guisados
+        ON CONFLICT (estado, tipo, guisados, particion) DO UPDATE
+        SET ordenes = r.ordenes + excluded.ordenes, piezas = r.piezas + excluded.piezas
+    )
+    INSERT INTO resumen_ordenes_usuario AS r (id_usuario, estado, ordenes, piezas)
+    SELECT id_usuario, estado, sum(signo), sum(signo * cantidad)
+    FROM cambios
+    WHERE id_usuario IS NOT NULL
+    GROUP BY id_usuario, estado
+    HAVING sum(signo) <> 0 OR sum(signo * cantidad) <> 0
+    ORDER BY id_usuario, estado
+    ON CONFLICT (id_usuario, estado) DO UPDATE
+    SET ordenes = r.ordenes + excluded.ordenes, piezas = r.piezas + excluded.piezas;
+
+    RETURN NULL;
+END
+$$
+"""
+
+VACIAR = """
+CREATE FUNCTION vaciar_resumen_ordenes() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    TRUNCATE resumen_ordenes, resumen_ordenes_usuario;
+    RETURN NULL;
+END
+$$
+"""
+
+LLENAR = """
+INSERT INTO resumen_ordenes (estado, tipo, guisados, particion, ordenes, piezas)
+SELECT estado, tipo, guisados, 0, count(*), sum(cantidad)
+FROM ordenes
+GROUP BY estado, tipo, guisados;
+
+INSERT INTO resumen_ordenes_usuario (id_usuario, estado, ordenes, piezas)
+SELECT id_usuario, estado, count(*), sum(cantidad)
+FROM ordenes
+WHERE id_usuario IS NOT NULL
+GROUP BY id_usuario, estado;
+"""
+
+
+def upgrade():
+    conexion = op.get_bind()
+
+    op.execute('LOCK TABLE ordenes IN SHARE MODE')
+    op.execute("UPDATE ordenes SET estado = 'PROCESANDO' WHERE estado IS NULL")
+
+    for columna, _ in COLUMNAS[1:]:
+        nulas = conexion.scalar(sa.text(f'SELECT count(*) FROM ordenes WHERE {columna} IS NULL'))
+        if nulas:
+            raise RuntimeError(f'ordenes.{columna} es nulo en {nulas} órdenes')
+
+    for columna, _ in COLUMNAS:
+        op.alter_column('ordenes', columna, nullable=False)
+
+    op.create_table(
+        'resumen_ordenes',
+        *(
+            sa.Column(columna, postgresql.ENUM(name=nombre, create_type=False), primary_key=True)
+            for columna, nombre in COLUMNAS
+        ),
+        sa.Column('particion', sa.SmallInteger(), primary_key=True),
+        sa.Column('ordenes', sa.BigInteger(), nullable=False),
+        sa.Column('piezas', sa.BigInteger(), nullable=False)
+    )
+    op.create_table(
+        'resumen_ordenes_usuario',
+        sa.Column('id_usuario', sa.Integer(), sa.ForeignKey('usuario.id'), primary_key=True),
+        sa.Column('estado', postgresql.ENUM(name='estado_orden', create_type=False), primary_key=True),
+        sa.Column('ordenes', sa.BigInteger(), nullable=False),
+        sa.Column('piezas', sa.BigInteger(), nullable=False)
+    )
+
+    op.execute(LLENAR)
+
+    for operacion, cambios in CAMBIOS.items():
+        op.execute(FUNCION.format(operacion=operacion.lower(), cambios=cambios, particiones=PARTICIONES))
+        op.execute(
+            f'CREATE TRIGGER resumir_ordenes_{operacion.lower()} AFTER {operacion} ON ordenes '
+            f'REFERENCING {TRANSICIONES[operacion]} '
+            f'FOR EACH STATEMENT EXECUTE FUNCTION resumir_ordenes_{operacion.lower()}()'
+        )
+
+    op.execute(VACIAR)
+    op.execute(
+        'CREATE TRIGGER vaciar_resumen_ordenes AFTER TRUNCATE ON ordenes '
+        'FOR EACH STATEMENT EXECUTE FUNCTION vaciar_resumen_ordenes()'
+    )
+
+
+def downgrade():
+    op.execute('DROP TRIGGER vaciar_resumen_ordenes ON ordenes')
+    op.execute('DROP FUNCTION vaciar_resumen_ordenes()')
+
+    for operacion in CAMBIOS:
+        op.execute(f'DROP TRIGGER resumir_ordenes_{operacion.lower()} ON ordenes')
+        op.execute(f'DROP FUNCTION resumir_ordenes_{operacion.lower()}()')
+
+    op.drop_table('resumen_ordenes_usuario')
+    op.drop_table('resumen_ordenes')
+
+    for columna, _ in COLUMNAS:
+        op.alter_column('ordenes', columna, nullable=True)
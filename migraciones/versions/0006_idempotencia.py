@@ -0,0 +1,41 @@
+"""respuestas guardadas para Idempotency-Key
+
+Con ``ENTREGAS_IDEMPOTENCIA_BACKEND=postgres`` cada petición con ``Idempotency-Key``
+reserva su clave insertando una fila sin ``codigo``; al terminar se guarda la
+respuesta. Todos los workers ven la misma tabla, así que un reintento que cae en otro
+worker recibe la respuesta guardada en lugar de crear otra orden.
+
+``expira`` indexado para que la limpieza periódica de claves vencidas no recorra la
+tabla completa.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'idempotencia',
+        sa.Column('clave', sa.Text(), primary_key=True),
+        sa.Column('huella', sa.LargeBinary(), nullable=False),
+        sa.Column('codigo', sa.SmallInteger(), nullable=True),
+        sa.Column('encabezados', postgresql.JSONB(), nullable=True),
+        sa.Column('cuerpo', sa.LargeBinary(), nullable=True),
+        sa.Column('expira', sa.DateTime(timezone=True), nullable=False)
+    )
+    op.create_index('ix_idempotencia_expira', 'idempotencia', ['expira'])
+
+
+def downgrade():
+    op.drop_index('ix_idempotencia_expira', table_name='idempotencia')
+    op.drop_table('idempotencia')
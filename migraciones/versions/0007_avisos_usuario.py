@@ -0,0 +1,50 @@
+"""avisos de cambios en usuario
+
+Los tokens traen ``id`` y ``es_admin`` y ``routers.dependencias`` guarda los principales
+en un cache por proceso. Estos triggers avisan con ``pg_notify`` en el canal
+``usuarios_cambios`` (con el username anterior) cada vez que cambia el ``username`` o
+``es_admin`` de un usuario, o se borra, venga el cambio de la API, de otro worker o de
+SQL escrito a mano. Con ``ENTREGAS_EVENTOS_BACKEND=postgres`` cada worker escucha el
+canal e invalida al usuario. Los avisos se entregan al confirmar la transacción.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+CANAL = 'usuarios_cambios'
+
+FUNCION = f"""
+CREATE FUNCTION avisar_cambio_usuario() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_notify('{CANAL}', OLD.username);
+    RETURN NULL;
+END
+$$
+"""
+
+
+def upgrade():
+    op.execute(FUNCION)
+    op.execute(
+        'CREATE TRIGGER avisar_cambio_usuario_update AFTER UPDATE OF username, es_admin ON usuario '
+        'FOR EACH ROW WHEN (OLD.username IS DISTINCT FROM NEW.username OR OLD.es_admin IS DISTINCT FROM NEW.es_admin) '
+        'EXECUTE FUNCTION avisar_cambio_usuario()'
+    )
+    op.execute(
+        'CREATE TRIGGER avisar_cambio_usuario_delete AFTER DELETE ON usuario '
+        'FOR EACH ROW EXECUTE FUNCTION avisar_cambio_usuario()'
+    )
+
+
+def downgrade():
+    op.execute('DROP TRIGGER avisar_cambio_usuario_delete ON usuario')
+    op.execute('DROP TRIGGER avisar_cambio_usuario_update ON usuario')
+    op.execute('DROP FUNCTION avisar_cambio_usuario()')
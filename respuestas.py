@@ -0,0 +1,12 @@
+import orjson
+from fastapi.responses import JSONResponse
+
+
+class RespuestaJSON(JSONResponse):
+    """
+    ``JSONResponse`` que serializa con orjson. Las rutas que la regresan ya armada,
+    con dicts de tipos básicos, se saltan además el ``jsonable_encoder`` de FastAPI.
+    """
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
@@ -1,26 +1,36 @@
-from fastapi import APIRouter, Body, status, HTTPException, Depends
+from typing import List, Optional
+from fastapi import APIRouter, Body, status, HTTPException, Depends, Security
 from fastapi.encoders import jsonable_encoder
-from fastapi_jwt_auth import AuthJWT
-from sqlalchemy import select
-from database.db import Session, engine
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+from database.db import leer_columnas, obtener_sesion, obtener_sesion_lectura, restriccion_violada
 from database.schemas import (
     UsuarioRegistro, 
     UsuarioBase, 
     UsuarioLogin, 
-    UsuarioLoginOut
+    UsuarioLoginOut,
+    UsuarioOut,
+    PROYECCION_USUARIO
     )
 from database.models import Usuario
-from werkzeug.security import (
-    generate_password_hash, 
-    check_password_hash
+from respuestas import RespuestaJSON
+from routers.dependencias import (
+    Principal,
+    cargar_principal,
+    claims_usuario,
+    esquema_bearer,
+    obtener_firmador,
+    obtener_verificador,
+    usuario_refresh
     )
+from seguridad import generar_hash, verificar_password
+from tokens import FirmadorTokens, TokenInvalido, VerificadorTokens, token_bearer
 
 ruteador_auth = APIRouter(
     prefix='/auth',
     tags=['Autenticación']
 )
 
-session = Session(bind=engine)
 
 @ruteador_auth.post(
     path='/registro',
@@ -28,7 +38,7 @@ session = Session(bind=engine)
     response_model=UsuarioBase,
     status_code=status.HTTP_201_CREATED
     )
-def registro(usuario: UsuarioRegistro = Body(...)) -> UsuarioBase:
+async def registro(usuario: UsuarioRegistro = Body(...), sesion = Depends(obtener_sesion)) -> UsuarioBase:
     """
     # Registro
     
@@ -46,45 +56,44 @@ def registro(usuario: UsuarioRegistro = Body(...)) -> UsuarioBase:
     - **username**: username del usuario creado
     
     """
-    email_db = session.query(Usuario).filter(Usuario.email == usuario.email).first()
-    
-    if email_db is not None:
-        return HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail='El email ya está registrado, intenta con uno nuevo'
+    try:
+        id_usuario = await sesion.scalar(
+            insert(Usuario)
+            .values(
+                username=usuario.username,
+                email=usuario.email,
+                password=await generar_hash(usuario.password),
+                es_activo=usuario.es_activo,
+                es_admin=usuario.es_admin
             )
-
-    username_db = session.query(Usuario).filter(Usuario.username == usuario.username).first()
-    
-    if username_db is not None:
-        return HTTPException(
+            .returning(Usuario.id)
+        )
+        await sesion.commit()
+    except IntegrityError as e:
+        await sesion.rollback()
+        
+        if 'email' in restriccion_violada(e):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail='El email ya está registrado, intenta con uno nuevo'
+                )
+        
+        raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail='El nombre de usuario ya está registrado, intenta con uno nuevo'
             )
     
-    nuevo_usuario = Usuario(
-        username=usuario.username,
-        email=usuario.email,
-        password=generate_password_hash(usuario.password),
-        es_activo=usuario.es_activo,
-        es_admin=usuario.es_admin
-    )
-    
-    session.add(nuevo_usuario)
-    
-    result = session.execute(
-        select(Usuario.id).where(Usuario.username == usuario.username)
-    )
-    
-    session.commit()
-    
-    return UsuarioBase(username=nuevo_usuario.username, id=result.all()[0][0], mensaje='Registro correcto')
+    return UsuarioBase(username=usuario.username, id=id_usuario, mensaje='Registro correcto')
         
 @ruteador_auth.post(
     path='/acceso',
     status_code=status.HTTP_200_OK
     )
-def entrar(usuario: UsuarioLogin = Body(...), Authorize: AuthJWT = Depends()):
+async def entrar(
+    usuario: UsuarioLogin = Body(...),
+    firmador: FirmadorTokens = Depends(obtener_firmador),
+    sesion = Depends(obtener_sesion)
+    ):
     """
     # Acceso
     
@@ -99,16 +108,28 @@ def entrar(usuario: UsuarioLogin = Body(...), Authorize: AuthJWT = Depends()):
     - **Refresh**: refresh token
     - **Mensaje**: mensaje 
     """
-    usuario_db = session.query(Usuario).filter(Usuario.username == usuario.username).first()
-    
-    if usuario_db and check_password_hash(usuario_db.password, usuario.password):
-        access_token = Authorize.create_access_token(subject=usuario_db.username)
-        refresh_token = Authorize.create_refresh_token(subject=usuario_db.username)
+    usuario_db = (await sesion.execute(
+        select(Usuario.id, Usuario.username, Usuario.es_admin, Usuario.password)
+        .where(Usuario.username == usuario.username)
+    )).first()
+    # Devuelve la conexión al pool antes de bcrypt: una ráfaga de accesos no debe
+    # acaparar el pool mientras espera al executor de hashes
+    await sesion.commit()
+    
+    valida, requiere_rehash = (False, False) if usuario_db is None else await verificar_password(usuario_db.password, usuario.password)
+    
+    if valida:
+        if requiere_rehash:
+            nuevo_hash = await generar_hash(usuario.password)
+            await sesion.execute(
+                update(Usuario)
+                .where(Usuario.id == usuario_db.id)
+                .values(password=nuevo_hash)
+            )
+            await sesion.commit()
         
-        response_token = {
-            "access": access_token,
-            "refresh": refresh_token
-        }
+        claims = claims_usuario(Principal(id=usuario_db.id, username=usuario_db.username, es_admin=usuario_db.es_admin))
+        response_token = firmador.crear_tokens(usuario_db.username, claims)
         
         response_usuario = dict(UsuarioLoginOut(username=usuario.username))
         
@@ -125,58 +146,49 @@ def entrar(usuario: UsuarioLogin = Body(...), Authorize: AuthJWT = Depends()):
     path='/refresh',
     status_code=status.HTTP_200_OK
 )
-def refresh_token(Authorize: AuthJWT = Depends()):
+async def refresh_token(
+    firmador: FirmadorTokens = Depends(obtener_firmador),
+    verificador: VerificadorTokens = Depends(obtener_verificador),
+    sesion = Depends(obtener_sesion),
+    token: Optional[str] = Security(esquema_bearer)
+    ):
     """
     # Refresh Token
     
     ## Crea un fresh token, requiere de un refresh token previo
     """
     try: 
-        Authorize.jwt_refresh_token_required()
-    except Exception as e:
+        claims = verificador.verificar(token_bearer(token), tipo='refresh')
+    except TokenInvalido as e:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=f'Por favor asegurate de contar con un refresh token {e}'
         )
     
-    usuario_actual = Authorize.get_jwt_subject()
-    access_token = Authorize.create_access_token(subject=usuario_actual)
-    refresh_token = Authorize.create_refresh_token(subject=usuario_actual)
+    usuario_actual = await cargar_principal(claims['sub'], sesion)
+    claims = claims_usuario(usuario_actual)
     
-    return jsonable_encoder(
-        {
-            "access": access_token,
-            "refresh": refresh_token
-        }
-    )
+    return jsonable_encoder(firmador.crear_tokens(usuario_actual.username, claims))
     
 @ruteador_auth.get(
     path='/usuarios',
     status_code=status.HTTP_200_OK,
     summary='Muestra todos los usuarios de la aplicación',
+    response_model=List[UsuarioOut],
     tags=['Solo Administración']
 )
-def mostrar_usuarios(Authorize: AuthJWT = Depends()):
+async def mostrar_usuarios(usuario: Principal = Depends(usuario_refresh), sesion = Depends(obtener_sesion_lectura)):
     """
     # Mostrar Usuarios
     
     ## Muestra a todos los usuarios de la aplicación, requiere permisos de administración y token
-    """
-    try: 
-        Authorize.jwt_refresh_token_required()
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail=f'Por favor asegurate de contar con un refresh token {e}'
-        )
-    
-    usuario_actual = Authorize.get_jwt_subject()
-    usuario = session.query(Usuario).filter(Usuario.username == usuario_actual).first()
     
+    Retorna el **id**, **username**, **email**, **es_activo** y **es_admin** de cada usuario
+    """
     if usuario.es_admin:
-        usuarios = session.query(Usuario).all()
+        usuarios = await leer_columnas(sesion, select(*PROYECCION_USUARIO.columnas).order_by(Usuario.id))
         
-        return jsonable_encoder(usuarios)
+        return RespuestaJSON(PROYECCION_USUARIO.dicts(usuarios))
 
     raise HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
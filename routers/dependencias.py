@@ -0,0 +1,188 @@
+import time
+from functools import lru_cache
+from typing import NamedTuple, Optional
+from fastapi import Depends, HTTPException, Query, Security, status
+from fastapi.security import APIKeyHeader
+from sqlalchemy import select
+from cache import CacheTTL
+from config import obtener_configuracion
+from database.db import obtener_sesion
+from database.replicas import usuario_peticion
+from database.models import Usuario
+from eventos import bus
+from tokens import FirmadorTokens, TokenInvalido, VerificadorTokens, crear_firmador, crear_verificador, token_bearer
+
+configuracion = obtener_configuracion()
+
+
+class Principal(NamedTuple):
+    id: int
+    username: str
+    es_admin: bool
+
+
+# Declara en el esquema de OpenAPI qué rutas piden token y entrega el header a las dependencias
+esquema_bearer = APIKeyHeader(
+    name='Authorization',
+    scheme_name='Bearer Auth',
+    description="Enter: **'Bearer &lt;JWT&gt;'**, where JWT is the access token",
+    auto_error=False
+)
+
+@lru_cache()
+def obtener_verificador() -> VerificadorTokens:
+    """
+    Verifica cada token una vez por petición y recuerda sus claims hasta que expira. Se
+    crea al arrancar la app (``main.comprobar_claves``), no al importarla.
+    """
+    return crear_verificador(configuracion)
+
+
+@lru_cache()
+def obtener_firmador() -> FirmadorTokens:
+    """Se crea al emitir el primer token: los workers que solo verifican no necesitan la clave privada"""
+    return crear_firmador(configuracion)
+
+
+# Principales resueltos recientemente, por username
+principales = CacheTTL(
+    maximo=configuracion.cache_usuarios_maximo,
+    ttl=configuracion.cache_usuarios_ttl
+)
+
+# Momento en que cambió cada usuario; los tokens emitidos antes traen claims viejos.
+# Basta con recordarlo mientras siga vivo algún access token emitido antes del cambio.
+invalidaciones = CacheTTL(
+    maximo=configuracion.cache_usuarios_maximo,
+    ttl=configuracion.jwt_expiracion_access
+)
+
+
+def claims_usuario(principal: Principal) -> dict:
+    """Claims extra que llevan los tokens para no consultar al usuario en cada petición"""
+    return {
+        'id': principal.id,
+        'es_admin': principal.es_admin
+    }
+
+# Momento desde el cual ningún token emitido antes es confiable (avisos perdidos)
+invalidacion_global = 0.0
+
+def invalidar_principal(username: Optional[str]) -> None:
+    """Olvida al usuario (o a todos, con None) y desconfía de los claims de sus tokens vigentes"""
+    global invalidacion_global
+
+    if username is None:
+        principales.limpiar()
+        invalidacion_global = time.time()
+    else:
+        principales.invalidar(username)
+        invalidaciones.guardar(username, time.time())
+
+# Los triggers de usuario avisan por el bus de eventos, en todos los workers, sin
+# importar si el cambio vino de la API o de SQL escrito a mano. Con el backend
+# ``memoria`` no llegan avisos: los claims de un token valen hasta que expira.
+bus.al_cambiar_usuario(invalidar_principal)
+
+
+async def cargar_principal(username: str, sesion) -> Principal:
+    """Busca al usuario en el cache o, si no está, en la base de datos"""
+    principal = principales.obtener(username)
+    if principal is not None:
+        return principal
+
+    inicio = time.time()
+    fila = (await sesion.execute(
+        select(Usuario.id, Usuario.es_admin).where(Usuario.username == username)
+    )).first()
+
+    if fila is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='El usuario del token ya no existe'
+        )
+
+    principal = Principal(id=fila.id, username=username, es_admin=bool(fila.es_admin))
+    # Si el usuario cambió mientras se leía, lo leído puede ser anterior al cambio
+    if max(invalidaciones.obtener(username, 0.0), invalidacion_global) < inicio:
+        principales.guardar(username, principal)
+
+    return principal
+
+async def resolver_principal(claims: dict, sesion) -> Principal:
+    """
+    Obtiene el principal de los claims de un token ya validado. Los usa directamente
+    salvo que el usuario haya cambiado después de emitir el token.
+    """
+    username = claims['sub']
+    invalidado = max(invalidaciones.obtener(username, 0.0), invalidacion_global)
+
+    if 'id' in claims and 'es_admin' in claims and claims['iat'] > invalidado:
+        principal = Principal(id=claims['id'], username=username, es_admin=claims['es_admin'])
+    else:
+        principal = await cargar_principal(username, sesion)
+
+    # Para que sus lecturas vean sus propias escrituras aunque haya réplicas
+    usuario_peticion.set(principal.id)
+
+    return principal
+
+
+async def usuario_actual(
+    sesion = Depends(obtener_sesion),
+    verificador: VerificadorTokens = Depends(obtener_verificador),
+    token: Optional[str] = Security(esquema_bearer)
+    ) -> Principal:
+    """Dependencia que valida el access token y regresa al usuario que hace la petición"""
+    try:
+        claims = verificador.verificar(token_bearer(token))
+    except TokenInvalido as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='Token inválido o token no proporcionado'
+        )
+
+    return await resolver_principal(claims, sesion)
+
+async def usuario_refresh(
+    sesion = Depends(obtener_sesion),
+    verificador: VerificadorTokens = Depends(obtener_verificador),
+    token: Optional[str] = Security(esquema_bearer)
+    ) -> Principal:
+    """Igual que ``usuario_actual`` pero exige un refresh token"""
+    try:
+        claims = verificador.verificar(token_bearer(token), tipo='refresh')
+    except TokenInvalido as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=f'Por favor asegurate de contar con un refresh token {e}'
+        )
+
+    return await resolver_principal(claims, sesion)
+
+async def usuario_websocket(
+    token: Optional[str] = Query(default=None, description='Access token'),
+    sesion = Depends(obtener_sesion),
+    verificador: VerificadorTokens = Depends(obtener_verificador)
+    ) -> Optional[Principal]:
+    """
+    Valida el access token de un WebSocket. Llega como query parameter porque el
+    navegador no deja mandar headers al abrir la conexión; regresa None si no es válido
+    para que la ruta cierre el socket con el código adecuado.
+    """
+    if not token:
+        return None
+
+    try:
+        return await resolver_principal(verificador.verificar(token), sesion)
+    except (TokenInvalido, HTTPException):
+        return None
+
+async def admin_actual(usuario: Principal = Depends(usuario_actual)) -> Principal:
+    if not usuario.es_admin:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='No eres administrador'
+        )
+
+    return usuario
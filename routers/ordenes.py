@@ -1,18 +1,283 @@
-from fastapi import APIRouter, Body, Depends, Path, status, HTTPException
+import asyncio
+import hashlib
+import json
+from datetime import timedelta
+from typing import List, NamedTuple, Optional
+import orjson
+from fastapi import APIRouter, Body, Depends, Path, Query, Request, Response, WebSocket, status, HTTPException
 from fastapi.encoders import jsonable_encoder
-from fastapi_jwt_auth import AuthJWT
-from sqlalchemy import select
-from database.models import Usuario, Orden
-from database.schemas import OrdenBase, EstadoOrden
-from database.db import Session, engine
+from fastapi.responses import StreamingResponse
+from sqlalchemy import BigInteger, cast, delete, func, insert, literal_column, select, tuple_, update
+from cache import CacheMemoria, CacheRedis
+from config import obtener_configuracion
+from database.models import Estado, Guisado, Orden, ResumenOrdenes, ResumenOrdenesUsuario, Tipo
+from database.schemas import (
+    ActualizacionLote,
+    ActualizacionLoteOut,
+    BorradoLoteOut,
+    CambiosOrden,
+    OrdenBase,
+    OrdenLote,
+    OrdenLoteOut,
+    EstadoOrden,
+    EstadisticasOrdenes,
+    EstadisticasUsuario,
+    TransicionOrdenes,
+    TransicionOrdenesOut,
+    SeleccionOrdenes,
+    PROYECCION_ORDEN
+    )
+from database.db import leer_columnas, obtener_sesion, obtener_sesion_lectura, transmitir_columnas
+from database.replicas import en_replica
+from eventos import bus
+from respuestas import RespuestaJSON
+from routers.dependencias import Principal, admin_actual, usuario_actual, usuario_websocket
+
+configuracion = obtener_configuracion()
 
-session = Session(bind=engine)
+# Órdenes ya serializadas, por ID; se invalidan al modificarlas o borrarlas
+if configuracion.cache_ordenes_backend == 'redis':
+    cache_ordenes = CacheRedis(configuracion.cache_ordenes_url, configuracion.cache_ordenes_ttl, prefijo='entregas:orden:')
+else:
+    cache_ordenes = CacheMemoria(configuracion.cache_ordenes_maximo, configuracion.cache_ordenes_ttl)
 
 ruteador_ordenes = APIRouter(
     prefix='/ordenes',
     tags=['Órdenes']
 )
 
+
+class ParametrosListado:
+    """Parámetros de paginación, filtrado y formato comunes a los listados de órdenes"""
+
+    def __init__(
+        self,
+        despues_de: Optional[int] = Query(
+            default=None,
+            ge=0,
+            description='Cursor: regresa las órdenes con ID mayor a este (header X-Siguiente-Cursor de la página anterior)'
+        ),
+        limite: Optional[int] = Query(
+            default=None,
+            ge=1,
+            le=configuracion.listado_limite_maximo,
+            description=f'Órdenes por página; por defecto {configuracion.listado_limite} (en NDJSON por defecto todas)'
+        ),
+        estado: Optional[Estado] = Query(
+            default=None,
+            description='Filtra por estado (PROCESANDO, EN RUTA, ENTREGADO)'
+        ),
+        tipo: Optional[Tipo] = Query(
+            default=None,
+            description='Filtra por tipo de comida (QUESADILLA, HUARACHE, SOPE)'
+        ),
+        guisados: Optional[Guisado] = Query(
+            default=None,
+            description='Filtra por guisado (TINGA, CARNE, POLLO, CHAMPIÑONES, COMBINADO)'
+        ),
+        formato: str = Query(
+            default='json',
+            regex='^(json|ndjson)$',
+            description='json regresa una página, ndjson transmite una orden por línea'
+        )
+    ):
+        self.despues_de = despues_de
+        self.limite = limite
+        self.estado = estado
+        self.tipo = tipo
+        self.guisados = guisados
+        self.formato = formato
+
+    def consulta(self, *condiciones):
+        consulta = select(*PROYECCION_ORDEN.columnas).where(*condiciones).order_by(Orden.id)
+
+        if self.despues_de is not None:
+            consulta = consulta.where(Orden.id > self.despues_de)
+        if self.estado is not None:
+            consulta = consulta.where(Orden.estado == self.estado)
+        if self.tipo is not None:
+            consulta = consulta.where(Orden.tipo == self.tipo)
+        if self.guisados is not None:
+            consulta = consulta.where(Orden.guisados == self.guisados)
+
+        return consulta
+
+
+async def listar_ordenes(sesion, parametros: ParametrosListado, *condiciones):
+    """
+    Regresa una página de órdenes paginada por ID, o un ``StreamingResponse`` NDJSON
+    que lee las filas en bloques desde un cursor del lado del servidor. Solo se leen
+    las columnas de ``OrdenBase``, como filas de Core (sin identity map ni entidades),
+    y se convierten en dicts hasta serializarlas con orjson.
+    """
+    consulta = parametros.consulta(*condiciones)
+
+    if parametros.formato == 'ndjson':
+        if parametros.limite is not None:
+            consulta = consulta.limit(parametros.limite)
+
+        resultado = await transmitir_columnas(sesion, consulta)
+
+        async def lineas():
+            async for bloque in resultado.partitions(configuracion.listado_bloque):
+                yield b''.join(orjson.dumps(orden) + b'\n' for orden in PROYECCION_ORDEN.dicts(bloque))
+
+        return StreamingResponse(lineas(), media_type='application/x-ndjson')
+
+    limite = parametros.limite or configuracion.listado_limite
+    ordenes = PROYECCION_ORDEN.dicts(await leer_columnas(sesion, consulta.limit(limite)))
+
+    headers = {}
+    if len(ordenes) == limite:
+        headers['X-Siguiente-Cursor'] = str(ordenes[-1]['id'])
+
+    return RespuestaJSON(ordenes, headers=headers)
+
+
+def sentencia_reclamo(cantidad: int, id_usuario: int, vencidas: bool = False, saltar_bloqueadas: bool = True):
+    """
+    UPDATE que marca como reclamadas hasta ``cantidad`` órdenes en PROCESANDO y regresa
+    sus columnas: las que nadie ha reclamado, en orden de llegada, o con ``vencidas`` las
+    de reclamos más viejos que ``cola_reclamo_expira``. Con ``saltar_bloqueadas`` las filas
+    que otra transacción está reclamando se saltan (``SKIP LOCKED``) en lugar de esperarla.
+    """
+    # Constante en el SQL y no parámetro, para que el planificador use los índices parciales de la cola
+    procesando = Orden.estado == literal_column(f"'{Estado.PROCESANDO.value}'")
+
+    if vencidas:
+        condicion = Orden.reclamada_en < func.now() - timedelta(seconds=configuracion.cola_reclamo_expira)
+        orden = Orden.reclamada_en
+    else:
+        condicion = Orden.reclamada_en.is_(None)
+        orden = Orden.id
+
+    siguientes = (
+        select(Orden.id)
+        .where(procesando, condicion)
+        .order_by(orden)
+        .limit(cantidad)
+        .with_for_update(skip_locked=saltar_bloqueadas)
+        .cte('siguientes')
+    )
+
+    return (
+        update(Orden)
+        .where(Orden.id == siguientes.c.id)
+        .values(reclamada_por=id_usuario, reclamada_en=func.now())
+        .returning(*PROYECCION_ORDEN.columnas)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def suma(columna):
+    """``sum`` de una columna BIGINT, que PostgreSQL regresa como NUMERIC, de vuelta a entero"""
+    return cast(func.sum(columna), BigInteger)
+
+
+def valores_estado(estado: Estado) -> dict:
+    valores = {'estado': estado}
+    if estado == Estado.PROCESANDO:
+        # Regresan a la cola como si nadie las hubiera reclamado
+        valores.update(reclamada_por=None, reclamada_en=None)
+    return valores
+
+
+def condiciones_seleccion(seleccion: SeleccionOrdenes) -> list:
+    if seleccion.ids is not None:
+        return [Orden.id.in_(seleccion.ids)]
+
+    condiciones = []
+    if seleccion.filtro.estado is not None:
+        condiciones.append(Orden.estado == seleccion.filtro.estado)
+    if seleccion.filtro.id_usuario is not None:
+        condiciones.append(Orden.id_usuario == seleccion.filtro.id_usuario)
+    return condiciones
+
+
+async def clasificar_restantes(sesion, ids: Optional[List[int]], afectadas: set) -> dict:
+    """Separa los IDs pedidos que no se tocaron en los que no existen y los que no eran del usuario"""
+    restantes = [id_orden for id_orden in dict.fromkeys(ids or ()) if id_orden not in afectadas]
+    if not restantes:
+        return {}
+
+    existentes = set((await sesion.execute(select(Orden.id).where(Orden.id.in_(restantes)))).scalars().all())
+
+    return {
+        'no_encontradas': [id_orden for id_orden in restantes if id_orden not in existentes],
+        'prohibidas': [id_orden for id_orden in restantes if id_orden in existentes]
+    }
+
+
+class OrdenSerializada(NamedTuple):
+    """Cuerpo JSON de una orden listo para responder, junto con su dueño y su ETag"""
+    id_usuario: int
+    etag: str
+    contenido: bytes
+
+    @classmethod
+    def de_orden(cls, orden: dict) -> 'OrdenSerializada':
+        contenido = orjson.dumps(orden)
+        return cls(orden['id_usuario'], '"' + hashlib.sha1(contenido).hexdigest() + '"', contenido)
+
+    @classmethod
+    def de_bytes(cls, datos: bytes) -> 'OrdenSerializada':
+        id_usuario, etag, contenido = datos.split(b' ', 2)
+        return cls(int(id_usuario), etag.decode(), contenido)
+
+    def a_bytes(self) -> bytes:
+        return b'%d %s ' % (self.id_usuario, self.etag.encode()) + self.contenido
+
+    def responder(self, request: Request) -> Response:
+        headers = {'ETag': self.etag, 'Cache-Control': 'private, no-cache'}
+
+        if self.etag in request.headers.get('if-none-match', ''):
+            return Response(status_code=304, headers=headers)
+
+        return Response(self.contenido, media_type='application/json', headers=headers)
+
+
+async def orden_serializada(id_orden: int, sesion) -> Optional[OrdenSerializada]:
+    """Busca la orden en el cache y, si no está, la lee de la base de datos y la guarda"""
+    datos = await cache_ordenes.obtener(str(id_orden))
+    if datos is not None:
+        return OrdenSerializada.de_bytes(datos)
+
+    # Si la orden se invalida mientras se lee, guardar lo leído dejaría la versión vieja
+    version = await cache_ordenes.version(str(id_orden))
+
+    filas = await leer_columnas(sesion, select(*PROYECCION_ORDEN.columnas).where(Orden.id == id_orden))
+    if not filas:
+        return None
+
+    serializada = OrdenSerializada.de_orden(PROYECCION_ORDEN.dict(filas[0]))
+    # Una réplica atrasada dejaría en el cache una versión vieja después de invalidarla
+    if not en_replica(sesion):
+        await cache_ordenes.guardar(str(id_orden), serializada.a_bytes(), version)
+
+    return serializada
+
+
+async def flujo_eventos(id_usuario: int):
+    """Server-Sent Events con los cambios de estado de las órdenes del usuario"""
+    with bus.suscribir(id_usuario) as suscripcion:
+        yield ': conectado\n\n'
+
+        while True:
+            evento = await suscripcion.siguiente(configuracion.eventos_keepalive)
+
+            if evento is None:
+                yield ': ping\n\n'
+            else:
+                yield f'event: estado\ndata: {json.dumps(evento, ensure_ascii=False)}\n\n'
+
+async def esperar_cierre(websocket: WebSocket, suscripcion) -> None:
+    """Lee el socket hasta que el cliente se desconecta y entonces cierra la suscripción"""
+    try:
+        while (await websocket.receive())['type'] != 'websocket.disconnect':
+            pass
+    finally:
+        suscripcion.cerrar()
+
 @ruteador_ordenes.post(
     path='/',
     summary='Ordena algo',
@@ -20,7 +285,7 @@ ruteador_ordenes = APIRouter(
     response_model=OrdenBase,
     response_model_exclude={'id_usuario'}
     )
-def ordenar(orden: OrdenBase, Authorize: AuthJWT =  Depends()):
+async def ordenar(orden: OrdenBase, usuario: Principal = Depends(usuario_actual), sesion = Depends(obtener_sesion)):
     """
     # Ordenar
     
@@ -30,6 +295,7 @@ def ordenar(orden: OrdenBase, Authorize: AuthJWT =  Depends()):
     - **cantidad**: número de piezas que quieres
     - **guisados**: guisados que puedes elegir; opciones -> [TINGA, CARNE, POLLO, CHAMPIÑONES, COMBINADO]
     - **tipo**: tipo de comida que puedes elegir; opciones -> [QUESADILLA, HUARACHE, SOPE]
+    - **Idempotency-Key**: opcional ```Header: str```; si repites la petición con la misma clave recibes la orden ya creada (con ```Idempotent-Replayed: true```) en lugar de otra nueva
 
     Retorna un JSON con la orden que acabas de pedir:
     - **id**: ID de la orden
@@ -38,75 +304,265 @@ def ordenar(orden: OrdenBase, Authorize: AuthJWT =  Depends()):
     - **guisados**: guisados que puedes elegir; opciones -> [TINGA, CARNE, POLLO, CHAMPIÑONES, COMBINADO]
     - **tipo**: tipo de comida que puedes elegir; opciones -> [QUESADILLA, HUARACHE, SOPE]
     """
-    try:
-        Authorize.jwt_required()
-        
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail='Token Invalido'
-        )
-    
-    usuario_actual = Authorize.get_jwt_subject()
-    usuario = session.query(Usuario).filter(Usuario.username == usuario_actual).first()
-    
     nueva_orden = Orden(
         cantidad = orden.cantidad,
         guisados = orden.guisados,
-        tipo = orden.tipo
+        tipo = orden.tipo,
+        id_usuario = usuario.id
+    )
+    
+    sesion.add(nueva_orden)
+    await sesion.commit()
+    
+    return OrdenBase(cantidad=orden.cantidad, guisados=orden.guisados, tipo=orden.tipo, estado=nueva_orden.estado, id=nueva_orden.id)
+
+@ruteador_ordenes.post(
+    path='/lote',
+    summary='Ordena varias cosas a la vez',
+    status_code=status.HTTP_201_CREATED,
+    response_model=OrdenLoteOut
+    )
+async def ordenar_lote(lote: OrdenLote = Body(...), usuario: Principal = Depends(usuario_actual), sesion = Depends(obtener_sesion)):
+    """
+    # Ordenar lote
+    
+    ## Crea varias órdenes en una sola transacción, requiere de un token de acceso
+    
+    Parámetros
+    - **ordenes**: lista de órdenes con **cantidad**, **guisados** y **tipo** (igual que en ```POST /ordenes/```)
+    
+    Retorna un JSON con:
+    - **total**: número de órdenes creadas
+    - **ids**: IDs de las órdenes, en el mismo orden en que se enviaron
+    """
+    result = await sesion.execute(
+        insert(Orden)
+        .values([
+            {
+                'cantidad': orden.cantidad,
+                'estado': Estado.PROCESANDO,
+                'guisados': orden.guisados,
+                'tipo': orden.tipo,
+                'id_usuario': usuario.id
+            }
+            for orden in lote.ordenes
+        ])
+        .returning(Orden.id)
     )
+    ids = result.scalars().all()
+    
+    await sesion.commit()
+    
+    return OrdenLoteOut(total=len(ids), ids=ids)
+
+@ruteador_ordenes.post(
+    path='/cola/reclamar',
+    summary='Reclama las siguientes órdenes por preparar',
+    status_code=status.HTTP_200_OK,
+    response_model=List[OrdenBase],
+    tags=['Solo Administración']
+    )
+async def reclamar_ordenes(
+    cantidad: int = Query(default=1, ge=1, le=configuracion.cola_reclamo_maximo, description='Órdenes a reclamar'),
+    usuario: Principal = Depends(admin_actual),
+    sesion = Depends(obtener_sesion)
+    ):
+    """
+    # Reclamar órdenes
+    
+    ## Toma de la cola las siguientes órdenes en PROCESANDO para prepararlas, requiere ser administrador
+    
+    Varias estaciones pueden reclamar al mismo tiempo: cada orden se entrega a una sola y las
+    filas que otra estación está reclamando se saltan en lugar de esperar (```FOR UPDATE SKIP LOCKED```).
+    Una orden reclamada que sigue en PROCESANDO después de ```ENTREGAS_COLA_RECLAMO_EXPIRA``` segundos
+    vuelve a estar disponible.
+    
+    Parámetros
+    - **cantidad**: número máximo de órdenes a reclamar
+    
+    Retorna la lista de órdenes reclamadas, las más antiguas primero; vacía si no hay pendientes
+    """
+    # Primero los reclamos vencidos (estaciones que se cayeron), luego las órdenes nuevas
+    reclamadas = (await sesion.execute(sentencia_reclamo(cantidad, usuario.id, vencidas=True))).all()
+    
+    if len(reclamadas) < cantidad:
+        reclamadas += (await sesion.execute(sentencia_reclamo(cantidad - len(reclamadas), usuario.id))).all()
+    
+    await sesion.commit()
+    
+    return RespuestaJSON(sorted(PROYECCION_ORDEN.dicts(reclamadas), key=lambda orden: orden['id']))
+
+@ruteador_ordenes.post(
+    path='/cola/estado',
+    summary='Cambia el estado de varias órdenes a la vez',
+    status_code=status.HTTP_200_OK,
+    response_model=TransicionOrdenesOut,
+    tags=['Solo Administración']
+    )
+async def transicion_ordenes(transicion: TransicionOrdenes = Body(...), usuario: Principal = Depends(admin_actual), sesion = Depends(obtener_sesion)):
+    """
+    # Cambiar estado
+    
+    ## Cambia el estado de varias órdenes en una sola sentencia, requiere ser administrador
+    
+    Parámetros
+    - **ids**: IDs de las órdenes
+    - **estado**: nuevo estado [PROCESANDO, EN RUTA, ENTREGADO]
+    
+    Retorna un JSON con:
+    - **actualizadas**: IDs de las órdenes que cambiaron de estado
+    - **no_encontradas**: IDs que no existen
+    
+    Es un atajo de ```PATCH /ordenes/lote``` con ```{"ids": ..., "cambios": {"estado": ...}}```.
+    Los dueños de las órdenes reciben el cambio en ```/ordenes/eventos```.
+    """
+    resultado = await actualizar_lote(
+        ActualizacionLote(ids=transicion.ids, cambios=CambiosOrden(estado=transicion.estado)),
+        usuario,
+        sesion
+    )
+    
+    return TransicionOrdenesOut(actualizadas=resultado.actualizadas, no_encontradas=resultado.no_encontradas)
+    
+@ruteador_ordenes.patch(
+    path='/lote',
+    summary='Actualiza varias órdenes a la vez',
+    status_code=status.HTTP_200_OK,
+    response_model=ActualizacionLoteOut
+    )
+async def actualizar_lote(lote: ActualizacionLote = Body(...), usuario: Principal = Depends(usuario_actual), sesion = Depends(obtener_sesion)):
+    """
+    # Actualizar lote
+    
+    ## Aplica los mismos cambios a varias órdenes en una sola sentencia, requiere de un token de acceso
     
-    nueva_orden.usuario = usuario
-    session.add(nueva_orden)
+    Como en ```PUT /ordenes/{id_orden}```, solo puedes cambiar **cantidad**, **guisados** y **tipo** de
+    tus propias órdenes; como en ```PATCH /ordenes/{id_orden}```, cambiar el **estado** requiere ser administrador.
     
-    result = session.execute(
-        select(Orden.id).where(Usuario.username == usuario.username)
+    Parámetros
+    - **ids**: IDs de las órdenes (hasta ```ENTREGAS_LOTE_MAXIMO```)
+    - **filtro**: en lugar de **ids**, todas las órdenes con ese **estado** y/o **id_usuario**
+    - **cambios**: **cantidad**, **guisados**, **tipo** y/o **estado** que se asignan a todas
+    
+    Retorna un JSON con:
+    - **actualizadas**: IDs de las órdenes actualizadas
+    - **no_encontradas**: IDs que no existen (solo con **ids**)
+    - **prohibidas**: IDs de órdenes que no te pertenecen (solo con **ids**)
+    
+    Si cambió el estado, los dueños de las órdenes lo reciben en ```/ordenes/eventos```.
+    """
+    cambios = lote.cambios.dict(exclude_none=True)
+    condiciones = condiciones_seleccion(lote)
+    
+    if 'estado' in cambios:
+        if not usuario.es_admin:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail='Solo un administrador puede cambiar el estado de las órdenes'
+            )
+        cambios.update(valores_estado(lote.cambios.estado))
+    
+    if cambios.keys() & {'cantidad', 'guisados', 'tipo'}:
+        condiciones.append(Orden.id_usuario == usuario.id)
+    
+    actualizadas = (await sesion.execute(
+        update(Orden)
+        .where(*condiciones)
+        .values(**cambios)
+        .returning(Orden.id, Orden.id_usuario)
+        .execution_options(synchronize_session=False)
+    )).all()
+    
+    ids = {orden.id for orden in actualizadas}
+    restantes = await clasificar_restantes(sesion, lote.ids, ids)
+    
+    await sesion.commit()
+    
+    await cache_ordenes.invalidar_varias([str(id_orden) for id_orden in ids])
+    if lote.cambios.estado is not None:
+        await bus.publicar_varios([
+            (orden.id_usuario, {'id': orden.id, 'estado': lote.cambios.estado.value})
+            for orden in actualizadas
+        ])
+    
+    return ActualizacionLoteOut(actualizadas=sorted(ids), **restantes)
+
+@ruteador_ordenes.delete(
+    path='/lote',
+    summary='Borra varias órdenes a la vez',
+    status_code=status.HTTP_200_OK,
+    response_model=BorradoLoteOut
     )
+async def borrar_lote(seleccion: SeleccionOrdenes = Body(...), usuario: Principal = Depends(usuario_actual), sesion = Depends(obtener_sesion)):
+    """
+    # Borrar lote
+    
+    ## Borra varias órdenes en una sola sentencia, requiere de un token de acceso
+    
+    Como en ```DELETE /ordenes/{id_orden}```, puedes borrar tus órdenes y, si eres administrador, las de cualquiera.
+    
+    Parámetros
+    - **ids**: IDs de las órdenes (hasta ```ENTREGAS_LOTE_MAXIMO```)
+    - **filtro**: en lugar de **ids**, todas las órdenes con ese **estado** y/o **id_usuario**
+    
+    Retorna un JSON con:
+    - **borradas**: IDs de las órdenes borradas
+    - **no_encontradas**: IDs que no existen (solo con **ids**)
+    - **prohibidas**: IDs de órdenes que no te pertenecen (solo con **ids**)
+    """
+    condiciones = condiciones_seleccion(seleccion)
+    if not usuario.es_admin:
+        condiciones.append(Orden.id_usuario == usuario.id)
+    
+    ids = set((await sesion.execute(
+        delete(Orden)
+        .where(*condiciones)
+        .returning(Orden.id)
+        .execution_options(synchronize_session=False)
+    )).scalars().all())
     
-    session.commit()
+    restantes = await clasificar_restantes(sesion, seleccion.ids, ids)
     
-    return OrdenBase(cantidad=orden.cantidad, guisados=orden.guisados, tipo=orden.tipo, estado=orden.estado, id=result.all()[-1][0])
+    await sesion.commit()
     
+    await cache_ordenes.invalidar_varias([str(id_orden) for id_orden in ids])
+    
+    return BorradoLoteOut(borradas=sorted(ids), **restantes)
     
 @ruteador_ordenes.get(
     path='/',
     summary='Muestra todas las órdenes',
     status_code=status.HTTP_200_OK,
+    response_model=List[OrdenBase],
     tags=['Solo Administración']
     )
-def ordenar(Authorize: AuthJWT =  Depends()):
+async def ordenar(
+    parametros: ParametrosListado = Depends(),
+    id_usuario: Optional[int] = Query(default=None, description='Filtra por ID de usuario'),
+    usuario: Principal = Depends(admin_actual),
+    sesion = Depends(obtener_sesion_lectura)
+    ):
     """
     # Órdenes
     
     ## Lista todas las órdenes, requiere de un token de acceso y que el usuario sea administrador
-    """
-    try:
-        Authorize.jwt_required()
-        
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail='Token Invalido'
-        )
-
-    usuario_actual = Authorize.get_jwt_subject()
-    usuario = session.query(Usuario).filter(Usuario.username == usuario_actual).first()
     
-    if usuario.es_admin:
-        ordenes = session.query(Orden).all()
-        return jsonable_encoder(ordenes)
+    Parámetros
+    - **despues_de**: cursor de la página anterior (header ```X-Siguiente-Cursor```)
+    - **limite**: órdenes por página
+    - **estado**, **tipo**, **guisados**, **id_usuario**: filtros opcionales
+    - **formato**: ```json``` (una página) o ```ndjson``` (transmite todas las órdenes, una por línea)
+    """
+    condiciones = [] if id_usuario is None else [Orden.id_usuario == id_usuario]
     
-    raise HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail='No eres administrador'
-    )
+    return await listar_ordenes(sesion, parametros, *condiciones)
 
 @ruteador_ordenes.delete(
     path='/{id_orden}',
     status_code=status.HTTP_200_OK,
     summary='Borrar una orden'
     )
-def borrar_orden(id_orden: int = Path(..., gt=0), Authorize: AuthJWT = Depends()):
+async def borrar_orden(id_orden: int = Path(..., gt=0), usuario: Principal = Depends(usuario_actual), sesion = Depends(obtener_sesion)):
     """
     # Borrar orden
     
@@ -115,22 +571,13 @@ def borrar_orden(id_orden: int = Path(..., gt=0), Authorize: AuthJWT = Depends()
     Parámetros
     -**id_orden**: ID de la orden = Path Parameter
     """
-    try: 
-        Authorize.jwt_required()
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail='Token inválido o token no proporcionado'
-        )
-    
-    usuario_actual = Authorize.get_jwt_subject()
-    usuario = session.query(Usuario).filter(Usuario.username == usuario_actual).first()
-    orden = session.query(Orden).filter(Orden.id == id_orden).first()
+    orden = await sesion.get(Orden, id_orden)
     
     if orden:
         if orden.id_usuario == usuario.id or usuario.es_admin:
-            session.delete(orden)
-            session.commit()
+            await sesion.delete(orden)
+            await sesion.commit()
+            await cache_ordenes.invalidar(str(id_orden))
             
             return {
                 'Mensaje': f'La orden {id_orden} fue eliminada exitosamente'
@@ -147,35 +594,40 @@ def borrar_orden(id_orden: int = Path(..., gt=0), Authorize: AuthJWT = Depends()
 @ruteador_ordenes.get(
     path='/usuario',
     status_code=status.HTTP_200_OK,
-    summary='Muestra todas las órdenes del usuario actual'
+    summary='Muestra todas las órdenes del usuario actual',
+    response_model=List[OrdenBase]
 )
-def mostrar_ordenes_usuario(Authorize: AuthJWT = Depends()):
+async def mostrar_ordenes_usuario(
+    parametros: ParametrosListado = Depends(),
+    usuario: Principal = Depends(usuario_actual),
+    sesion = Depends(obtener_sesion_lectura)
+    ):
     """
     # Mostrar órdenes
     
     ## Muestra todas las órdenes del usuario actual, requiere de un token de acceso
-    """
-    try:
-        Authorize.jwt_required()
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail='Token inválido o token no proporcionado'
-        )
-    
-    usuario_actual = Authorize.get_jwt_subject()
-    usuario = session.query(Usuario).filter(Usuario.username == usuario_actual).first()
-    ordenes = session.query(Orden).filter(Orden.id_usuario == usuario.id).all()
     
-    return jsonable_encoder(ordenes)
+    Parámetros
+    - **despues_de**: cursor de la página anterior (header ```X-Siguiente-Cursor```)
+    - **limite**: órdenes por página
+    - **estado**, **tipo**, **guisados**: filtros opcionales
+    - **formato**: ```json``` (una página) o ```ndjson``` (transmite todas las órdenes, una por línea)
+    """
+    return await listar_ordenes(sesion, parametros, Orden.id_usuario == usuario.id)
 
 @ruteador_ordenes.get(
     path='/usuarios/{id_usuario}',
     status_code=status.HTTP_200_OK,
     summary='Muestra todas las órdenes de un usuario',
+    response_model=List[OrdenBase],
     tags=['Solo Administración']
 )
-def ordenes_usuario(id_usuario: int = Path(...), Authorize: AuthJWT = Depends()):
+async def ordenes_usuario(
+    id_usuario: int = Path(...),
+    parametros: ParametrosListado = Depends(),
+    usuario: Principal = Depends(admin_actual),
+    sesion = Depends(obtener_sesion_lectura)
+    ):
     """
     # Mostrar órdenes
     
@@ -183,35 +635,204 @@ def ordenes_usuario(id_usuario: int = Path(...), Authorize: AuthJWT = Depends())
     
     Parámetros
     - **id_usuario**: ID del usuario = Path Parameter
+    - **despues_de**, **limite**, **estado**, **tipo**, **guisados**, **formato**: igual que en ```/ordenes/usuario```
     """
-    try:
-        Authorize.jwt_required()
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail='Token inválido o token no proporcionado'
-        )
+    return await listar_ordenes(sesion, parametros, Orden.id_usuario == id_usuario)
+
+@ruteador_ordenes.get(
+    path='/estadisticas',
+    status_code=status.HTTP_200_OK,
+    summary='Totales de órdenes por estado, tipo y guisado',
+    response_model=EstadisticasOrdenes,
+    tags=['Solo Administración']
+)
+async def estadisticas_ordenes(
+    estado: Optional[Estado] = Query(default=None, description='Solo cuenta las órdenes en este estado, p. ej. ENTREGADO para ventas'),
+    usuario: Principal = Depends(admin_actual),
+    sesion = Depends(obtener_sesion_lectura)
+    ):
+    """
+    # Estadísticas
     
-    usuario_actual = Authorize.get_jwt_subject()
-    usuario = session.query(Usuario).filter(Usuario.username == usuario_actual).first()
+    ## Cuenta las órdenes y las piezas por estado, por tipo y por guisado, requiere ser administrador
     
-    if usuario.es_admin:
-        ordenes = session.query(Orden).filter(Orden.id_usuario == id_usuario).all()
+    Los totales se leen de ```resumen_ordenes```, que la base de datos actualiza con cada orden
+    creada, modificada o borrada, así que la consulta cuesta lo mismo con mil o con millones de órdenes.
     
-        return jsonable_encoder(ordenes)
+    Parámetros
+    - **estado**: filtro opcional
     
-    raise HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail='No eres administrador'
+    Retorna un JSON con **total**, **por_estado**, **por_tipo** y **por_guisado**; cada total trae:
+    - **ordenes**: número de órdenes
+    - **piezas**: suma de la cantidad de las órdenes
+    """
+    columnas = (ResumenOrdenes.estado, ResumenOrdenes.tipo, ResumenOrdenes.guisados)
+    consulta = (
+        select(*columnas, suma(ResumenOrdenes.ordenes), suma(ResumenOrdenes.piezas))
+        .group_by(func.grouping_sets(*columnas, tuple_()))
+    )
+    if estado is not None:
+        consulta = consulta.where(ResumenOrdenes.estado == estado)
+    
+    def ceros(clase):
+        return {miembro.value: {'ordenes': 0, 'piezas': 0} for miembro in clase}
+    
+    estadisticas = {
+        'total': {'ordenes': 0, 'piezas': 0},
+        'por_estado': ceros(Estado),
+        'por_tipo': ceros(Tipo),
+        'por_guisado': ceros(Guisado)
+    }
+    
+    # Las columnas del resumen no son nulas: la que no es NULL dice a qué agrupación pertenece la fila
+    for estado_fila, tipo, guisados, ordenes, piezas in (await sesion.execute(consulta)).all():
+        totales = {'ordenes': ordenes, 'piezas': piezas}
+        if estado_fila is not None:
+            estadisticas['por_estado'][estado_fila.value] = totales
+        elif tipo is not None:
+            estadisticas['por_tipo'][tipo.value] = totales
+        elif guisados is not None:
+            estadisticas['por_guisado'][guisados.value] = totales
+        else:
+            estadisticas['total'] = totales
+    
+    return RespuestaJSON(estadisticas)
+
+@ruteador_ordenes.get(
+    path='/estadisticas/usuarios',
+    status_code=status.HTTP_200_OK,
+    summary='Totales de órdenes por usuario',
+    response_model=List[EstadisticasUsuario],
+    tags=['Solo Administración']
+)
+async def estadisticas_usuarios(
+    despues_de: Optional[int] = Query(
+        default=None,
+        ge=0,
+        description='Cursor: regresa los usuarios con ID mayor a este (header X-Siguiente-Cursor de la página anterior)'
+    ),
+    limite: int = Query(
+        default=configuracion.listado_limite,
+        ge=1,
+        le=configuracion.listado_limite_maximo,
+        description='Usuarios por página'
+    ),
+    usuario: Principal = Depends(admin_actual),
+    sesion = Depends(obtener_sesion_lectura)
+    ):
+    """
+    # Estadísticas por usuario
+    
+    ## Cuenta las órdenes y las piezas de cada usuario, requiere ser administrador
+    
+    Se leen de ```resumen_ordenes_usuario```, paginadas por ID de usuario; los usuarios sin órdenes no aparecen.
+    
+    Parámetros
+    - **despues_de**: cursor de la página anterior (header ```X-Siguiente-Cursor```)
+    - **limite**: usuarios por página
+    
+    Retorna una lista con:
+    - **id_usuario**: ID del usuario
+    - **ordenes**: número de órdenes
+    - **piezas**: suma de la cantidad de las órdenes
+    - **por_estado**: número de órdenes en cada estado
+    """
+    resumen = ResumenOrdenesUsuario
+    consulta = (
+        select(
+            resumen.id_usuario,
+            suma(resumen.ordenes),
+            suma(resumen.piezas),
+            *(
+                cast(func.coalesce(func.sum(resumen.ordenes).filter(resumen.estado == miembro), 0), BigInteger)
+                for miembro in Estado
+            )
+        )
+        .group_by(resumen.id_usuario)
+        .having(func.sum(resumen.ordenes) > 0)
+        .order_by(resumen.id_usuario)
+        .limit(limite)
+    )
+    if despues_de is not None:
+        consulta = consulta.where(resumen.id_usuario > despues_de)
+    
+    estados = [miembro.value for miembro in Estado]
+    usuarios = [
+        {
+            'id_usuario': id_usuario,
+            'ordenes': ordenes,
+            'piezas': piezas,
+            'por_estado': dict(zip(estados, por_estado))
+        }
+        for id_usuario, ordenes, piezas, *por_estado in (await sesion.execute(consulta)).all()
+    ]
+    
+    headers = {}
+    if len(usuarios) == limite:
+        headers['X-Siguiente-Cursor'] = str(usuarios[-1]['id_usuario'])
+    
+    return RespuestaJSON(usuarios, headers=headers)
+
+@ruteador_ordenes.get(
+    path='/eventos',
+    status_code=status.HTTP_200_OK,
+    summary='Recibe los cambios de estado de tus órdenes',
+    response_class=StreamingResponse
+)
+async def eventos_ordenes(usuario: Principal = Depends(usuario_actual), sesion = Depends(obtener_sesion)):
+    """
+    # Eventos
+    
+    ## Transmite como Server-Sent Events los cambios de estado de las órdenes del usuario actual, requiere de un token de acceso
+    
+    Cada evento ```estado``` trae un JSON con:
+    - **id**: ID de la orden
+    - **estado**: nuevo estado de la orden; -> puede ser [PROCESANDO, EN RUTA, ENTREGADO]
+    
+    Si no hay cambios se manda un comentario cada ```ENTREGAS_EVENTOS_KEEPALIVE``` segundos.
+    Los mismos eventos están disponibles por WebSocket en ```/ordenes/eventos/ws?token=<JWT>```.
+    """
+    # La sesión solo hacía falta para autenticar; no debe apartar una conexión mientras dure el stream
+    await sesion.close()
+
+    return StreamingResponse(
+        flujo_eventos(usuario.id),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
     )
 
+@ruteador_ordenes.websocket('/eventos/ws')
+async def eventos_ordenes_ws(
+    websocket: WebSocket,
+    usuario: Optional[Principal] = Depends(usuario_websocket),
+    sesion = Depends(obtener_sesion)
+    ):
+    await sesion.close()
+
+    if usuario is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+
+    with bus.suscribir(usuario.id) as suscripcion:
+        cierre = asyncio.ensure_future(esperar_cierre(websocket, suscripcion))
+        try:
+            while True:
+                evento = await suscripcion.siguiente()
+                if evento is None:
+                    break
+                await websocket.send_json(evento)
+        finally:
+            cierre.cancel()
+
 @ruteador_ordenes.get(
     path='/{id_orden}',
     status_code=status.HTTP_200_OK,
     summary='Muestra una orden en específico',
     tags=['Solo Administración']
 )
-def mostar_orden(id_orden: int = Path(...), Authorization: AuthJWT = Depends()):
+async def mostar_orden(request: Request, id_orden: int = Path(...), usuario: Principal = Depends(admin_actual), sesion = Depends(obtener_sesion_lectura)):
     """
     # Órdenes
     
@@ -219,34 +840,25 @@ def mostar_orden(id_orden: int = Path(...), Authorization: AuthJWT = Depends()):
     
     Parámetros
     - **id_orden**: ID de la orden a buscar = Path Parameter
+    
+    La respuesta trae un ```ETag```; si se manda en ```If-None-Match``` y la orden no ha cambiado regresa 304.
     """
-    try:
-        Authorization.jwt_required()
-    except Exception as e:
+    orden = await orden_serializada(id_orden, sesion)
+    
+    if orden is None:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail='Token inválido o token no proporcionado'
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f'La orden con ID {id_orden} no existe'
         )
     
-    usuario_actual = Authorization.get_jwt_subject()
-    usuario = session.query(Usuario).filter(Usuario.username == usuario_actual).first()
-    
-    if usuario.es_admin:
-        orden = session.query(Orden).filter(Orden.id == id_orden).first()
-        
-        return jsonable_encoder(orden)
-
-    raise HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail='No eres administrador'
-    )
+    return orden.responder(request)
 
 @ruteador_ordenes.get(
     path='/usuario/{id_orden}',
     status_code=status.HTTP_200_OK,
     summary='Muestra una orden del usuario'
 )
-def mostrar_orden_usuario(id_orden: int = Path(...), Authorization: AuthJWT = Depends()):
+async def mostrar_orden_usuario(request: Request, id_orden: int = Path(...), usuario: Principal = Depends(usuario_actual), sesion = Depends(obtener_sesion_lectura)):
     """
     # Mostrar orden
     
@@ -254,22 +866,14 @@ def mostrar_orden_usuario(id_orden: int = Path(...), Authorization: AuthJWT = De
     
     Parámetros
     - **id_orden**: ID de la orden ```Path Parameter: int```
-    """
-    try:
-        Authorization.jwt_required()
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail='Token inválido o token no proporcionado'
-        )
     
-    usuario_actual = Authorization.get_jwt_subject()
-    usuario = session.query(Usuario).filter(Usuario.username == usuario_actual).first()
-    orden = session.query(Orden).filter(Orden.id == id_orden)
+    La respuesta trae un ```ETag```; si se manda en ```If-None-Match``` y la orden no ha cambiado regresa 304.
+    """
+    orden = await orden_serializada(id_orden, sesion)
     
     if orden:
         if orden.id_usuario == usuario.id:
-            return jsonable_encoder(orden)
+            return orden.responder(request)
         
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -287,7 +891,7 @@ def mostrar_orden_usuario(id_orden: int = Path(...), Authorization: AuthJWT = De
     response_model=OrdenBase,
     summary='Actualiza una orden'
 )
-def actualizar_orden(id_orden: int = Path(...), orden: OrdenBase = Body(...), Authorization: AuthJWT = Depends()):
+async def actualizar_orden(id_orden: int = Path(...), orden: OrdenBase = Body(...), usuario: Principal = Depends(usuario_actual), sesion = Depends(obtener_sesion)):
     """
     # Actualizar Orden
     
@@ -296,31 +900,29 @@ def actualizar_orden(id_orden: int = Path(...), orden: OrdenBase = Body(...), Au
     Parámetros
     - **id_orden**: ID de la orden ```Path Parameter: int```
     - **orden**: Orden con los datos para actualizar
+    - **Idempotency-Key**: opcional ```Header: str```; si repites la petición con la misma clave recibes la misma respuesta sin volver a aplicarla
     """
-    try:
-        Authorization.jwt_required()
-    except Exception as e:
+    orden_actualizada = await sesion.get(Orden, id_orden)
+
+    if orden_actualizada is None:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail='Token inválido o token no proporcionado'
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f'La orden con ID {id_orden} no existe'
         )
-        
-    usuario_actual = Authorization.get_jwt_subject()
-    usuario = session.query(Usuario).filter(Usuario.username == usuario_actual).first()
-    orden_actualizada = session.query(Orden).filter(Orden.id == id_orden)    
-    
+
     if orden_actualizada.id_usuario == usuario.id:        
         orden_actualizada.cantidad = orden.cantidad
         orden_actualizada.guisados = orden.guisados
         orden_actualizada.tipo = orden.tipo
         
-        session.commit()
+        await sesion.commit()
+        await cache_ordenes.invalidar(str(id_orden))
         return jsonable_encoder(OrdenBase(
             id=orden_actualizada.id,
             cantidad=orden_actualizada.cantidad,
-            guisados=str(orden_actualizada.guisados.code),
-            estado=str(orden_actualizada.estado.code),
-            tipo=str(orden_actualizada.tipo.code),
+            guisados=orden_actualizada.guisados,
+            estado=orden_actualizada.estado,
+            tipo=orden_actualizada.tipo,
             id_usuario=orden_actualizada.id_usuario
         ))
 
@@ -337,7 +939,7 @@ def actualizar_orden(id_orden: int = Path(...), orden: OrdenBase = Body(...), Au
     summary='Actualiza el estado de una orden',
     tags=['Solo Administración']
 )
-def actualizar_estado_orden(estado_orden: EstadoOrden = Body(...), id_orden: int = Path(...), Authorize: AuthJWT = Depends()):
+async def actualizar_estado_orden(estado_orden: EstadoOrden = Body(...), id_orden: int = Path(...), usuario: Principal = Depends(admin_actual), sesion = Depends(obtener_sesion)):
     """
     # Actualiza orden
     
@@ -347,33 +949,32 @@ def actualizar_estado_orden(estado_orden: EstadoOrden = Body(...), id_orden: int
     - **estado_orden**: Estado de la orden para actualizar [PROCESANDO, EN RUTA, ENTREGADO]
     - **id_orden**: ID de la orden ```Path Parameter: int```
     """
-    try:
-        Authorize.jwt_required()
-    except Exception as e:
+
+    orden_actualizada = await sesion.get(Orden, id_orden)
+
+    if orden_actualizada is None:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail='Token inválido o token no proporcionado'
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f'La orden con ID {id_orden} no existe'
         )
 
-    usuario_actual = Authorize.get_jwt_subject()
-    usuario = session.query(Usuario).filter(Usuario.username == usuario_actual).first()
+    for campo, valor in valores_estado(estado_orden.estado).items():
+        setattr(orden_actualizada, campo, valor)
 
-    if usuario.es_admin:
-        orden_actualizada = session.query(Orden).filter(Orden.id == id_orden).first()
-        orden_actualizada.estado = estado_orden.estado
+    await sesion.commit()
+    await cache_ordenes.invalidar(str(id_orden))
 
-        session.commit()
-        return jsonable_encoder(OrdenBase(
-            id=orden_actualizada.id,
-            cantidad=orden_actualizada.cantidad,
-            guisados=str(orden_actualizada.guisados.code),
-            estado=str(orden_actualizada.estado.code),
-            tipo=str(orden_actualizada.tipo.code),
-            id_usuario=orden_actualizada.id_usuario
-        ))
-    
-    raise HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail='No eres administrador'
-    )    
+    await bus.publicar(orden_actualizada.id_usuario, {
+        'id': orden_actualizada.id,
+        'estado': orden_actualizada.estado.value
+    })
+
+    return jsonable_encoder(OrdenBase(
+        id=orden_actualizada.id,
+        cantidad=orden_actualizada.cantidad,
+        guisados=orden_actualizada.guisados,
+        estado=orden_actualizada.estado,
+        tipo=orden_actualizada.tipo,
+        id_usuario=orden_actualizada.id_usuario
+    ))    
       
\ No newline at end of file
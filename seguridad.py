@@ -0,0 +1,46 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple
+import bcrypt
+from config import obtener_configuracion
+
+configuracion = obtener_configuracion()
+
+# bcrypt suelta el GIL mientras calcula, así que un pool de hilos propio basta para
+# que un pico de accesos no ocupe el threadpool ni el event loop de las demás rutas
+_pool = ThreadPoolExecutor(
+    max_workers=configuracion.hash_trabajadores,
+    thread_name_prefix='hash'
+)
+
+
+def _generar(password: str) -> str:
+    salt = bcrypt.gensalt(rounds=configuracion.hash_costo)
+    return bcrypt.hashpw(password.encode('utf-8'), salt).decode('ascii')
+
+def _verificar(hash_guardado: str, password: str) -> Tuple[bool, bool]:
+    if hash_guardado.startswith('$2'):
+        valida = bcrypt.checkpw(password.encode('utf-8'), hash_guardado.encode('ascii'))
+        costo = int(hash_guardado.split('$')[2])
+        return valida, costo < configuracion.hash_costo
+
+    # Hashes de werkzeug (pbkdf2) creados antes de usar bcrypt
+    from werkzeug.security import check_password_hash
+
+    return check_password_hash(hash_guardado, password), True
+
+
+async def generar_hash(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_pool, _generar, password)
+
+async def verificar_password(hash_guardado: str, password: str) -> Tuple[bool, bool]:
+    """
+    Regresa si la contraseña es válida y si el hash guardado debe rehacerse
+    porque es de un esquema anterior o de un costo menor al configurado.
+    """
+    if not hash_guardado:
+        return False, False
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_pool, _verificar, hash_guardado, password)
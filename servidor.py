@@ -0,0 +1,124 @@
+"""
+Arranque de la API con varios procesos.
+
+``python -m servidor`` levanta gunicorn con ``ENTREGAS_SERVIDOR_WORKERS`` workers de
+uvicorn (uno por defecto). Los workers usan uvloop y httptools si están instalados y,
+si no, el event loop de asyncio y h11.
+
+Los backends ``memoria`` de eventos, idempotencia, cache de órdenes y límites guardan su
+estado en cada proceso; con varios workers cada uno ve solo el suyo, así que al arrancar
+se avisa de cada uno que siga en ``memoria``.
+
+Con ``ENTREGAS_SERVIDOR_PRECARGAR`` (activo por defecto) la app se importa una sola vez
+en el proceso principal y los workers la heredan al hacer fork: arrancan más rápido y
+comparten en memoria el código ya cargado. Las conexiones que el proceso principal
+hubiera abierto no se heredan; ``database.db.descartar_conexiones`` corre después de
+cada fork y cada worker abre las suyas.
+
+Sin gunicorn (p. ej. en Windows) se usa ``uvicorn --workers``, que no precarga la app.
+"""
+import importlib.util
+import logging
+from config import obtener_configuracion
+
+log = logging.getLogger(__name__)
+
+APP = 'main:app'
+
+# Backends que guardan estado en cada proceso con su opción compartida entre workers
+BACKENDS_COMPARTIDOS = {
+    'eventos_backend': 'postgres',
+    'idempotencia_backend': 'postgres',
+    'cache_ordenes_backend': 'redis',
+    'limites_backend': 'redis'
+}
+
+
+def disponible(modulo: str) -> bool:
+    return importlib.util.find_spec(modulo) is not None
+
+
+def backends_por_proceso(configuracion) -> list:
+    """Opciones de ``BACKENDS_COMPARTIDOS`` que siguen en ``memoria``"""
+    backends = [opcion for opcion in BACKENDS_COMPARTIDOS if getattr(configuracion, opcion) == 'memoria']
+    if not configuracion.limites and 'limites_backend' in backends:
+        backends.remove('limites_backend')
+    return backends
+
+
+def opciones_gunicorn(configuracion) -> dict:
+    return {
+        'bind': f'{configuracion.servidor_host}:{configuracion.servidor_puerto}',
+        'workers': configuracion.servidor_workers,
+        # Elige uvloop y httptools si están instalados
+        'worker_class': 'uvicorn.workers.UvicornWorker',
+        'preload_app': configuracion.servidor_precargar,
+        'keepalive': configuracion.servidor_keepalive,
+        'backlog': configuracion.servidor_backlog,
+        'timeout': configuracion.servidor_timeout,
+        'graceful_timeout': configuracion.servidor_timeout,
+        'max_requests': configuracion.servidor_max_peticiones,
+        # Para que los workers no se reciclen todos a la vez
+        'max_requests_jitter': configuracion.servidor_max_peticiones // 10
+    }
+
+
+def servir_gunicorn(configuracion) -> None:
+    from gunicorn.app.base import BaseApplication
+
+    class Aplicacion(BaseApplication):
+        def load_config(self):
+            for clave, valor in opciones_gunicorn(configuracion).items():
+                self.cfg.set(clave, valor)
+
+        def load(self):
+            from main import app
+
+            return app
+
+    Aplicacion().run()
+
+
+def servir_uvicorn(configuracion) -> None:
+    import uvicorn
+
+    uvicorn.run(
+        APP,
+        host=configuracion.servidor_host,
+        port=configuracion.servidor_puerto,
+        workers=configuracion.servidor_workers,
+        timeout_keep_alive=configuracion.servidor_keepalive,
+        backlog=configuracion.servidor_backlog,
+        limit_max_requests=configuracion.servidor_max_peticiones or None
+    )
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    configuracion = obtener_configuracion()
+
+    log.info(
+        '%d workers, loop %s, http %s',
+        configuracion.servidor_workers,
+        'uvloop' if disponible('uvloop') else 'asyncio',
+        'httptools' if disponible('httptools') else 'h11'
+    )
+
+    if configuracion.servidor_workers > 1:
+        for opcion in backends_por_proceso(configuracion):
+            log.warning(
+                'ENTREGAS_%s=memoria con %d workers: cada worker tiene su propio estado; usa %s para compartirlo',
+                opcion.upper(),
+                configuracion.servidor_workers,
+                BACKENDS_COMPARTIDOS[opcion]
+            )
+
+    if disponible('gunicorn'):
+        servir_gunicorn(configuracion)
+    else:
+        log.warning('gunicorn no está instalado; se usa uvicorn --workers sin precargar la app')
+        servir_uvicorn(configuracion)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""
+Firma y verificación de los JWT de la API.
+
+``AuthJWT`` decodifica y verifica la firma en cada llamada (``jwt_required`` y otra vez
+``get_raw_jwt``). Aquí cada token se verifica una sola vez por petición y sus claims se
+recuerdan, por hash del token, hasta que expira: los clientes repiten el mismo access
+token en muchas peticiones. Los tokens inválidos nunca se guardan.
+
+Con algoritmos asimétricos (RS*, ES*, PS*) los workers solo necesitan la clave pública
+para verificar; la privada se queda en los que firman en ``/auth``.
+"""
+import hashlib
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+import jwt
+from cache import CacheTTL
+
+
+class TokenInvalido(Exception):
+    pass
+
+
+def es_simetrico(algoritmo: str) -> bool:
+    return algoritmo.startswith('HS')
+
+
+def leer_clave(ruta: Optional[str]) -> Optional[str]:
+    return Path(ruta).read_text() if ruta else None
+
+
+def token_bearer(encabezado: Optional[str]) -> str:
+    """Extrae el token de un header ``Authorization: Bearer <token>``"""
+    tipo, _, token = (encabezado or '').partition(' ')
+    if tipo != 'Bearer' or not token:
+        raise TokenInvalido('Falta el header Authorization: Bearer <token>')
+    return token
+
+
+class VerificadorTokens:
+    """
+    Valida firma, expiración y tipo de un token. Los claims validados se guardan en un
+    cache acotado a ``maximo`` tokens, cada uno hasta su ``exp`` y nunca más de ``ttl``
+    segundos. Los dicts regresados se comparten entre peticiones y no se deben modificar.
+    """
+
+    def __init__(self, algoritmo: str, clave: str, maximo: int, ttl: float, margen: int = 0):
+        self.algoritmo = algoritmo
+        self.clave = clave
+        self.margen = margen
+        self._claims = CacheTTL(maximo=maximo, ttl=ttl)
+
+    def decodificar(self, token: str) -> dict:
+        try:
+            return jwt.decode(token, self.clave, algorithms=[self.algoritmo], leeway=self.margen)
+        except jwt.InvalidTokenError as e:
+            raise TokenInvalido(str(e)) from e
+
+    def verificar(self, token: str, tipo: str = 'access') -> dict:
+        llave = hashlib.blake2b(token.encode(), digest_size=16).digest()
+        claims = self._claims.obtener(llave)
+
+        if claims is None:
+            claims = self.decodificar(token)
+            restante = claims.get('exp', 0) + self.margen - time.time()
+            if restante > 0:
+                self._claims.guardar(llave, claims, ttl=min(restante, self._claims.ttl))
+        elif claims['exp'] + self.margen <= time.time():
+            # El cache caduca con el reloj monotónico; exp es hora de pared
+            raise TokenInvalido('Signature has expired')
+
+        if claims.get('type') != tipo:
+            raise TokenInvalido(f'Se esperaba un {tipo} token')
+
+        return claims
+
+    def __len__(self):
+        return len(self._claims)
+
+
+class FirmadorTokens:
+    """
+    Emite access y refresh tokens con los mismos claims que emitía ``AuthJWT``
+    (``sub``, ``iat``, ``nbf``, ``jti``, ``exp``, ``type`` y ``fresh`` en los access),
+    así que los tokens anteriores siguen siendo válidos.
+    """
+
+    def __init__(self, algoritmo: str, clave: str, expiracion_access: int, expiracion_refresh: int):
+        self.algoritmo = algoritmo
+        self.clave = clave
+        self.expiraciones = {'access': expiracion_access, 'refresh': expiracion_refresh}
+
+    def firmar(self, sub: str, tipo: str, claims: dict) -> str:
+        ahora = int(time.time())
+        datos = {
+            'sub': sub,
+            'iat': ahora,
+            'nbf': ahora,
+            'jti': str(uuid.uuid4()),
+            'exp': ahora + self.expiraciones[tipo],
+            'type': tipo
+        }
+        if tipo == 'access':
+            datos['fresh'] = False
+
+        token = jwt.encode({**datos, **claims}, self.clave, algorithm=self.algoritmo)
+        # PyJWT 1.x regresa bytes
+        return token.decode() if isinstance(token, bytes) else token
+
+    def crear_tokens(self, sub: str, claims: dict) -> dict:
+        return {
+            'access': self.firmar(sub, 'access', claims),
+            'refresh': self.firmar(sub, 'refresh', claims)
+        }
+
+
+def clave_configurada(configuracion, archivo: Optional[str], variable: str) -> str:
+    """Clave para firmar o verificar con ``jwt_algoritmo``: ``JWT_KEY`` o el PEM en ``archivo``"""
+    algoritmo = configuracion.jwt_algoritmo
+
+    if es_simetrico(algoritmo):
+        if configuracion.jwt_clave is None:
+            raise RuntimeError(f'{algoritmo} necesita la variable de entorno JWT_KEY')
+        return configuracion.jwt_clave.get_secret_value()
+
+    try:
+        import cryptography
+    except ImportError as e:
+        raise RuntimeError(f'{algoritmo} necesita el paquete cryptography (pip install cryptography)') from e
+
+    clave = leer_clave(archivo)
+    if not clave:
+        raise RuntimeError(f'{algoritmo} necesita {variable}')
+    return clave
+
+
+def crear_firmador(configuracion) -> FirmadorTokens:
+    return FirmadorTokens(
+        configuracion.jwt_algoritmo,
+        clave_configurada(configuracion, configuracion.jwt_clave_privada, 'ENTREGAS_JWT_CLAVE_PRIVADA'),
+        expiracion_access=configuracion.jwt_expiracion_access,
+        expiracion_refresh=configuracion.jwt_expiracion_refresh
+    )
+
+
+def crear_verificador(configuracion) -> VerificadorTokens:
+    algoritmo = configuracion.jwt_algoritmo
+    clave = clave_configurada(configuracion, configuracion.jwt_clave_publica, 'ENTREGAS_JWT_CLAVE_PUBLICA')
+
+    # Los refresh tokens viven más que el cache; se vuelven a verificar cada jwt_expiracion_access
+    return VerificadorTokens(
+        algoritmo,
+        clave,
+        maximo=configuracion.jwt_cache_maximo,
+        ttl=configuracion.jwt_expiracion_access
+    )